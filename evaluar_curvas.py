@@ -0,0 +1,420 @@
+#!/usr/bin/python3
+
+"""
+Evaluación fuera de línea de curvas candidatas sobre una traza de
+temperaturas grabada (el histórico de telemetría de temp.py o un volcado de
+texto de telemetria.py).
+Todas las candidatas se evalúan a la vez con NumPy, reproduciendo la lógica
+de Manager.bucle en el modo 'tramos': buscar_objetivo, retener_bajada,
+siguiente_velocidad, la retención por encima de t_fin y el cebado. La traza
+se reproduce tal cual, es decir, se supone que la temperatura no depende de
+la curva, y los ventiladores se suponen ideales (alcanzan enseguida la
+velocidad pedida y el cebado nunca se agota).
+Las candidatas parten de la configuración con la que temp.py controla el
+ventilador de la traza (la de CONFIGURACION o la de las constantes) y se
+comprueban igual que ella (ver temp.normalizar_configuracion).
+"""
+
+from __future__ import annotations
+from typing import Optional
+
+import argparse
+import csv
+import json
+import random
+import sys
+
+import numpy as np
+
+import temp
+from temp import Curva
+from telemetria import LectorTelemetria, fecha
+
+
+def configuracion_base(g_num: int, f_num: int) -> dict:
+    """
+    Devuelve la configuración con la que temp.py controlaría el ventilador
+    indicado (la de CONFIGURACION o, si no hay, la de GPUS_FANS y las
+    constantes), como un fichero de configuración con sólo esa GPU y ese
+    ventilador y todos sus parámetros, sobre la que se crean las candidatas.
+    Lanza ValueError si el fichero no es válido o no tiene ese ventilador.
+    """
+    topologia = {g_num: [f_num]}
+    if temp.CONFIGURACION is not None:
+        configuracion = temp.Configuracion(temp.CONFIGURACION).leer(topologia)
+    else:
+        configuracion = temp.cargar_configuracion(None, topologia)
+    try:
+        gpu = configuracion[g_num]
+        fan = gpu['fans'][f_num]
+    except KeyError:
+        raise ValueError(f'la configuración no tiene el ventilador n.º {f_num} de la GPU n.º {g_num}')
+    return {'gpus': {g_num: {**gpu['params'], 'fans': {f_num: {**fan['params'], 'curva': fan['curva']}}}}}
+
+
+class Candidata:
+    """
+    Una curva candidata junto con los parámetros de su GPU y su ventilador
+    (t_min, t_fin, v_min, v_max, v_ceb, histeresis, permanencia...).
+    """
+
+    def __init__(self, nombre: str, base: dict, **cambios) -> None:
+        """
+        La candidata es la configuración base (ver configuracion_base) con
+        la curva y los parámetros indicados, siempre en el modo 'tramos',
+        que es el único que se reproduce.
+        Lanza ValueError si no es válida para temp.py (ver
+        temp.normalizar_configuracion).
+        """
+        (g_num, gpu), = base['gpus'].items()
+        (f_num, fan), = gpu['fans'].items()
+        g_cambios = {k: v for k, v in cambios.items() if k in temp.PARAMS_GPU}
+        f_cambios = {k: v for k, v in cambios.items() if k not in temp.PARAMS_GPU}
+        datos = {'gpus': {g_num: {**gpu, **g_cambios,
+                                  'fans': {f_num: {**fan, **f_cambios, 'modo': 'tramos'}}}}}
+        configuracion = temp.normalizar_configuracion(datos)[g_num]
+        self.__nombre = nombre
+        self.__gpu = configuracion['params']
+        self.__fan = configuracion['fans'][f_num]['params']
+        self.__curva = Curva(configuracion['fans'][f_num]['curva'], self.get_v_min(), self.get_v_max())
+
+
+    def get_nombre(self) -> str:
+        """Devuelve el nombre de la candidata."""
+        return self.__nombre
+
+
+    def get_curva(self) -> Curva:
+        """Devuelve la curva de la candidata."""
+        return self.__curva
+
+
+    def get_t_min(self) -> int:
+        """Devuelve la temperatura por debajo de la cual se apaga el ventilador."""
+        return self.__gpu['t_min']
+
+
+    def get_t_max(self) -> int:
+        """Devuelve la temperatura a partir de la cual el ventilador va a v_max."""
+        return self.__gpu['t_max']
+
+
+    def get_t_fin(self) -> int:
+        """Devuelve la temperatura por encima de la cual no se apaga el ventilador."""
+        return self.__gpu['t_fin']
+
+
+    def get_v_min(self) -> int:
+        """Devuelve la velocidad del ventilador apagado."""
+        return self.__fan['v_min']
+
+
+    def get_v_max(self) -> int:
+        """Devuelve la velocidad máxima del ventilador."""
+        return self.__fan['v_max']
+
+
+    def get_v_ini(self) -> int:
+        """Devuelve la velocidad a la que arranca el ventilador al cebarlo."""
+        return self.__fan['v_ini']
+
+
+    def get_t_ini(self) -> float:
+        """Devuelve los segundos que el ventilador pasa a v_ini al cebarlo."""
+        return self.__fan['t_ini']
+
+
+    def get_v_ceb(self) -> int:
+        """Devuelve la velocidad de cebado."""
+        return self.__fan['v_ceb']
+
+
+    def get_histeresis(self) -> int:
+        """Devuelve los grados que tiene que bajar la temperatura para bajar de tramo."""
+        return self.__fan['histeresis']
+
+
+    def get_permanencia(self) -> float:
+        """Devuelve los segundos mínimos entre un cambio de velocidad y una bajada."""
+        return self.__fan['permanencia']
+
+
+    def __str__(self) -> str:
+        curva = dict(self.__curva.items())
+        return (f'{curva} - t_fin: {self.get_t_fin()} ºC - v_ceb: {self.get_v_ceb()} % - '
+                f'histéresis: {self.get_histeresis()} ºC - permanencia: {self.get_permanencia():g} s')
+
+
+def leer_candidatas(ruta: str, base: dict) -> list[Candidata]:
+    """
+    Lee las candidatas de un fichero JSON con una lista de objetos con el
+    campo "curva" ({"temperatura": velocidad}) y, opcionalmente, "nombre" y
+    cualquier parámetro de las GPUs o los ventiladores de temp.py ("t_fin",
+    "v_ceb", "histeresis", "permanencia"...); los que falten se toman de la
+    configuración base (ver configuracion_base). Las candidatas no válidas
+    se descartan avisando.
+    """
+    with open(ruta, encoding='utf-8') as fichero:
+        datos = json.load(fichero)
+    candidatas = []
+    for i, dato in enumerate(datos):
+        nombre = dato.get('nombre', f'{ruta}#{i}')
+        try:
+            cambios = {k: v for k, v in dato.items() if k != 'nombre'}
+            if 'curva' not in cambios:
+                raise ValueError('falta la curva')
+            candidatas.append(Candidata(nombre, base, **cambios))
+        except ValueError as e:
+            print(f'Candidata {nombre} descartada: {e}', file=sys.stderr)
+    return candidatas
+
+
+def generar_candidatas(n: int, semilla: int, base: dict) -> list[Candidata]:
+    """
+    Genera n candidatas aleatorias alrededor de la configuración base (ver
+    configuracion_base), moviendo cada tramo de la curva unos pocos grados
+    y puntos de velocidad, y t_fin, v_ceb, la histéresis y la permanencia.
+    """
+    rnd = random.Random(semilla)
+    actual = Candidata('actual', base)
+    curva = dict(actual.get_curva().items())
+    candidatas = []
+    while len(candidatas) < n:
+        temps = sorted({min(max(t + rnd.randint(-3, 3), actual.get_t_min() + 1), actual.get_t_max())
+                        for t in curva})
+        veloces = sorted(min(max(v + rnd.randint(-8, 8), actual.get_v_min()), actual.get_v_max())
+                         for v in list(curva.values())[:len(temps)])
+        try:
+            candidatas.append(Candidata(f'aleatoria-{len(candidatas)}', base,
+                                        curva=dict(zip(temps, veloces)),
+                                        t_fin=actual.get_t_fin() + rnd.randint(-5, 5),
+                                        v_ceb=actual.get_v_ceb() + rnd.randint(-5, 5),
+                                        histeresis=max(actual.get_histeresis() + rnd.randint(-2, 2), 0),
+                                        permanencia=max(actual.get_permanencia() + rnd.uniform(-20, 20), 0.0)))
+        except ValueError:
+            pass
+    return candidatas
+
+
+def leer_traza(ruta: str, gpu: int = 0,
+               fan: Optional[int] = None) -> tuple[np.ndarray, np.ndarray, Optional[int]]:
+    """
+    Lee la traza de temperaturas de la GPU indicada y devuelve los
+    instantes (en segundos) y las temperaturas de cada iteración, y el
+    ventilador cuyos registros se han usado (None si la traza no lo indica).
+    Como en cada iteración hay un registro por ventilador, sólo se usan los
+    del ventilador indicado (por omisión, el primero de la GPU).
+    El fichero puede ser un histórico de telemetría o un volcado de texto
+    con cabecera, separado por tabuladores o comas, con una columna "temp"
+    y otra "fecha" (como el de telemetria.py) o "instante" (en segundos).
+    """
+    try:
+        datos = LectorTelemetria(ruta).arrays()
+        datos = datos[datos['gpu'] == gpu]
+        if fan is None and len(datos):
+            fan = int(datos['fan'][0])
+        datos = datos[datos['fan'] == fan]
+        return datos['instante'].astype(float), datos['temp'].astype(int), fan
+    except ValueError:
+        pass
+    instantes, temps = [], []
+    with open(ruta, encoding='utf-8', newline='') as fichero:
+        muestra = fichero.readline()
+        fichero.seek(0)
+        for fila in csv.DictReader(fichero, delimiter='\t' if '\t' in muestra else ','):
+            if 'gpu' in fila and int(fila['gpu']) != gpu:
+                continue
+            if 'fan' in fila:
+                if fan is None:
+                    fan = int(fila['fan'])
+                if int(fila['fan']) != fan:
+                    continue
+            instantes.append(float(fila['instante']) if 'instante' in fila else fecha(fila['fecha']))
+            temps.append(int(float(fila['temp'])))
+    return np.array(instantes, dtype=float), np.array(temps, dtype=int), fan
+
+
+def tablas(candidatas: list[Candidata], t_base: int, t_tope: int) -> tuple[np.ndarray, ...]:
+    """
+    Precalcula, para cada candidata (eje 0):
+    - La velocidad objetivo (buscar_objetivo) para cada temperatura del
+      rango [t_base, t_tope].
+    - La velocidad de la curva inmediatamente superior (veloc_superior) e
+      inferior (veloc_inferior) a cada velocidad de 0 a la mayor v_max.
+      Cuando no la hay se usa un valor fuera de rango, de forma que
+      siguiente_velocidad acaba en v_max o v_min como en temp.py.
+    """
+    n = np.array([len(c.get_curva()) for c in candidatas])
+    k = n.max()
+    infinito = np.iinfo(np.int32).max
+    ts = np.full((len(candidatas), k), infinito, dtype=np.int32)
+    vs = np.full((len(candidatas), k), infinito, dtype=np.int32)
+    for i, c in enumerate(candidatas):
+        ts[i, :n[i]] = c.get_curva().get_temps()
+        vs[i, :n[i]] = c.get_curva().get_veloces()
+    t_min = np.array([c.get_t_min() for c in candidatas])[:, None]
+    v_min = np.array([c.get_v_min() for c in candidatas])[:, None]
+    v_max = np.array([c.get_v_max() for c in candidatas])[:, None]
+
+    # buscar_objetivo: bisect_right sobre las temperaturas de la curva.
+    grados = np.arange(t_base, t_tope + 1)
+    pos = (ts[:, None, :] <= grados[None, :, None]).sum(axis=2)
+    objetivos = np.take_along_axis(vs, np.minimum(pos, k - 1), axis=1)
+    objetivos = np.where(pos == n[:, None], v_max, objetivos)
+    objetivos = np.where(grados[None, :] < t_min, v_min, objetivos)
+
+    # veloc_superior (bisect_right) y veloc_inferior (bisect_left):
+    veloces = np.arange(v_max.max() + 1)
+    pos = (vs[:, None, :] <= veloces[None, :, None]).sum(axis=2)
+    superiores = np.take_along_axis(vs, np.minimum(pos, k - 1), axis=1)
+    superiores = np.where(pos < n[:, None], superiores, v_max + 1)
+    pos = (vs[:, None, :] < veloces[None, :, None]).sum(axis=2)
+    inferiores = np.take_along_axis(vs, np.maximum(pos - 1, 0), axis=1)
+    inferiores = np.where(pos > 0, inferiores, v_min - 1)
+    return objetivos, superiores, inferiores
+
+
+def evaluar(instantes: np.ndarray, temps: np.ndarray, candidatas: list[Candidata],
+            umbral_alta: int) -> dict[str, np.ndarray]:
+    """
+    Reproduce la traza con todas las candidatas a la vez y devuelve, para
+    cada una, el número de cambios de velocidad, los segundos pasados a
+    umbral_alta % o más, el número de cebados y el número de bajadas
+    retenidas por la histéresis o la permanencia.
+    """
+    c = len(candidatas)
+    t_min = np.array([cand.get_t_min() for cand in candidatas])
+    v_min = np.array([cand.get_v_min() for cand in candidatas])
+    v_max = np.array([cand.get_v_max() for cand in candidatas])
+    t_base = int(min(temps.min(), t_min.min()))
+    histeresis = np.array([cand.get_histeresis() for cand in candidatas])
+    objetivos, superiores, inferiores = tablas(candidatas, t_base,
+                                               int(temps.max() + histeresis.max()))
+    # Las búsquedas por temperatura, por filas contiguas, salvo las de la
+    # histéresis, que cambian de temperatura según la candidata; ésas y las
+    # de velocidad, sobre las tablas aplanadas:
+    filas = np.arange(c) * objetivos.shape[1] + histeresis - t_base
+    planos = objetivos.ravel()
+    objetivos = np.ascontiguousarray(objetivos.T)
+    superiores, inferiores = superiores.ravel(), inferiores.ravel()
+    desplazamientos = np.arange(c) * (v_max.max() + 1)
+    t_fin = np.array([cand.get_t_fin() for cand in candidatas])
+    v_ini = np.array([cand.get_v_ini() for cand in candidatas])
+    t_ini = np.array([cand.get_t_ini() for cand in candidatas])
+    v_ceb = np.array([cand.get_v_ceb() for cand in candidatas])
+    permanencia = np.array([cand.get_permanencia() for cand in candidatas])
+    duraciones = np.append(np.diff(instantes), 0.0)
+
+    actual = v_min.copy()
+    t_cambio = np.full(c, -np.inf)
+    cebando = np.zeros(c, dtype=bool)
+    arrancando = np.zeros(c, dtype=bool)
+    t_arranque = np.zeros(c)
+    cambios = np.zeros(c, dtype=np.int64)
+    cebados = np.zeros(c, dtype=np.int64)
+    retenidas = np.zeros(c, dtype=np.int64)
+    alta = np.zeros(c)
+
+    for ahora, grados, duracion in zip(instantes, temps, duraciones):
+        # Fan.avanzar_cebado, con un ventilador que se estabiliza en v_ceb
+        # en la iteración siguiente a pedírselo:
+        ocupados = cebando.copy()
+        if ocupados.any():
+            terminan = cebando & ~arrancando
+            pasan = arrancando & (ahora - t_arranque >= t_ini)
+            llegan = pasan & (actual != v_ceb)
+            cambios += llegan
+            t_cambio = np.where(llegan, ahora, t_cambio)
+            actual = np.where(pasan, v_ceb, actual)
+            arrancando &= ~pasan
+            cebando &= ~terminan
+
+        # Manager.bucle para los que no se están cebando:
+        objetivo = objetivos[grados - t_base]
+        # Fan.retener_bajada:
+        bajan = ~ocupados & (objetivo < actual)
+        if bajan.any():
+            recientes = bajan & (ahora - t_cambio < permanencia)
+            corregido = planos.take(filas + grados)
+            bajan &= ~recientes
+            retenidas += recientes | (bajan & (corregido >= actual))
+            objetivo = np.where(recientes, actual, np.where(bajan, np.minimum(corregido, actual), objetivo))
+        sup = superiores.take(desplazamientos + actual)
+        inf = inferiores.take(desplazamientos + actual)
+        sgte = np.where(actual < objetivo,
+                        np.where(sup <= objetivo, sup, v_max),
+                        np.where(inf >= objetivo, inf, v_min))
+        sgte = np.where(objetivo == v_min, v_min, sgte)
+        sgte = np.where(actual == objetivo, actual, sgte)
+        retenidos = (actual != v_min) & (sgte == v_min) & (grados > t_fin)
+        cambian = ~ocupados & ~retenidos & (actual != sgte)
+
+        # Fan.cebador:
+        ceban = cambian & (actual < v_ceb) & (sgte > v_ceb)
+        if ceban.any():
+            arrancan = ceban & (actual < v_ini)
+            sgte = np.where(ceban, np.where(arrancan, v_ini, v_ceb), sgte)
+            cebados += ceban
+            cebando |= ceban
+            arrancando |= arrancan
+            t_arranque = np.where(ceban, ahora, t_arranque)
+        cambian &= sgte != actual
+        cambios += cambian
+        t_cambio = np.where(cambian, ahora, t_cambio)
+        actual = np.where(cambian, sgte, actual)
+
+        alta += (actual >= umbral_alta) * duracion
+
+    return {'cambios': cambios, 'alta': alta, 'cebados': cebados, 'retenidas': retenidas}
+
+
+def main() -> None:
+    """Evalúa las candidatas sobre la traza y muestra las mejores."""
+    parser = argparse.ArgumentParser(description='Evalúa curvas candidatas sobre una traza grabada.')
+    parser.add_argument('traza', help='histórico de telemetría o volcado de texto de telemetria.py')
+    parser.add_argument('--candidatas', metavar='FICHERO', help='fichero JSON con las curvas candidatas')
+    parser.add_argument('--aleatorias', type=int, default=0, metavar='N',
+                        help='añade N candidatas aleatorias alrededor de la curva actual')
+    parser.add_argument('--semilla', type=int, default=0, help='semilla de las candidatas aleatorias')
+    parser.add_argument('--gpu', type=int, default=0, help='GPU de la traza a usar')
+    parser.add_argument('--fan', type=int, help='ventilador de la traza a usar')
+    parser.add_argument('--alta', type=int, default=70, metavar='VELOC',
+                        help='velocidad (%%) a partir de la cual se considera alta (70 por omisión)')
+    parser.add_argument('--orden', default='cambios,alta,cebados',
+                        help='criterios de ordenación, de más a menos importante')
+    parser.add_argument('--mostrar', type=int, default=10, metavar='N', help='candidatas a mostrar')
+    args = parser.parse_args()
+
+    criterios = args.orden.split(',')
+    if not set(criterios) <= {'cambios', 'alta', 'cebados'}:
+        sys.exit('Error: los criterios de ordenación son cambios, alta y cebados.')
+    try:
+        instantes, temps, fan = leer_traza(args.traza, args.gpu, args.fan)
+    except (OSError, KeyError, ValueError) as e:
+        sys.exit(f'Error: no se pudo leer la traza: {e}')
+    if not len(temps):
+        sys.exit('Error: la traza está vacía.')
+    # Las candidatas parten de la configuración del ventilador de la traza:
+    f_num = args.fan if args.fan is not None else fan if fan is not None else 0
+    try:
+        base = configuracion_base(args.gpu, f_num)
+        candidatas = [Candidata('actual', base)]
+    except ValueError as e:
+        sys.exit(f'Error: la configuración de temp.py no es válida: {e}')
+    if args.candidatas is not None:
+        candidatas += leer_candidatas(args.candidatas, base)
+    candidatas += generar_candidatas(args.aleatorias, args.semilla, base)
+
+    resultados = evaluar(instantes, temps, candidatas, args.alta)
+    orden = np.lexsort([resultados[criterio] for criterio in reversed(criterios)])
+    horas = (instantes[-1] - instantes[0]) / 3600
+    print(f'{len(candidatas)} candidatas evaluadas sobre {len(temps)} lecturas ({horas:.1f} h).')
+    for puesto, i in enumerate(orden[:args.mostrar], 1):
+        print(f'{puesto}. {candidatas[i].get_nombre()}: {resultados["cambios"][i]} cambios - '
+              f'{resultados["alta"][i] / 3600:.1f} h a {args.alta} % o más - '
+              f'{resultados["cebados"][i]} cebados - {resultados["retenidas"][i]} bajadas retenidas')
+        print(f'   {candidatas[i]}')
+
+
+if __name__ == '__main__':
+    main()
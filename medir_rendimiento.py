@@ -0,0 +1,312 @@
+#!/usr/bin/python3
+
+"""
+Medición del coste del bucle de control de temp.py con 1, 4 y 16 GPUs (con
+un ventilador cada una) simuladas por un nvidia-settings falso que se pone
+en el PATH. El nvidia-settings falso sigue un guion: en cada consulta de
+temperaturas devuelve la siguiente del guion de la fase, y los ventiladores
+alcanzan al instante la velocidad que se les pide.
+Cada escenario se ejecuta en un proceso aparte, con un reloj virtual para
+que las esperas no cuenten, y se mide por fases:
+- arranque: la puesta en modo manual y a V_MIN que hace main().
+- cebado: las iteraciones del planificador mientras se ceban los
+  ventiladores (Fan.cebador).
+- bucle: las iteraciones del planificador (el bucle de main()) con la
+  temperatura subiendo y bajando entre los tramos de la curva.
+- iteracion: Manager.bucle sobre una instantánea ya leída, que no debería
+  lanzar ningún proceso salvo para escribir.
+- finalizar: el enfriamiento y la vuelta al modo automático que hace main()
+  al recibir SIGTERM (apagar).
+De cada fase se mide el tiempo real y los procesos lanzados por iteración,
+y de cada escenario la memoria máxima del proceso. Los resultados se
+comparan con los de referencia, y si alguno empeora más de lo tolerado, el
+programa termina con error.
+"""
+
+from __future__ import annotations
+from typing import Optional
+
+import argparse
+import fcntl
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import temp
+
+
+REFERENCIA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rendimiento_referencia.json')
+
+# Guiones de temperaturas de cada fase:
+GUION_CEBADO = [60]
+GUION_BUCLE = [56, 58, 61, 63, 66, 68, 71, 73, 76, 73, 71, 68, 66, 63, 61, 58]
+GUION_FINALIZAR = [52, 49, 47, 44]
+
+NVIDIA_SETTINGS = '''#!{python} -S
+import fcntl, json, os, re, sys
+with open(os.environ['RENDIMIENTO_ESTADO'], 'r+') as fichero:
+    fcntl.flock(fichero, fcntl.LOCK_EX)
+    estado = json.load(fichero)
+    salida, temps = [], False
+    for arg in sys.argv[1:]:
+        if arg == '-t':
+            continue
+        if arg in ('-q=gpus', '-q=fans'):
+            salida.append(str(estado['gpus']))
+            continue
+        consulta = re.fullmatch(r'-q=\\[(gpu|fan):(\\d+)\\]/(\\w+)', arg)
+        asignacion = re.fullmatch(r'-a=\\[(gpu|fan):(\\d+)\\]/(\\w+)=(\\d+)', arg)
+        if consulta and consulta.group(3) == 'GPUCoreTemp':
+            guion = estado['guion']
+            salida.append(str(guion[estado['lecturas'] % len(guion)]))
+            temps = True
+        elif consulta and consulta.group(3) == 'GPUUtilization':
+            salida.append('graphics=0, memory=0, video=0, PCIe=0')
+        elif consulta:
+            salida.append(str(estado['fans'].get(consulta.group(2), 0)))
+        elif asignacion and asignacion.group(1) == 'fan':
+            estado['fans'][asignacion.group(2)] = int(asignacion.group(4))
+        elif not asignacion:
+            print(f'ERROR: opción no soportada: {{arg}}', file=sys.stderr)
+            sys.exit(1)
+    estado['lecturas'] += temps
+    fichero.seek(0)
+    json.dump(estado, fichero)
+    fichero.truncate()
+print('\\n'.join(salida))
+'''
+
+
+def preparar_nvidia_settings(directorio: str, num_gpus: int) -> str:
+    """
+    Crea en el directorio indicado el nvidia-settings falso y su fichero de
+    estado, y devuelve la ruta de éste.
+    """
+    ruta = os.path.join(directorio, 'nvidia-settings')
+    with open(ruta, 'w') as fichero:
+        fichero.write(NVIDIA_SETTINGS.format(python=sys.executable))
+    os.chmod(ruta, 0o755)
+    estado = os.path.join(directorio, 'estado.json')
+    with open(estado, 'w') as fichero:
+        json.dump({'gpus': num_gpus, 'guion': GUION_CEBADO, 'lecturas': 0, 'fans': {}}, fichero)
+    return estado
+
+
+def fijar_guion(guion: list[int]) -> None:
+    """Cambia el guion de temperaturas del nvidia-settings falso."""
+    with open(os.environ['RENDIMIENTO_ESTADO'], 'r+') as fichero:
+        fcntl.flock(fichero, fcntl.LOCK_EX)
+        estado = json.load(fichero)
+        estado['guion'], estado['lecturas'] = guion, 0
+        fichero.seek(0)
+        json.dump(estado, fichero)
+        fichero.truncate()
+
+
+def metrica(nombre: str, **etiquetas) -> float:
+    """
+    Devuelve la suma de los valores de la métrica de temp.py indicada con
+    las etiquetas indicadas.
+    """
+    patron = re.compile(rf'{temp.Metricas.PREFIJO}{nombre}(?:{{(.*)}})? (\S+)$')
+    total = 0.0
+    for linea in temp.get_metricas().texto().splitlines():
+        encontrada = patron.match(linea)
+        if encontrada is None:
+            continue
+        pares = dict(re.findall(r'(\w+)="([^"]*)"', encontrada.group(1) or ''))
+        if all(pares.get(k) == str(v) for k, v in etiquetas.items()):
+            total += float(encontrada.group(2))
+    return total
+
+
+class Fase:
+    """
+    Medición de una fase de un escenario: el tiempo real y los procesos
+    nvidia-settings lanzados dentro del bloque with, y el número de
+    iteraciones (por omisión, las que ha hecho el planificador con la GPU
+    n.º 0).
+    """
+
+    def __init__(self, resultados: dict, nombre: str, iteraciones: Optional[int] = None) -> None:
+        self.__resultados = resultados
+        self.__nombre = nombre
+        self.__iteraciones = iteraciones
+
+
+    def __enter__(self) -> Fase:
+        self.__spawns = metrica('spawns_total')
+        self.__ticks = metrica('tick_seconds_count', gpu=0)
+        self.__inicio = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *_) -> None:
+        segundos = time.perf_counter() - self.__inicio
+        iteraciones = self.__iteraciones
+        if iteraciones is None:
+            iteraciones = int(metrica('tick_seconds_count', gpu=0) - self.__ticks)
+        iteraciones = max(iteraciones, 1)
+        self.__resultados[self.__nombre] = {
+            'iteraciones': iteraciones,
+            'segundos_por_iteracion': segundos / iteraciones,
+            'spawns_por_iteracion': (metrica('spawns_total') - self.__spawns) / iteraciones,
+        }
+
+
+def ejecutar_escenario(num_gpus: int, ticks: int, repeticiones: int) -> dict:
+    """
+    Ejecuta todas las fases con el número de GPUs indicado (en este mismo
+    proceso, que debe tener el nvidia-settings falso en el PATH) y devuelve
+    sus resultados.
+    """
+    temp.BACKEND = 'nvidia-settings'
+    temp.GPUS_FANS = {g_num: {g_num: temp.CURVA} for g_num in range(num_gpus)}
+    temp.NIVEL_LOG = temp.ERROR
+    temp.set_reloj(temp.RelojVirtual())
+    reloj = temp.get_reloj()
+    manager = temp.Manager.get_singleton()
+    resultados: dict = {}
+
+    with Fase(resultados, 'arranque', 1):
+        manager.set_gpus(temp.crear_gpus(temp.cargar_configuracion(None)))
+        with temp.agrupar_escrituras():
+            manager.set_fans_control(1)
+            manager.set_speeds(temp.V_MIN)
+    planificador = temp.Planificador(manager)
+
+    fijar_guion(GUION_CEBADO)
+    with Fase(resultados, 'cebado'):
+        planificador.ejecutar(reloj.ahora() + temp.T_CEB_MAX)
+
+    fijar_guion(GUION_BUCLE)
+    with Fase(resultados, 'bucle'):
+        planificador.ejecutar(reloj.ahora() + ticks * temp.SLEEP)
+
+    inst = manager.leer_instantanea()
+    with Fase(resultados, 'iteracion', repeticiones * num_gpus):
+        for _ in range(repeticiones):
+            with temp.agrupar_escrituras():
+                for gpu in manager.get_gpus():
+                    for fan in gpu.get_fans():
+                        manager.bucle(inst.get_temp(gpu.g_num()), gpu, fan, inst)
+
+    fijar_guion(GUION_FINALIZAR)
+    with Fase(resultados, 'finalizar', 1):
+        temp.apagar()
+
+    temp.get_registro().vaciar()
+    return {'fases': resultados, 'memoria_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def medir(num_gpus: int, ticks: int, repeticiones: int) -> dict:
+    """
+    Ejecuta el escenario con el número de GPUs indicado en un proceso
+    aparte, con el nvidia-settings falso en el PATH, y devuelve sus
+    resultados.
+    """
+    with tempfile.TemporaryDirectory(prefix='rendimiento-') as directorio:
+        entorno = dict(os.environ,
+                       PATH=directorio + os.pathsep + os.environ.get('PATH', ''),
+                       RENDIMIENTO_ESTADO=preparar_nvidia_settings(directorio, num_gpus))
+        salida = os.path.join(directorio, 'resultados.json')
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--escenario', str(num_gpus),
+                        '--ticks', str(ticks), '--repeticiones', str(repeticiones), '--salida', salida],
+                       env=entorno, check=True)
+        with open(salida) as fichero:
+            return json.load(fichero)
+
+
+def comparar(resultados: dict, referencia: dict, tolerancias: dict[str, float]) -> list[str]:
+    """
+    Compara los resultados con los de referencia y devuelve la descripción
+    de los que empeoran más de lo tolerado: tolerancias indica, para
+    'segundos_por_iteracion', 'spawns_por_iteracion' y 'memoria_kib', cuánto
+    pueden crecer (0.5 es un 50 %).
+    """
+    regresiones = []
+    for escenario, medido in resultados.items():
+        ref = referencia.get(escenario)
+        if ref is None:
+            continue
+        pares = [(f'{escenario} GPUs: {fase} {clave}', valores[clave], ref['fases'][fase][clave], clave)
+                 for fase, valores in medido['fases'].items() if fase in ref['fases']
+                 for clave in ('segundos_por_iteracion', 'spawns_por_iteracion')]
+        pares.append((f'{escenario} GPUs: memoria_kib', medido['memoria_kib'], ref['memoria_kib'], 'memoria_kib'))
+        for nombre, valor, valor_ref, clave in pares:
+            if valor > valor_ref * (1 + tolerancias[clave]) + 1e-9:
+                regresiones.append(f'{nombre}: {valor:.4g} frente a {valor_ref:.4g} de referencia')
+    return regresiones
+
+
+def main() -> None:
+    """Mide los escenarios indicados y los compara con los de referencia."""
+    parser = argparse.ArgumentParser(description='Mide el coste del bucle de control de temp.py.')
+    parser.add_argument('--gpus', type=int, nargs='+', default=[1, 4, 16], metavar='N',
+                        help='números de GPUs de los escenarios (1, 4 y 16 por omisión)')
+    parser.add_argument('--ticks', type=int, default=60,
+                        help='iteraciones del planificador en la fase bucle (60 por omisión)')
+    parser.add_argument('--repeticiones', type=int, default=200,
+                        help='llamadas a Manager.bucle por ventilador en la fase iteracion (200 por omisión)')
+    parser.add_argument('--referencia', default=REFERENCIA, metavar='FICHERO',
+                        help='fichero JSON con los resultados de referencia')
+    parser.add_argument('--guardar', action='store_true',
+                        help='guarda los resultados como nueva referencia en lugar de compararlos')
+    parser.add_argument('--tolerancia-tiempo', type=float, default=1.0, metavar='FRACCION',
+                        help='aumento tolerado del tiempo por iteración (1.0, el doble, por omisión)')
+    parser.add_argument('--tolerancia-spawns', type=float, default=0.0, metavar='FRACCION',
+                        help='aumento tolerado de los procesos por iteración (ninguno por omisión)')
+    parser.add_argument('--tolerancia-memoria', type=float, default=0.25, metavar='FRACCION',
+                        help='aumento tolerado de la memoria máxima (0.25 por omisión)')
+    parser.add_argument('--escenario', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--salida', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.escenario is not None:
+        resultados = ejecutar_escenario(args.escenario, args.ticks, args.repeticiones)
+        with open(args.salida, 'w') as fichero:
+            json.dump(resultados, fichero)
+        return
+
+    resultados = {}
+    for num_gpus in args.gpus:
+        try:
+            resultados[str(num_gpus)] = medido = medir(num_gpus, args.ticks, args.repeticiones)
+        except (OSError, subprocess.CalledProcessError) as e:
+            sys.exit(f'Error: no se pudo medir el escenario de {num_gpus} GPUs: {e}')
+        print(f'{num_gpus} GPUs - memoria máxima: {medido["memoria_kib"] / 1024:.1f} MiB')
+        for fase, valores in medido['fases'].items():
+            print(f'   {fase}: {valores["segundos_por_iteracion"] * 1000:.2f} ms y '
+                  f'{valores["spawns_por_iteracion"]:.2f} procesos por iteración '
+                  f'({valores["iteraciones"]} iteraciones)')
+
+    if args.guardar:
+        with open(args.referencia, 'w') as fichero:
+            json.dump(resultados, fichero, indent=4)
+            fichero.write('\n')
+        print(f'Referencia guardada en {args.referencia}.')
+        return
+    try:
+        with open(args.referencia) as fichero:
+            referencia = json.load(fichero)
+    except (OSError, ValueError) as e:
+        sys.exit(f'Error: no se pudo leer la referencia {args.referencia}: {e}')
+    regresiones = comparar(resultados, referencia, {
+        'segundos_por_iteracion': args.tolerancia_tiempo,
+        'spawns_por_iteracion': args.tolerancia_spawns,
+        'memoria_kib': args.tolerancia_memoria,
+    })
+    for regresion in regresiones:
+        print(f'Regresión: {regresion}')
+    if regresiones:
+        sys.exit(1)
+    print('Sin regresiones respecto a la referencia.')
+
+
+if __name__ == '__main__':
+    main()
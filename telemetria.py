@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+
+"""
+Lectura del histórico de telemetría que escribe temp.py en
+TELEMETRIA_FICHERO (ver la clase Telemetria de temp.py).
+"""
+
+from __future__ import annotations
+from typing import Iterator, Optional
+
+import argparse
+import datetime
+import mmap
+import struct
+import sys
+
+from temp import Telemetria
+
+
+class LectorTelemetria:
+    """
+    Lector del histórico de telemetría. Se puede usar mientras temp.py lo
+    sigue escribiendo, sin cerrojos: cada lectura copia los registros y
+    descarta los que el escritor haya podido sobrescribir durante la copia.
+    """
+
+    def __init__(self, ruta: str) -> None:
+        with open(ruta, 'rb') as fichero:
+            self.__mapa = mmap.mmap(fichero.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.__mapa) < Telemetria.CABECERA.size:
+            raise ValueError(f'{ruta} no es un fichero de telemetría.')
+        magia, version, tam_registro, _, capacidad = Telemetria.CABECERA.unpack_from(self.__mapa)
+        if magia != Telemetria.MAGIA:
+            raise ValueError(f'{ruta} no es un fichero de telemetría.')
+        if version != Telemetria.VERSION or tam_registro != Telemetria.REGISTRO.size:
+            raise ValueError(f'La versión {version} del fichero {ruta} no está soportada.')
+        self.__capacidad = capacidad
+
+
+    def get_capacidad(self) -> int:
+        """Devuelve el número máximo de registros que guarda el histórico."""
+        return self.__capacidad
+
+
+    def __escritos(self) -> int:
+        """Devuelve el número total de registros escritos en el histórico."""
+        return struct.unpack_from('<Q', self.__mapa, Telemetria.OFFSET_ESCRITOS)[0]
+
+
+    def copiar(self) -> bytes:
+        """
+        Devuelve una copia de los registros válidos del histórico, del más
+        antiguo al más reciente.
+        Un registro se escribe antes de incrementar el contador, así que los
+        contados al principio de la copia están completos. De ellos se
+        descartan los que ocupaban los huecos que se han escrito (o se
+        pueden estar escribiendo) hasta el final de la copia.
+        """
+        tam, capacidad = Telemetria.REGISTRO.size, self.__capacidad
+        antes = self.__escritos()
+        datos = self.__mapa[Telemetria.CABECERA.size:]
+        despues = self.__escritos()
+        primero = max(0, despues - capacidad + 1)
+        if primero >= antes:
+            return b''
+        inicio, fin = primero % capacidad, antes % capacidad or capacidad
+        if inicio < fin:
+            return datos[inicio * tam:fin * tam]
+        return datos[inicio * tam:] + datos[:fin * tam]
+
+
+    def registros(self, desde: Optional[float] = None, hasta: Optional[float] = None,
+                  gpu: Optional[int] = None, fan: Optional[int] = None) -> Iterator[tuple]:
+        """
+        Recorre los registros del histórico, opcionalmente sólo los del
+        intervalo [desde, hasta) (en segundos desde la época) y de la GPU o
+        el ventilador indicados. Cada registro es una tupla (instante, gpu,
+        fan, temp, medida, comandada, indicadores), donde las velocidades
+        desconocidas valen -1.
+        """
+        for registro in Telemetria.REGISTRO.iter_unpack(self.copiar()):
+            instante, g_num, f_num = registro[:3]
+            if ((desde is None or instante >= desde) and (hasta is None or instante < hasta)
+                    and (gpu is None or g_num == gpu) and (fan is None or f_num == fan)):
+                yield registro
+
+
+    def arrays(self, desde: Optional[float] = None, hasta: Optional[float] = None):
+        """
+        Devuelve los registros del intervalo [desde, hasta) como un array
+        estructurado de NumPy con los campos instante, gpu, fan, temp,
+        medida, comandada e indicadores.
+        Necesita NumPy, que sólo se importa al llamar a este método.
+        """
+        import numpy as np
+        tipo = np.dtype({
+            'names': ['instante', 'gpu', 'fan', 'temp', 'medida', 'comandada', 'indicadores'],
+            'formats': ['<f8', 'u1', 'u1', '<i2', 'i1', 'i1', 'u1'],
+            'offsets': [0, 8, 9, 10, 12, 13, 14],
+            'itemsize': Telemetria.REGISTRO.size,
+        })
+        datos = np.frombuffer(self.copiar(), dtype=tipo)
+        if desde is not None:
+            datos = datos[datos['instante'] >= desde]
+        if hasta is not None:
+            datos = datos[datos['instante'] < hasta]
+        return datos
+
+
+def fecha(texto: str) -> float:
+    """Convierte una fecha en formato ISO 8601 a segundos desde la época."""
+    return datetime.datetime.fromisoformat(texto).timestamp()
+
+
+def main() -> None:
+    """Vuelca a la salida los registros del histórico indicado."""
+    parser = argparse.ArgumentParser(description='Vuelca el histórico de telemetría de temp.py.')
+    parser.add_argument('fichero', help='fichero de telemetría (TELEMETRIA_FICHERO)')
+    parser.add_argument('--desde', type=fecha, metavar='FECHA',
+                        help='primer instante a mostrar (AAAA-MM-DD[ HH:MM[:SS]])')
+    parser.add_argument('--hasta', type=fecha, metavar='FECHA',
+                        help='instante a partir del cual ya no se muestra nada')
+    parser.add_argument('--gpu', type=int, help='mostrar sólo la GPU indicada')
+    parser.add_argument('--fan', type=int, help='mostrar sólo el ventilador indicado')
+    args = parser.parse_args()
+    try:
+        lector = LectorTelemetria(args.fichero)
+    except (OSError, ValueError) as e:
+        sys.exit(f'Error: {e}')
+    print('fecha\tgpu\tfan\ttemp\tmedida\tcomandada\tcebando')
+    for instante, g_num, f_num, temp, medida, comandada, indicadores in \
+            lector.registros(args.desde, args.hasta, args.gpu, args.fan):
+        ts = datetime.datetime.fromtimestamp(instante).replace(microsecond=0)
+        cebando = int(bool(indicadores & Telemetria.CEBANDO))
+        print(f'{ts}\t{g_num}\t{f_num}\t{temp}\t{medida}\t{comandada}\t{cebando}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,7 @@
 #!/usr/bin/python3
 
 from __future__ import annotations
-from typing import Optional
+from typing import Callable, Optional
 
 import subprocess
 import sys
@@ -9,10 +9,55 @@ import time
 import signal
 import os
 import datetime
+import stat
 import statistics
-import psutil
+import collections
+import ctypes
+import atexit
+import argparse
+import random
+import bisect
+import threading
+import concurrent.futures
+import fcntl
+import contextlib
+import http.server
+import socketserver
+import json
+import math
+import mmap
+import struct
+import re
 
-V_DEBUG = True
+# Niveles de los mensajes del registro:
+DEBUG: int = 10
+INFO: int = 20
+WARNING: int = 30
+ERROR: int = 40
+
+NIVEL_LOG: int = DEBUG     # Nivel mínimo de los mensajes que se registran
+FORMATO_LOG: str = 'texto' # Formato del registro: 'texto', 'kv' (clave=valor) o 'json'
+COLA_LOG: int = 10000      # Mensajes pendientes de escribir a partir de los cuales se descartan
+BACKEND: str = 'nvidia-settings'   # Acceso al hardware: 'nvidia-settings' o 'nvml'
+METRICAS_FICHERO: Optional[str] = None   # Fichero .prom para el textfile collector de node-exporter
+METRICAS_PUERTO: Optional[int] = None    # Puerto local en el que servir las métricas (/metrics)
+TELEMETRIA_FICHERO: Optional[str] = None  # Fichero con el histórico de temperaturas y velocidades
+TELEMETRIA_REGISTROS: int = 1 << 20       # Capacidad del histórico (16 bytes por registro)
+# Fichero JSON o TOML con las GPUs, ventiladores, curvas y parámetros, que se
+# vuelve a leer cuando cambia (ver README). Si no se indica, se usan GPUS_FANS
+# y las constantes de abajo:
+CONFIGURACION: Optional[str] = None
+# Socket Unix de control para consultar el estado y dar órdenes (ver README),
+# por ejemplo os.path.join(os.environ.get('XDG_RUNTIME_DIR', '/run'), 'nvidia-fan-curve.sock'):
+SOCKET_CONTROL: Optional[str] = None
+FORZADO_MAX: float = 3600.0   # Segundos máximos que puede durar una velocidad forzada
+PETICION_MAX: int = 65536     # Bytes máximos de una petición del socket de control
+# Fichero con el PID del proceso en ejecución, bloqueado mientras se ejecuta
+# (en un directorio en el que no puedan escribir otros usuarios):
+FICHERO_PID: str = os.path.join(os.environ.get('XDG_RUNTIME_DIR', '/run'), 'nvidia-fan-curve.pid')
+# Caché de las GPUs y ventiladores descubiertos (ver obtener_topologia), o None para no usarla:
+TOPOLOGIA_CACHE: Optional[str] = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'nvidia-fan-curve', 'topologia.json')
 
 T_MIN: int   = 50    # Temperatura por debajo de la cual el ventilador no se enciende
 T_MAX: int   = 90    # Temperatura a partir de la cual el ventilador se enciende al máximo
@@ -23,6 +68,36 @@ V_INI: int   = 0     # Velocidad inicial del ventilador durante el cebado
 V_CEB: int   = 35    # Velocidad de cebado
 T_INI: float = 3.0   # Segundos de espera tras arranque inicial a V_INI %
 SLEEP: float = 7.0   # Segundos de espera entre comprobaciones
+SLEEP_CEB: float = 3.0     # Segundos entre comprobaciones mientras se ceba un ventilador
+T_CEB_MAX: float = 30.0    # Segundos máximos de cebado antes de pasar a V_MAX
+PLAZO_APAGADO: float = 300.0    # Segundos máximos de espera a T_FIN al salir
+ESCALADO_APAGADO: float = 70.0  # Segundos al salir antes de subir al siguiente tramo de la curva
+ACCION_PLAZO: str = 'v_max'     # Qué hacer si vence PLAZO_APAGADO: 'v_max' o 'auto'
+TIMEOUT_COMANDO: float = 2.0    # Segundos máximos de cada invocación de nvidia-settings antes de matarla
+REINTENTOS: int = 2             # Reintentos de una invocación de nvidia-settings que no responde o falla
+ESPERA_REINTENTO: float = 0.25  # Segundos antes del primer reintento (se duplica en cada uno)
+FALLOS_MAX: int = 3             # Iteraciones seguidas con errores de una GPU tras las que se aplica ACCION_FALLO
+ACCION_FALLO: str = 'auto'      # Qué hacer si falla el acceso al hardware de una GPU: 'auto' o 'v_max'
+REPOSO_CIRCUITO: float = 60.0   # Segundos entre intentos de recuperar una GPU tras aplicar ACCION_FALLO
+ADAPTATIVO: bool = False   # Adaptar el periodo de cada GPU a la evolución de su temperatura
+SLEEP_MIN: float = 1.0     # Periodo mínimo en modo adaptativo (s)
+SLEEP_MAX: float = 60.0    # Periodo máximo en modo adaptativo (s)
+MUESTRAS: int = 5    # Máximo de lecturas nuevas para medir la velocidad de un ventilador
+VENTANA: int = 9     # Lecturas de velocidad recientes que se conservan por ventilador
+VERIFICAR: float = 60.0   # Segundos entre comprobaciones de la velocidad real de cada ventilador
+ASENTAR: float = 5.0      # Segundos que tarda un ventilador en alcanzar la velocidad pedida
+DERIVA: int = 5           # Diferencia (%) máxima admitida entre la velocidad pedida y la real
+HISTERESIS: int = 2       # Grados que tiene que bajar la temperatura por debajo de un tramo para bajar de él
+PERMANENCIA: float = 30.0 # Segundos mínimos a una velocidad antes de bajarla
+MODO: str = 'tramos'      # Modo de control: 'tramos', 'interpolado' o 'pid' (ver Control)
+PENDIENTE: float = 3.0    # Cambio máximo de velocidad (%/s) en los modos 'interpolado' y 'pid'
+CONSIGNA: int = 65        # Temperatura (ºC) que intenta mantener el modo 'pid'
+KP: float = 4.0           # Ganancia proporcional del modo 'pid' (% por ºC)
+KI: float = 0.05          # Ganancia integral del modo 'pid' (% por ºC y segundo)
+KD: float = 0.0           # Ganancia derivativa del modo 'pid' (% por ºC/s)
+ANTICIPACION: int = 0     # ºC de subida que se anticipan ante un salto de carga del 100 % (0: no se anticipa)
+SALTO_CARGA: int = 30     # Subida de la carga (%) entre dos lecturas a partir de la cual se anticipa
+ESTABILIZACION: float = 60.0   # Segundos tras los que se deja de anticipar si la temperatura ya no sube
 
 
 # Curva de temperaturas y velocidades
@@ -38,32 +113,442 @@ CURVA: dict[int, int] = {             # (-inf, T_MIN) ºC....: V_MIN %
 }                                     # [85, +inf) ºC.......: V_MAX %
 
 
-# GPU: {Diccionario con cada número de ventilador y su curva asociada}
-GPUS_FANS: dict[int, dict[int, dict[int, int]]] = {
-    0: {0: CURVA},
-    # 1: {1: CURVA},
+# GPU: {Diccionario con cada número de ventilador y su curva asociada}, por
+# ejemplo {0: {0: CURVA}, 1: {1: CURVA}}. Si es None, las GPUs y sus
+# ventiladores se descubren al arrancar y todos usan CURVA (ver
+# obtener_topologia):
+GPUS_FANS: Optional[dict[int, dict[int, dict[int, int]]]] = None
+
+
+class Curva:
+    """
+    Curva de temperaturas y velocidades de un ventilador, validada y
+    preparada para que las búsquedas se hagan mediante búsqueda binaria en
+    lugar de recorrer todos los tramos.
+    Se comporta como un diccionario de sólo lectura {temperatura: velocidad}
+    con los tramos ordenados por temperatura.
+    """
+
+    def __init__(self, curva: dict[int, int], v_min: int, v_max: int) -> None:
+        """
+        Lanza ValueError si la curva está vacía, si alguna velocidad está
+        fuera del rango [v_min, v_max] o si las velocidades no son crecientes
+        con la temperatura.
+        """
+        if not curva:
+            raise ValueError('la curva no tiene ningún tramo')
+        tramos = sorted(curva.items())
+        self.__temps = [t for t, _ in tramos]
+        self.__veloces = [v for _, v in tramos]
+        for t, v in tramos:
+            if v not in range(v_min, v_max + 1):
+                raise ValueError(f'la velocidad {v} % del tramo de {t} ºC está '
+                                 f'fuera del rango [{v_min}, {v_max}]')
+        for (t1, v1), (t2, v2) in zip(tramos, tramos[1:]):
+            if v2 < v1:
+                raise ValueError(f'la velocidad baja de {v1} % a {v2} % '
+                                 f'entre los tramos de {t1} ºC y {t2} ºC')
+        self.__dict = dict(tramos)
+
+
+    def validar_temps(self, t_min: int, t_max: int) -> None:
+        """
+        Lanza ValueError si alguna temperatura de la curva está fuera del
+        rango (t_min, t_max].
+        """
+        if self.__temps[0] <= t_min or self.__temps[-1] > t_max:
+            raise ValueError(f'las temperaturas de la curva deben estar en el '
+                             f'rango ({t_min}, {t_max}]')
+
+
+    def tramo(self, temp: int) -> Optional[tuple[int, int]]:
+        """
+        Devuelve el primer tramo (temperatura, velocidad) cuya temperatura es
+        superior a temp, o None si temp está por encima de todos los tramos.
+        """
+        i = bisect.bisect_right(self.__temps, temp)
+        if i == len(self.__temps):
+            return None
+        return (self.__temps[i], self.__veloces[i])
+
+
+    def interpolar(self, temp: int, t_min: int, v_max: int) -> int:
+        """
+        Devuelve la velocidad para temp interpolando linealmente entre los
+        comienzos de los tramos: la del primer tramo en t_min, la de cada
+        tramo siguiente en la temperatura a la que empieza y v_max en la del
+        último. Así coincide con la del tramo al comienzo de cada uno y sube
+        poco a poco hasta la del siguiente. temp debe ser al menos t_min.
+        """
+        i = bisect.bisect_right(self.__temps, temp)
+        if i == len(self.__temps):
+            return v_max
+        t1, t2 = (self.__temps[i - 1] if i > 0 else t_min), self.__temps[i]
+        v1 = self.__veloces[i]
+        v2 = self.__veloces[i + 1] if i + 1 < len(self.__veloces) else v_max
+        return v1 + round((v2 - v1) * (temp - t1) / (t2 - t1))
+
+
+    def veloc_superior(self, veloc: int) -> Optional[int]:
+        """
+        Devuelve la menor velocidad de la curva estrictamente superior a veloc,
+        o None si no la hay.
+        """
+        i = bisect.bisect_right(self.__veloces, veloc)
+        return self.__veloces[i] if i < len(self.__veloces) else None
+
+
+    def veloc_inferior(self, veloc: int) -> Optional[int]:
+        """
+        Devuelve la mayor velocidad de la curva estrictamente inferior a veloc,
+        o None si no la hay.
+        """
+        i = bisect.bisect_left(self.__veloces, veloc)
+        return self.__veloces[i - 1] if i > 0 else None
+
+
+    def get_temps(self) -> list[int]:
+        """Devuelve las temperaturas de los tramos, en orden creciente."""
+        return self.__temps
+
+
+    def get_veloces(self) -> list[int]:
+        """Devuelve las velocidades de los tramos, en orden creciente."""
+        return self.__veloces
+
+
+    def items(self):
+        """Devuelve los tramos (temperatura, velocidad) de la curva."""
+        return self.__dict.items()
+
+
+    def values(self):
+        """Devuelve las velocidades de la curva, en orden de temperatura."""
+        return self.__dict.values()
+
+
+    def __iter__(self):
+        return iter(self.__dict)
+
+
+    def __len__(self) -> int:
+        return len(self.__dict)
+
+
+    def __str__(self) -> str:
+        return str(self.__dict)
+
+
+class FiltroVelocidad:
+    """
+    Estimador de la velocidad de un ventilador a partir de sus lecturas
+    recientes, que se conservan de una iteración a otra en una ventana de
+    tamaño fijo. La estimación es la mediana de la ventana.
+    Las lecturas fuera del rango 0-100 se descartan, y también las que se
+    alejan demasiado de la mediana, salvo que se repitan: dos lecturas
+    atípicas seguidas y parecidas entre sí indican que la velocidad ha
+    cambiado de verdad, y sustituyen a la ventana.
+    """
+
+    TOLERANCIA = 2   # Diferencia (%) entre lecturas para considerarlas iguales
+    ATIPICA = 10     # Diferencia (%) con la mediana para considerar atípica una lectura
+
+
+    def __init__(self, ventana: int = VENTANA) -> None:
+        self.__lecturas: collections.deque[int] = collections.deque(maxlen=ventana)
+        self.__atipica: Optional[int] = None
+
+
+    def reiniciar(self) -> None:
+        """Olvida las lecturas anteriores, por ejemplo, tras cambiar la velocidad."""
+        self.__lecturas.clear()
+        self.__atipica = None
+
+
+    def get_lecturas(self) -> list[int]:
+        """Devuelve las lecturas de la ventana."""
+        return list(self.__lecturas)
+
+
+    def añadir(self, veloc: int) -> bool:
+        """
+        Añade una lectura a la ventana. Devuelve False si se ha descartado.
+        """
+        if veloc not in range(0, 101):
+            return False
+        if len(self.__lecturas) >= 3 and \
+           abs(veloc - statistics.median(self.__lecturas)) > FiltroVelocidad.ATIPICA:
+            anterior, self.__atipica = self.__atipica, veloc
+            if anterior is None or abs(veloc - anterior) > FiltroVelocidad.TOLERANCIA:
+                return False
+            self.__lecturas.clear()
+            self.__lecturas.append(anterior)
+        self.__atipica = None
+        self.__lecturas.append(veloc)
+        return True
+
+
+    def estable(self) -> bool:
+        """Indica si las dos últimas lecturas de la ventana coinciden."""
+        return len(self.__lecturas) >= 2 and \
+            abs(self.__lecturas[-1] - self.__lecturas[-2]) <= FiltroVelocidad.TOLERANCIA
+
+
+    def estimacion(self) -> Optional[int]:
+        """
+        Devuelve la velocidad estimada, o None si no hay ninguna lectura.
+        """
+        if not self.__lecturas:
+            return None
+        return round(statistics.median(self.__lecturas))
+
+
+class Control:
+    """
+    Modo de control de un ventilador: cómo se calculan, a partir de la
+    temperatura de la GPU, la velocidad objetivo y la siguiente velocidad a
+    establecer en camino hacia ella.
+    Los modos sólo deciden velocidades: el cebado, la permanencia mínima y
+    la retención por encima de t_fin los aplica Manager.bucle igual en
+    todos ellos.
+    """
+
+    def objetivo(self, fan: Fan, gpu: GPU, temp: int, actual: int) -> int:
+        """
+        Devuelve la velocidad objetivo del ventilador para la temperatura
+        indicada, siendo actual su velocidad actual. Se llama una vez en cada
+        iteración en la que el ventilador no se está cebando.
+        """
+        raise NotImplementedError
+
+
+    def objetivo_bajada(self, fan: Fan, gpu: GPU, temp: int, objetivo: int) -> int:
+        """
+        Devuelve la velocidad a la que se puede bajar el ventilador teniendo
+        en cuenta su histéresis, siendo objetivo la devuelta por objetivo()
+        (ver Fan.retener_bajada).
+        """
+        raise NotImplementedError
+
+
+    def siguiente(self, fan: Fan, gpu: GPU, temp: int, actual: int, objetivo: int) -> int:
+        """
+        Devuelve la siguiente velocidad a establecer en camino desde la
+        velocidad actual hasta la velocidad objetivo.
+        """
+        raise NotImplementedError
+
+
+class ControlTramos(Control):
+    """
+    Modo 'tramos': la velocidad objetivo es la del tramo de la curva en el
+    que está la temperatura, y se llega a ella pasando por todos los tramos
+    intermedios, uno en cada iteración.
+    """
+
+    def objetivo(self, fan: Fan, gpu: GPU, temp: int, actual: int) -> int:
+        _, objetivo = fan.buscar_objetivo(temp, gpu)
+        return objetivo
+
+
+    def objetivo_bajada(self, fan: Fan, gpu: GPU, temp: int, objetivo: int) -> int:
+        _, objetivo = fan.buscar_objetivo(temp + fan.get_histeresis(), gpu)
+        return objetivo
+
+
+    def siguiente(self, fan: Fan, gpu: GPU, temp: int, actual: int, objetivo: int) -> int:
+        return fan.siguiente_velocidad(actual, objetivo)
+
+
+class ControlInterpolado(Control):
+    """
+    Modo 'interpolado': la velocidad objetivo se interpola linealmente
+    entre los tramos de la curva (ver Curva.interpolar), y se llega a ella
+    en línea recta, sin cambiar la velocidad más de get_pendiente() % por
+    segundo desde la iteración anterior. Así se responde antes a las subidas
+    bruscas de temperatura que pasando por todos los tramos, y con cambios
+    más pequeños.
+    """
+
+    def __init__(self) -> None:
+        self.__t_evaluado: Optional[float] = None
+
+
+    def objetivo(self, fan: Fan, gpu: GPU, temp: int, actual: int) -> int:
+        return self.interpolar(fan, gpu, temp)
+
+
+    def objetivo_bajada(self, fan: Fan, gpu: GPU, temp: int, objetivo: int) -> int:
+        return self.interpolar(fan, gpu, temp + fan.get_histeresis())
+
+
+    def interpolar(self, fan: Fan, gpu: GPU, temp: int) -> int:
+        """
+        Devuelve la velocidad interpolada en la curva del ventilador para la
+        temperatura indicada: v_min por debajo de t_min y v_max a partir de
+        t_max.
+        """
+        if temp < gpu.get_t_min():
+            return fan.get_v_min()
+        if temp >= gpu.get_t_max():
+            return fan.get_v_max()
+        return fan.get_curva().interpolar(temp, gpu.get_t_min(), fan.get_v_max())
+
+
+    def siguiente(self, fan: Fan, gpu: GPU, temp: int, actual: int, objetivo: int) -> int:
+        """
+        Limita el cambio de velocidad a get_pendiente() % por segundo desde
+        la iteración anterior, salvo para apagar el ventilador o cuando la
+        GPU llega a t_max, que se hacen directamente. Un ventilador parado se
+        arranca al menos a v_ceb, que es la mínima velocidad estable.
+        El tiempo se cuenta desde la anterior llamada y como mucho es el
+        periodo de la GPU, así que tras mucho tiempo sin cambios (o sin
+        llamadas, por ejemplo, mientras se cebaba o estaba forzado) el
+        ventilador tampoco da un salto.
+        """
+        ahora = get_reloj().ahora()
+        anterior, self.__t_evaluado = self.__t_evaluado, ahora
+        if actual == objetivo or objetivo == fan.get_v_min() or temp >= gpu.get_t_max():
+            return objetivo
+        transcurrido = gpu.get_sleep() if anterior is None else min(ahora - anterior, gpu.get_sleep())
+        paso = max(int(fan.get_pendiente() * transcurrido), 1)
+        if actual < objetivo:
+            return min(max(actual + paso, fan.get_v_ceb()), objetivo)
+        return max(actual - paso, objetivo)
+
+
+class ControlPid(ControlInterpolado):
+    """
+    Modo 'pid': un controlador PID calcula la velocidad objetivo necesaria
+    para mantener la GPU a get_consigna() ºC, y se llega a ella como en el
+    modo 'interpolado'. Por debajo de t_min el ventilador se apaga y a
+    partir de t_max se pone a v_max, como en los demás modos.
+    - La histéresis del ventilador es una banda muerta alrededor de la
+      consigna, dentro de la cual el error se considera nulo y la velocidad
+      no cambia.
+    - La salida se limita al rango que va de la velocidad del primer tramo
+      de la curva (la mínima a la que funciona el ventilador en todos los
+      modos, que lo arrancan siempre cebándolo) a v_max, y el término
+      integral deja de acumularse mientras la salida está saturada en el sentido del
+      error (anti-windup).
+    - Al arrancar, el término integral se inicia de forma que la salida sea
+      la velocidad actual, para no dar saltos.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.__integral: Optional[float] = None
+        self.__error = 0.0
+        self.__t_anterior = 0.0
+
+
+    def reiniciar(self) -> None:
+        """Olvida el estado del controlador."""
+        self.__integral = None
+
+
+    def get_integral(self) -> Optional[float]:
+        """Devuelve el término integral del controlador, o None si no ha arrancado."""
+        return self.__integral
+
+
+    def objetivo(self, fan: Fan, gpu: GPU, temp: int, actual: int) -> int:
+        if temp < gpu.get_t_min() or temp >= gpu.get_t_max():
+            self.reiniciar()
+            return self.interpolar(fan, gpu, temp)
+        ahora = get_reloj().ahora()
+        error = float(temp - fan.get_consigna())
+        banda = fan.get_histeresis()
+        error = max(error - banda, 0.0) if error > 0 else min(error + banda, 0.0)
+        v_bajo, v_alto = fan.get_curva().get_veloces()[0], fan.get_v_max()
+        proporcional = fan.get_kp() * error
+        if self.__integral is None:
+            self.__integral = min(max(actual, v_bajo), v_alto) - proporcional
+            self.__error, self.__t_anterior = error, ahora
+        # Tras una pausa larga (por ejemplo, una velocidad forzada), no se
+        # integra más de lo que se integraría en SLEEP_MAX segundos:
+        dt = min(ahora - self.__t_anterior, SLEEP_MAX)
+        derivativo = fan.get_kd() * (error - self.__error) / dt if dt > 0 else 0.0
+        integral = self.__integral + fan.get_ki() * error * dt
+        salida = proporcional + integral + derivativo
+        if not ((salida > v_alto and error > 0) or (salida < v_bajo and error < 0)):
+            self.__integral = integral
+        self.__error, self.__t_anterior = error, ahora
+        salida = proporcional + self.__integral + derivativo
+        return min(max(round(salida), v_bajo), v_alto)
+
+
+    def objetivo_bajada(self, fan: Fan, gpu: GPU, temp: int, objetivo: int) -> int:
+        # La histéresis ya está en la banda muerta del controlador:
+        return objetivo
+
+
+MODOS_CONTROL: dict[str, type[Control]] = {
+    'tramos': ControlTramos,
+    'interpolado': ControlInterpolado,
+    'pid': ControlPid,
 }
 
 
 class Fan:
     """Cada instancia de esta clase representa un ventilador de una GPU."""
 
-    __num_fans: Optional[int] = None
+    # Estados del proceso de cebado (ver cebador):
+    REPOSO = 'reposo'            # No se está cebando
+    ARRANCANDO = 'arrancando'    # Esperando t_ini segundos a v_ini
+    CEBANDO = 'cebando'          # Esperando a que la velocidad se estabilice en v_ceb
+    CEBADO = 'cebado'            # El último cebado terminó correctamente
+    AGOTADO = 'agotado'          # El último cebado no terminó en T_CEB_MAX segundos
 
 
     def __init__(self, f_num: int, params: dict[str, int], curva: dict[int, int]) -> None:
         if f_num not in range(Fan.get_num_fans()):
             error('El número de GPU está fuera del rango.')
         self.__f_num = f_num
-        self.__curva = curva
+        self.__modo: Optional[str] = None
+        try:
+            self.configurar(params, curva)
+        except ValueError as e:
+            error(f'La curva del ventilador n.º {f_num} no es válida: {e}.')
+        self.__cebados = 0
+        self.__retenidas = 0
+        self.__filtro = FiltroVelocidad()
+        self.__comandada: Optional[int] = None
+        self.__t_comandada = 0.0
+        self.__t_verificada = 0.0
+        self.__estado = Fan.REPOSO
+        self.__t_estado = 0.0
+        self.__t_cebado = 0.0
+        log(f'Creado ventilador n.º {f_num}.')
+        log(f'El ventilador n.º {f_num} tiene la siguiente curva:')
+        log(str(self.__curva))
+
+
+    def configurar(self, params: dict[str, int], curva: dict[int, int]) -> None:
+        """
+        Establece los parámetros y la curva del ventilador. Lanza ValueError
+        (sin cambiar nada) si la curva no es válida para esos parámetros.
+        El estado del modo de control se conserva salvo que cambie el modo.
+        """
+        nueva = Curva(curva, params['v_min'], params['v_max'])
+        if params['modo'] not in MODOS_CONTROL:
+            raise ValueError(f'el modo de control {params["modo"]!r} no existe')
+        if params['modo'] != self.__modo:
+            self.__control = MODOS_CONTROL[params['modo']]()
+            self.__modo = params['modo']
+        self.__curva = nueva
         self.__v_min = params['v_min']
         self.__v_max = params['v_max']
         self.__v_ini = params['v_ini']
         self.__v_ceb = params['v_ceb']
         self.__t_ini = params['t_ini']
-        log(f'Creado ventilador n.º {f_num}.')
-        log(f'El ventilador n.º {f_num} tiene la siguiente curva:')
-        log(str(curva))
+        self.__histeresis = params['histeresis']
+        self.__permanencia = params['permanencia']
+        self.__pendiente = params['pendiente']
+        self.__consigna = params['consigna']
+        self.__kp = params['kp']
+        self.__ki = params['ki']
+        self.__kd = params['kd']
 
 
     @classmethod
@@ -71,9 +556,7 @@ class Fan:
         """
         Devuelve el número de ventiladores que hay instalados en el sistema.
         """
-        if cls.__num_fans is None:
-            cls.__num_fans = get_query_num('-q=fans')
-        return cls.__num_fans
+        return get_backend().get_num_fans()
 
 
     def get_f_num(self) -> int:
@@ -109,24 +592,174 @@ class Fan:
         return self.__t_ini
 
 
-    def get_curva(self) -> dict[int, int]:
+    def get_histeresis(self) -> int:
+        """
+        Devuelve los grados que tiene que bajar la temperatura por debajo
+        del comienzo de un tramo de la curva para bajar al tramo anterior.
+        """
+        return self.__histeresis
+
+
+    def get_permanencia(self) -> float:
+        """
+        Devuelve los segundos mínimos que el ventilador tiene que estar a una
+        velocidad antes de bajarla.
+        """
+        return self.__permanencia
+
+
+    def get_modo(self) -> str:
+        """Devuelve el nombre del modo de control del ventilador (ver MODOS_CONTROL)."""
+        return self.__modo
+
+
+    def get_control(self) -> Control:
+        """Devuelve el modo de control del ventilador."""
+        return self.__control
+
+
+    def get_pendiente(self) -> float:
+        """
+        Devuelve el cambio máximo de velocidad, en % por segundo, en los
+        modos 'interpolado' y 'pid'.
+        """
+        return self.__pendiente
+
+
+    def get_consigna(self) -> int:
+        """Devuelve la temperatura que intenta mantener el modo 'pid'."""
+        return self.__consigna
+
+
+    def get_kp(self) -> float:
+        """Devuelve la ganancia proporcional del modo 'pid'."""
+        return self.__kp
+
+
+    def get_ki(self) -> float:
+        """Devuelve la ganancia integral del modo 'pid'."""
+        return self.__ki
+
+
+    def get_kd(self) -> float:
+        """Devuelve la ganancia derivativa del modo 'pid'."""
+        return self.__kd
+
+
+    def get_retenidas(self) -> int:
+        """
+        Devuelve el número de iteraciones en las que la histéresis o la
+        permanencia mínima han evitado bajar la velocidad del ventilador.
+        """
+        return self.__retenidas
+
+
+    def get_curva(self) -> Curva:
         """Devuelve la curva de temperaturas y velocidades del ventilador."""
         return self.__curva
 
 
-    def arrancar(self) -> None:
+    def get_comandada(self) -> Optional[int]:
+        """
+        Devuelve la última velocidad establecida en el ventilador, o None si
+        no se conoce (todavía no se ha establecido ninguna o la velocidad
+        real no coincidía con ella).
+        """
+        return self.__comandada
+
+
+    def get_t_comandada(self) -> float:
+        """Devuelve el instante en el que se estableció la última velocidad."""
+        return self.__t_comandada
+
+
+    def necesita_lectura(self, ahora: float) -> bool:
+        """
+        Indica si hay que leer la velocidad real del ventilador porque no se
+        conoce la última velocidad establecida o porque hace más de VERIFICAR
+        segundos que no se comprueba.
+        """
+        return self.__comandada is None or self.__estado == Fan.CEBANDO \
+            or ahora - self.__t_verificada >= VERIFICAR
+
+
+    def muestras_necesarias(self, ahora: float) -> int:
+        """
+        Devuelve cuántas muestras de velocidad hay que pedir para el
+        ventilador en la instantánea: ninguna si no necesita lectura, dos
+        mientras se ceba (el filtro se vacía en cada paso del cebado y
+        necesita dos lecturas para darse por estable) y una en los demás
+        casos.
+        """
+        if not self.necesita_lectura(ahora):
+            return 0
+        return 2 if self.__estado == Fan.CEBANDO else 1
+
+
+    def invalidar(self) -> None:
+        """
+        Hace que en la siguiente iteración se vuelva a leer la velocidad real
+        del ventilador, aunque no haya pasado VERIFICAR desde la anterior.
+        """
+        self.__t_verificada = -VERIFICAR
+
+
+    def get_veloc_actual(self, inst: Optional[Instantanea] = None) -> int:
+        """
+        Devuelve la velocidad actual del ventilador, que es la última que se
+        ha establecido salvo que no se conozca o que haya lecturas nuevas
+        (en la instantánea o, si no se indica, consultándolas).
+        Si la lectura se aleja más de DERIVA de la velocidad establecida
+        una vez pasado el tiempo de asentamiento, la velocidad establecida
+        deja de darse por buena y se devuelve la leída.
+        """
+        comandada = self.__comandada
+        if comandada is not None and inst is not None and not inst.get_muestras(self.get_f_num()):
+            return comandada
+        veloc = self.get_speed(inst)
+        ahora = get_reloj().ahora()
+        if comandada is None or ahora - self.__t_comandada < ASENTAR:
+            return veloc if comandada is None else comandada
+        self.__t_verificada = ahora
+        if abs(veloc - comandada) > DERIVA:
+            log(f'El ventilador n.º {self.get_f_num()} está al {veloc} % '
+                f'en lugar de al {comandada} %.', WARNING,
+                fan=self.get_f_num(), medida=veloc, comandada=comandada)
+            self.__comandada = None
+            return veloc
+        return comandada
+
+
+    def get_cebados(self) -> int:
+        """Devuelve el número de veces que se ha cebado el ventilador."""
+        return self.__cebados
+
+
+    def get_estado_cebado(self) -> str:
+        """Devuelve el estado del proceso de cebado del ventilador."""
+        return self.__estado
+
+
+    def cebando(self) -> bool:
+        """Indica si el ventilador está en mitad de un proceso de cebado."""
+        return self.__estado in (Fan.ARRANCANDO, Fan.CEBANDO)
+
+
+    def get_medida(self) -> Optional[int]:
         """
-        Pone el ventilador a una velocidad (v_ini, que en principio es 25 %)
-        más baja que la de cebado, si no estaba ya a esa velocidad o superior,
-        y espera t_ini segundos.
+        Devuelve la velocidad medida según las lecturas recientes, sin
+        consultar el hardware, o None si no hay ninguna.
         """
-        if self.get_speed() < self.get_v_ini():
-            log(f'Arrancando al {self.get_v_ini()} %...')
-            self.set_speed(self.get_v_ini())
-            esperar(self.get_t_ini())
+        return self.__filtro.estimacion()
+
 
+    def __cambiar_estado(self, estado: str) -> None:
+        """Cambia el estado del proceso de cebado."""
+        self.__estado = estado
+        self.__t_estado = get_reloj().ahora()
 
-    def cebador(self, sgte_veloc: int) -> bool:
+
+    def cebador(self, sgte_veloc: int, veloc_actual: int) -> bool:
         """
         El ventilador de mi GPU hace un ruido muy desagradable cuando arranca
         a velocidades medias-altas (de 50 % en adelante). El cebado es el
@@ -139,57 +772,135 @@ class Fan:
         mediciones muy inestables de la velocidad del ventilador, por lo que
         entiendo que 35 % es la mínima velocidad estable para mi GPU.
 
-        Devuelve True si ha habido que hacer un cebado, o False en caso
+        Este método sólo inicia el cebado; el proceso avanza después un paso
+        en cada iteración mediante avanzar_cebado, sin detener el resto del
+        bucle de control.
+
+        Devuelve True si ha habido que iniciar un cebado, o False en caso
         contrario.
         """
-        if self.get_speed() < self.get_v_ceb() and sgte_veloc > self.get_v_ceb():
-            log(f'Iniciando proceso de cebado al {self.get_v_ceb()} %...')
+        if self.cebando():
+            return True
+        if veloc_actual < self.get_v_ceb() and sgte_veloc > self.get_v_ceb():
+            log(f'Iniciando proceso de cebado al {self.get_v_ceb()} %...',
+                fan=self.get_f_num(), evento='cebado')
+            self.__cebados += 1
+            get_metricas().contar('primings_total', fan=self.get_f_num())
+            self.__t_cebado = get_reloj().ahora()
             # Empieza primero con una velocidad más reducida (v_ini, que en
             # principio es 25%) antes de pasar a la velocidad de cebado.
             # TODO: Probar a quitarlo y ver si cambia en algo.
-            self.arrancar()
-            self.get_speed() # Para hacer log de la velocidad actual
-            self.set_speed(self.get_v_ceb())
-            while True:
-                v_actual = self.get_speed()
-                if v_actual >= self.get_v_ceb() and v_actual - self.get_v_ceb() <= 2:
-                    break
-                log(f'Continuando proceso de cebado, actualmente al {v_actual} %...')
-                esperar(3.0)
-            log(f'Proceso de cebado finalizado al {v_actual} %...')
+            if veloc_actual < self.get_v_ini():
+                log(f'Arrancando al {self.get_v_ini()} %...')
+                self.set_speed(self.get_v_ini())
+                self.__cambiar_estado(Fan.ARRANCANDO)
+            else:
+                self.set_speed(self.get_v_ceb())
+                self.__cambiar_estado(Fan.CEBANDO)
             return True
         return False
 
 
-    def get_speed(self) -> int:
+    def avanzar_cebado(self, inst: Optional[Instantanea] = None) -> None:
+        """
+        Hace avanzar un paso el proceso de cebado:
+        - Tras t_ini segundos arrancando a v_ini, pasa a v_ceb.
+        - Cuando la velocidad se estabiliza en v_ceb, el cebado termina.
+        - Si no se estabiliza en T_CEB_MAX segundos desde que empezó, se
+          abandona el cebado y se pone el ventilador a v_max por seguridad.
+        """
+        ahora = get_reloj().ahora()
+        if self.__estado == Fan.ARRANCANDO:
+            if ahora - self.__t_estado >= self.get_t_ini():
+                self.set_speed(self.get_v_ceb())
+                self.__cambiar_estado(Fan.CEBANDO)
+        elif self.__estado == Fan.CEBANDO:
+            # La velocidad está cambiando, así que sólo valen las lecturas nuevas:
+            self.__filtro.reiniciar()
+            v_actual = self.get_speed(inst)
+            if v_actual >= self.get_v_ceb() and v_actual - self.get_v_ceb() <= 2:
+                log(f'Proceso de cebado finalizado al {v_actual} %...')
+                self.__cambiar_estado(Fan.CEBADO)
+            elif ahora - self.__t_cebado >= T_CEB_MAX:
+                log(f'El cebado no ha terminado en {T_CEB_MAX} s (actualmente al '
+                    f'{v_actual} %). Pasando al {self.get_v_max()} %.', WARNING,
+                    fan=self.get_f_num(), evento='cebado_agotado')
+                get_metricas().contar('priming_timeouts_total', fan=self.get_f_num())
+                self.set_speed(self.get_v_max())
+                self.__cambiar_estado(Fan.AGOTADO)
+            else:
+                log(f'Continuando proceso de cebado, actualmente al {v_actual} %...', DEBUG)
+
+
+    def get_speed(self, inst: Optional[Instantanea] = None) -> int:
         """
         A veces, el ventilador da medidas imprecisas, erráticas e incluso
         totalmente erróneas, sobre todo a bajas velocidades (< 35 %).
-        Lo que hacemos es tomar varias muestras y luego calcular la mediana.
-        La media no es muy útil porque pueden aparecer valores muy extremos
-        que claramente son erróneos.
-        """
-        VECES = 5
-        lst = []
-        for _ in range(VECES):
-            while True:
-                veloc = get_query_str(f'-q=[fan:{self.get_f_num()}]/GPUCurrentFanSpeed')
-                if veloc in range(0, 101):
-                    break
-            lst.append(veloc)
-        mediana = round(statistics.median(lst))
-        if V_DEBUG:
-            target = get_query_str(f'-q=[fan:{self.get_f_num()}]/GPUTargetFanSpeed')
-            log(f'Velocidades: {lst} - Mediana: {mediana} % - Target actual: {target} %')
+        Lo que hacemos es guardar las lecturas recientes en un filtro y luego
+        calcular la mediana. La media no es muy útil porque pueden aparecer
+        valores muy extremos que claramente son erróneos.
+        Las lecturas nuevas se toman de la instantánea, si se indica, o se
+        consulta una. Sólo se hacen más lecturas (hasta MUESTRAS) mientras
+        las dos últimas no coincidan.
+        Lanza ValueError si no se consigue ninguna lectura válida.
+        """
+        f_num = self.get_f_num()
+        get_metricas().contar('speed_reads_total', fan=f_num)
+        with get_metricas().medir('speed_read_seconds', fan=f_num):
+            mediana = self.__medir(inst)
+        get_metricas().fijar('fan_measured_percent', mediana, fan=f_num)
+        return mediana
+
+
+    def __medir(self, inst: Optional[Instantanea]) -> int:
+        """Lleva a cabo la medición de get_speed."""
+        filtro = self.__filtro
+        nuevas = inst.get_muestras(self.get_f_num()) if inst is not None else []
+        if not nuevas:
+            nuevas = [get_backend().get_speed(self.get_f_num())]
+        for veloc in nuevas:
+            filtro.añadir(veloc)
+        lecturas = len(nuevas)
+        while not filtro.estable() and lecturas < MUESTRAS:
+            filtro.añadir(get_backend().get_speed(self.get_f_num()))
+            lecturas += 1
+        mediana = filtro.estimacion()
+        if mediana is None:
+            raise ValueError(f'No se pudo medir la velocidad del ventilador n.º {self.get_f_num()}.')
+        lst = filtro.get_lecturas()
+        # La velocidad objetivo sólo se consulta si se va a registrar:
+        if log_activo(DEBUG):
+            target = inst.get_target(self.get_f_num()) if inst is not None else None
+            if target is None:
+                target = get_backend().get_target(self.get_f_num())
+            log(f'Velocidades: {lst} - Mediana: {mediana} % - Target actual: {target} %', DEBUG)
         return mediana
 
 
     def set_speed(self, veloc: int) -> None:
         """
-        Establece la velocidad del ventilador.
+        Establece la velocidad del ventilador, salvo que ya sea la última que
+        se ha establecido. Las lecturas anteriores dejan de servir para
+        estimar la velocidad.
+        La escritura puede quedar pendiente hasta el final de la iteración
+        (ver agrupar_escrituras); si falla, la velocidad deja de darse por
+        establecida y se vuelve a leer en la siguiente iteración.
         """
-        log(run_command(f'-a=[fan:{self.get_f_num()}]/GPUTargetFanSpeed={veloc}')
-            .stdout.strip())
+        if veloc == self.__comandada:
+            return
+        get_metricas().contar('speed_writes_total', fan=self.get_f_num())
+        escribir('fan', self.get_f_num(), veloc, self.__escritura_fallida)
+        get_metricas().fijar('fan_commanded_percent', veloc, fan=self.get_f_num())
+        self.__filtro.reiniciar()
+        self.__comandada = veloc
+        self.__t_comandada = self.__t_verificada = get_reloj().ahora()
+
+
+    def __escritura_fallida(self, mensaje: str) -> None:
+        """Deja de dar por establecida la última velocidad, cuya escritura ha fallado."""
+        log(f'No se pudo poner el ventilador n.º {self.get_f_num()} al {self.__comandada} %: '
+            f'{mensaje}', ERROR, fan=self.get_f_num(), comandada=self.__comandada)
+        self.__comandada = None
 
 
     def buscar_objetivo(self, temp: int, gpu: GPU) -> tuple[int, int]:
@@ -204,10 +915,43 @@ class Fan:
         """
         if temp < gpu.get_t_min():
             return (0, self.get_v_min())
-        for t, f in self.get_curva().items():
-            if temp < t:
-                return (t, f)
-        return (gpu.get_t_max(), self.get_v_max())
+        tramo = self.get_curva().tramo(temp)
+        if tramo is None:
+            return (gpu.get_t_max(), self.get_v_max())
+        return tramo
+
+
+    def retener_bajada(self, temp: int, gpu: GPU, actual: int, objetivo: int) -> int:
+        """
+        Evita que el ventilador cambie de velocidad en cada iteración cuando
+        la temperatura oscila alrededor del comienzo de un tramo. Para ello,
+        una bajada de velocidad sólo se hace si:
+        - El ventilador lleva al menos get_permanencia() segundos a la
+          velocidad actual.
+        - La bajada sigue procediendo con la temperatura get_histeresis()
+          grados más alta; es decir, para subir de tramo basta con alcanzar
+          su temperatura, pero para bajar hay que quedar por debajo de ella
+          menos la histéresis. Esto vale también para apagar el ventilador
+          por debajo de t_min, lo que además evita volver a cebarlo. Cada
+          modo de control lo aplica a su manera (ver
+          Control.objetivo_bajada).
+        Devuelve el objetivo a usar, que es el actual si se retiene la bajada.
+        Las subidas no se retienen nunca.
+        """
+        if objetivo >= actual:
+            return objetivo
+        motivo = None
+        if get_reloj().ahora() - self.__t_comandada < self.get_permanencia():
+            motivo = 'permanencia'
+        else:
+            objetivo = self.get_control().objetivo_bajada(self, gpu, temp, objetivo)
+            if objetivo >= actual:
+                motivo = 'histeresis'
+        if motivo is None:
+            return objetivo
+        self.__retenidas += 1
+        get_metricas().contar('actuations_avoided_total', fan=self.get_f_num(), motivo=motivo)
+        return actual
 
 
     def siguiente_velocidad(self, actual: int, objetivo: int) -> int:
@@ -225,43 +969,50 @@ class Fan:
         if objetivo == self.get_v_min():
             return self.get_v_min()
         if actual < objetivo:
-            for v in self.__curva.values():
-                if v <= actual:
-                    continue
-                if v <= objetivo:
-                    return v
-            return self.get_v_max()
-        for v in reversed(self.__curva.values()):
-            if v >= actual:
-                continue
-            if v >= objetivo:
-                return v
-        return self.get_v_min()
+            v = self.get_curva().veloc_superior(actual)
+            return v if v is not None and v <= objetivo else self.get_v_max()
+        v = self.get_curva().veloc_inferior(actual)
+        return v if v is not None and v >= objetivo else self.get_v_min()
 
 
 class GPU:
     """Cada instancia de esta clase representa una GPU."""
 
-    __num_gpus: Optional[int] = None
-
 
     def __init__(self, g_num: int, params: dict[str, int], fans: list[Fan]) -> None:
         if g_num not in range(GPU.get_num_gpus()):
             error('El número de GPU está fuera del rango.')
         self.__g_num = g_num
         self.__fans = fans
+        self.configurar(params)
+        self.__control: Optional[int] = None
+        # Instante en que se escribió el estado de control, o None si hay que
+        # volver a escribirlo (ver mantener_control):
+        self.__t_control: Optional[float] = 0.0
+        for fan in fans:
+            try:
+                fan.get_curva().validar_temps(self.__t_min, self.__t_max)
+            except ValueError as e:
+                error(f'La curva del ventilador n.º {fan.get_f_num()} no es válida: {e}.')
+        fans_nums = [fan.get_f_num() for fan in fans]
+        log(f'Creada GPU n.º {g_num} con los siguientes ventiladores: {fans_nums!s}.')
+
+
+    def configurar(self, params: dict) -> None:
+        """Establece los parámetros de la GPU."""
         self.__t_min = params['t_min']
         self.__t_max = params['t_max']
         self.__t_fin = params['t_fin']
-        fans_nums = [fan.get_f_num() for fan in fans]
-        log(f'Creada GPU n.º {g_num} con los siguientes ventiladores: {fans_nums!s}.')
+        self.__sleep = params['sleep']
+        self.__sleep_ceb = params['sleep_ceb']
+        self.__anticipacion = params['anticipacion']
+        self.__salto_carga = params['salto_carga']
+
 
     @classmethod
     def get_num_gpus(cls) -> int:
         """Devuelve el número de GPUs que hay instaladas en la máquina."""
-        if cls.__num_gpus is None:
-            cls.__num_gpus = get_query_num('-q=gpus')
-        return cls.__num_gpus
+        return get_backend().get_num_gpus()
 
 
     def g_num(self) -> int:
@@ -269,13 +1020,29 @@ class GPU:
         return self.__g_num
 
 
-    def get_temp(self) -> int:
-        """Devuelve la temperatura actual (en ºC) de la GPU."""
-        temp = get_query_str(f'-q=[gpu:{self.g_num()}]/GPUCoreTemp')
-        log(f'Temp. actual: {temp} ºC')
+    def get_temp(self, inst: Optional[Instantanea] = None) -> int:
+        """
+        Devuelve la temperatura actual (en ºC) de la GPU. Si se indica una
+        instantánea, la temperatura se toma de ella.
+        """
+        if inst is not None:
+            temp = inst.get_temp(self.g_num())
+        else:
+            temp = get_backend().get_temp(self.g_num())
+        get_metricas().fijar('gpu_temperature_celsius', temp, gpu=self.g_num())
+        log(f'Temp. actual: {temp} ºC', gpu=self.g_num(), temp=temp)
         return temp
 
 
+    def get_carga(self, inst: Optional[Instantanea] = None) -> int:
+        """
+        Devuelve la carga actual (en %) de la GPU (ver Backend.get_carga). Si
+        se indica una instantánea y la incluye, la carga se toma de ella.
+        """
+        carga = inst.get_carga(self.g_num()) if inst is not None else None
+        return carga if carga is not None else get_backend().get_carga(self.g_num())
+
+
     def get_fans(self) -> list[Fan]:
         """Devuelve el número de ventiladores que tiene la GPU."""
         return self.__fans
@@ -307,99 +1074,2577 @@ class GPU:
         return self.__t_fin
 
 
-    def set_fan_control(self, estado: int) -> None:
+    def get_sleep(self) -> float:
         """
-        Activa o desactiva el GPUFanControlState para poder poner el control
-        en modo manual (estado == 1) o automático (estado == 0).
+        Devuelve los segundos de espera entre comprobaciones de la GPU (por
+        omisión, SLEEP).
         """
-        log(run_command(f'-a=[gpu:{self.g_num()}]/GPUFanControlState={estado}')
-            .stdout.strip())
-
-
-class Manager:
-    """
-    Representa el gestor que lleva a cabo el bucle de procesamiento principal
-    de supervisión y control de las temperaturas y los ventiladores de las GPUs
-    del sistema."""
-
-    __singleton: Optional[Manager] = None
+        return self.__sleep
 
 
-    @classmethod
-    def get_singleton(cls) -> Manager:
+    def get_sleep_ceb(self) -> float:
         """
-        Devuelve la única instancia de la clase Manager que debería haber.
+        Devuelve los segundos de espera entre comprobaciones de la GPU
+        mientras se está cebando alguno de sus ventiladores (por omisión,
+        SLEEP_CEB).
         """
-        if cls.__singleton is None:
-            cls.__singleton = Manager()
-        return cls.__singleton
-
-
-    def __init__(self):
-        self.__gpus = []
+        return self.__sleep_ceb
 
 
-    def get_gpus(self) -> list[GPU]:
+    def get_anticipacion(self) -> int:
         """
-        Devuelve la lista con las GPUs registradas en el manager.
+        Devuelve los grados de subida de temperatura que se anticipan por
+        cada 100 puntos que sube de golpe la carga de la GPU, o 0 si no se
+        anticipa (ver Anticipacion). Por omisión es ANTICIPACION.
         """
-        return self.__gpus
+        return self.__anticipacion
 
 
-    def set_gpus(self, gpus: list[GPU]) -> None:
+    def get_salto_carga(self) -> int:
         """
-        Establece la lista con las GPUs registradas en el manager.
+        Devuelve la subida de la carga (en puntos %) entre dos lecturas a
+        partir de la cual se anticipa (por omisión, SALTO_CARGA).
         """
-        self.__gpus = gpus
+        return self.__salto_carga
 
 
-    def get_temps(self) -> list[int]:
+    def get_umbrales(self) -> list[int]:
         """
-        Devuelve una lista con las temperaturas actuales de todas las GPUs
-        instaladas en el sistema y registradas en el manager.
+        Devuelve, ordenadas, las temperaturas a partir de las cuales cambia
+        la velocidad de alguno de los ventiladores de la GPU.
         """
-        return [gpu.get_temp() for gpu in self.get_gpus()]
+        umbrales = {self.get_t_min(), self.get_t_max()}
+        for fan in self.get_fans():
+            umbrales.update(fan.get_curva().get_temps())
+            if fan.get_modo() == 'pid':
+                umbrales.add(fan.get_consigna())
+        return sorted(umbrales)
 
 
-    def set_speeds(self, veloc: int) -> None:
+    def set_fan_control(self, estado: int) -> None:
+        """
+        Activa o desactiva el GPUFanControlState para poder poner el control
+        en modo manual (estado == 1) o automático (estado == 0), salvo que ya
+        esté en ese estado.
+        """
+        if estado == self.__control:
+            return
+        self.__escribir_control(estado)
+
+
+    def __escribir_control(self, estado: int) -> None:
+        """Escribe el estado de control indicado (ver agrupar_escrituras)."""
+        escribir('gpu', self.g_num(), estado, self.__escritura_fallida)
+        self.__control = estado
+        self.__t_control = get_reloj().ahora()
+
+
+    def invalidar_control(self) -> None:
+        """
+        Hace que mantener_control vuelva a escribir el estado de control en
+        la siguiente iteración, porque algún ventilador se ha desviado de la
+        velocidad establecida y puede que otro programa (o un reinicio del
+        controlador) haya puesto la GPU en modo automático.
+        """
+        self.__t_control = None
+
+
+    def mantener_control(self, escribiendo: bool) -> None:
+        """
+        Vuelve a poner la GPU en modo manual, salvo que se haya puesto en
+        modo automático a propósito, si no se pudo escribir el estado de
+        control, si se ha invalidado (ver invalidar_control) o si hace más de
+        VERIFICAR segundos que se escribió y en esta iteración se escriben
+        velocidades de sus ventiladores (escribiendo), que con
+        nvidia-settings van en el mismo proceso, así que en el estado
+        estable no cuesta nada.
+        """
+        if self.__control == 0:
+            return
+        if self.__control is None or self.__t_control is None \
+                or (escribiendo and get_reloj().ahora() - self.__t_control >= VERIFICAR):
+            self.__escribir_control(1)
+
+
+    def __escritura_fallida(self, mensaje: str) -> None:
+        """Deja de dar por establecido el último estado de control, cuya escritura ha fallado."""
+        log(f'No se pudo poner el GPUFanControlState de la GPU n.º {self.g_num()} a '
+            f'{self.__control}: {mensaje}', ERROR, gpu=self.g_num())
+        self.__control = None
+
+
+    def get_control(self) -> Optional[int]:
+        """
+        Devuelve el último estado de control establecido en la GPU, o None si
+        todavía no se ha establecido.
+        """
+        return self.__control
+
+
+class MuestreoAdaptativo:
+    """
+    Calcula el periodo de revisión de una GPU en el modo adaptativo a partir
+    de la velocidad a la que cambia su temperatura y de lo cerca que está
+    del siguiente umbral de la curva: el periodo se reduce a la mitad (hasta
+    SLEEP_MIN) cuando la temperatura sube rápido o va a alcanzar pronto un
+    umbral, y se duplica (hasta SLEEP_MAX) cuando la temperatura es estable.
+    """
+
+    PENDIENTE_RAPIDA = 0.5     # ºC/s a partir de los cuales se considera que sube rápido
+    PENDIENTE_ESTABLE = 0.02   # ºC/s por debajo de los cuales se considera estable
+
+
+    def __init__(self, periodo: float = SLEEP) -> None:
+        self.__periodo = periodo
+        self.__temp: Optional[int] = None
+        self.__t: float = 0.0
+        self.__pendiente = 0.0
+        self.__primera: Optional[float] = None
+        self.__lecturas = 0
+
+
+    def get_periodo(self) -> float:
+        """Devuelve el periodo de revisión actual, en segundos."""
+        return self.__periodo
+
+
+    def get_pendiente(self) -> float:
+        """Devuelve la pendiente suavizada de la temperatura, en ºC/s."""
+        return self.__pendiente
+
+
+    def get_periodo_efectivo(self) -> Optional[float]:
+        """
+        Devuelve el tiempo medio que ha pasado entre cada dos lecturas, o
+        None si todavía no hay suficientes.
+        """
+        if self.__lecturas < 2:
+            return None
+        return (self.__t - self.__primera) / (self.__lecturas - 1)
+
+
+    def actualizar(self, temp: int, ahora: float, umbrales: list[int]) -> None:
+        """Recalcula el periodo a partir de una nueva lectura de temperatura."""
+        self.__lecturas += 1
+        if self.__temp is None or ahora <= self.__t:
+            self.__temp, self.__t, self.__primera = temp, ahora, ahora
+            return
+        pendiente = (temp - self.__temp) / (ahora - self.__t)
+        self.__pendiente = (self.__pendiente + pendiente) / 2
+        self.__temp, self.__t = temp, ahora
+
+        if self.__pendiente >= 0:
+            i = bisect.bisect_right(umbrales, temp)
+            distancia = umbrales[i] - temp if i < len(umbrales) else None
+        else:
+            i = bisect.bisect_right(umbrales, temp) - 1
+            distancia = temp - umbrales[i] + 1 if i >= 0 else None
+        pendiente = abs(self.__pendiente)
+        hasta_umbral = distancia / pendiente if distancia is not None and pendiente > 0 else None
+
+        if self.__pendiente >= MuestreoAdaptativo.PENDIENTE_RAPIDA or \
+           (hasta_umbral is not None and hasta_umbral < 2 * self.__periodo):
+            periodo = self.__periodo / 2
+            if hasta_umbral is not None:
+                periodo = min(periodo, max(hasta_umbral / 2, SLEEP_MIN))
+            periodo = max(SLEEP_MIN, periodo)
+        elif pendiente < MuestreoAdaptativo.PENDIENTE_ESTABLE:
+            periodo = min(SLEEP_MAX, self.__periodo * 2)
+        else:
+            periodo = self.__periodo
+        self.__periodo = periodo
+
+
+class Anticipacion:
+    """
+    Anticipación (feed-forward) de la carga de una GPU. Cuando su carga sube
+    de golpe al menos get_salto_carga() puntos entre dos lecturas, sus
+    ventiladores se controlan como si la GPU estuviera ya a la temperatura
+    a la que va a llegar (get_anticipacion() ºC más por cada 100 puntos de
+    subida), sin esperar a que se caliente. La anticipación termina cuando
+    la temperatura la confirma:
+    - al alcanzar la temperatura anticipada,
+    - al dejar de subir una vez pasados ESTABILIZACION segundos, o
+    - al volver a bajar la carga.
+    A partir de ahí, los ventiladores bajan con la histéresis y la
+    permanencia de siempre.
+    """
+
+    def __init__(self) -> None:
+        self.__carga: Optional[int] = None
+        self.__carga_base = 0
+        self.__temp_base = 0
+        self.__temp: Optional[int] = None
+        self.__t_inicio = 0.0
+
+
+    def get_carga(self) -> Optional[int]:
+        """Devuelve la última carga leída de la GPU (en %), o None si no se ha leído."""
+        return self.__carga
+
+
+    def get_temp_anticipada(self) -> Optional[int]:
+        """Devuelve la temperatura anticipada, o None si no se está anticipando."""
+        return self.__temp
+
+
+    def temperatura(self, temp: int) -> int:
+        """
+        Devuelve la temperatura a la que se controlan los ventiladores, que
+        es la mayor de la indicada y la anticipada.
+        """
+        return temp if self.__temp is None else max(temp, self.__temp)
+
+
+    def actualizar(self, gpu: GPU, temp: int, carga: int, pendiente: float, ahora: float) -> None:
+        """
+        Anota una nueva lectura de la temperatura y de la carga de la GPU,
+        siendo pendiente la de la temperatura (en ºC/s), y empieza, ajusta o
+        termina la anticipación.
+        """
+        g_num = gpu.g_num()
+        anterior, self.__carga = self.__carga, carga
+        get_metricas().fijar('gpu_load_percent', carga, gpu=g_num)
+        if self.__temp is None:
+            if anterior is None or carga - anterior < gpu.get_salto_carga():
+                return
+            self.__carga_base, self.__temp_base, self.__t_inicio = anterior, temp, ahora
+            self.__temp = temp
+            get_metricas().contar('anticipations_total', gpu=g_num)
+        elif temp >= self.__temp or carga - self.__carga_base < gpu.get_salto_carga() / 2 or \
+                (ahora - self.__t_inicio >= ESTABILIZACION and pendiente < MuestreoAdaptativo.PENDIENTE_ESTABLE):
+            log(f'GPU n.º {g_num} a {temp} ºC con una carga del {carga} %: se deja de anticipar.',
+                DEBUG, gpu=g_num, temp=temp, carga=carga)
+            self.__temp = None
+            get_metricas().fijar('gpu_anticipated_celsius', 0, gpu=g_num)
+            return
+        # Si la carga sigue subiendo, se anticipa más:
+        temp_anticipada = self.__temp_base + round(gpu.get_anticipacion() * (carga - self.__carga_base) / 100)
+        if temp_anticipada > self.__temp:
+            log(f'GPU n.º {g_num}: la carga ha subido del {self.__carga_base} % al {carga} %; '
+                f'se controla como si estuviera a {temp_anticipada} ºC.',
+                gpu=g_num, temp=temp, carga=carga, anticipada=temp_anticipada)
+            self.__temp = temp_anticipada
+            get_metricas().fijar('gpu_anticipated_celsius', temp_anticipada, gpu=g_num)
+
+
+    def reiniciar(self) -> None:
+        """Olvida las lecturas y termina la anticipación, si la había."""
+        self.__carga = None
+        self.__temp = None
+
+
+class Circuito:
+    """
+    Cortacircuitos del acceso al hardware de una GPU. Cuenta las iteraciones
+    seguidas de la GPU en las que ha fallado alguna lectura o escritura y,
+    al llegar a FALLOS_MAX, se abre y deja la GPU en un estado seguro según
+    ACCION_FALLO: en modo automático ('auto'), para que el controlador
+    vuelva a encargarse de los ventiladores, o con ellos a v_max ('v_max').
+    Mientras está abierto, la GPU sólo se revisa cada REPOSO_CIRCUITO
+    segundos, y en cuanto una de esas iteraciones sale bien, se cierra y se
+    retoma el control.
+    """
+
+    def __init__(self, gpu: GPU) -> None:
+        self.__gpu = gpu
+        self.__fallos = 0
+        self.__abierto = False
+
+
+    def abierto(self) -> bool:
+        """Indica si se ha aplicado ACCION_FALLO y todavía no se ha recuperado la GPU."""
+        return self.__abierto
+
+
+    def get_fallos(self) -> int:
+        """Devuelve el número de iteraciones seguidas de la GPU que han fallado."""
+        return self.__fallos
+
+
+    def exito(self) -> None:
+        """Anota una iteración sin errores, que cierra el circuito si estaba abierto."""
+        self.__fallos = 0
+        if self.__abierto:
+            self.__abierto = False
+            get_metricas().fijar('circuit_open', 0, gpu=self.__gpu.g_num())
+            log(f'GPU n.º {self.__gpu.g_num()}: el hardware vuelve a responder y se '
+                f'retoma el control de sus ventiladores.', WARNING, gpu=self.__gpu.g_num())
+
+
+    def fallo(self, motivo: str) -> None:
+        """
+        Anota una iteración con errores. A partir de FALLOS_MAX seguidas,
+        abre el circuito y aplica ACCION_FALLO, que se repite en cada fallo
+        mientras siga abierto por si tampoco se pudo escribir.
+        """
+        g_num = self.__gpu.g_num()
+        self.__fallos += 1
+        if self.__fallos < FALLOS_MAX:
+            return
+        if not self.__abierto:
+            self.__abierto = True
+            get_metricas().contar('circuit_trips_total', gpu=g_num)
+            get_metricas().fijar('circuit_open', 1, gpu=g_num)
+            accion = 'puesta en modo automático' if ACCION_FALLO == 'auto' \
+                else 'ventiladores al máximo'
+            log(f'GPU n.º {g_num}: {self.__fallos} iteraciones seguidas con errores '
+                f'({motivo}); {accion} hasta que el hardware vuelva a responder.', ERROR, gpu=g_num)
+        with agrupar_escrituras() as lote:
+            if ACCION_FALLO == 'auto':
+                self.__gpu.set_fan_control(0)
+                # El controlador cambiará las velocidades; al recuperar la GPU
+                # hay que volver a leerlas:
+                for fan in self.__gpu.get_fans():
+                    fan.invalidar()
+            else:
+                self.__gpu.set_fan_control(1)
+                for fan in self.__gpu.get_fans():
+                    fan.set_speed(fan.get_v_max())
+        if lote.get_errores():
+            log(f'GPU n.º {g_num}: no se pudo aplicar ACCION_FALLO; se volverá a intentar.',
+                ERROR, gpu=g_num)
+
+
+    def recuperar(self) -> None:
+        """
+        Prepara la iteración con la que se intenta recuperar la GPU: si se
+        puso en modo automático, se vuelve a poner en modo manual.
+        """
+        if self.__abierto and ACCION_FALLO == 'auto':
+            self.__gpu.set_fan_control(1)
+
+
+class Instantanea:
+    """
+    Representa las lecturas de temperaturas, cargas y velocidades de las
+    GPUs y ventiladores registrados en el manager, tomadas todas ellas en
+    una sola invocación de nvidia-settings.
+    """
+
+    def __init__(self, temps: dict[int, int], muestras: dict[int, list[int]],
+                 targets: dict[int, int], cargas: Optional[dict[int, int]] = None) -> None:
+        self.__temps = temps
+        self.__muestras = muestras
+        self.__targets = targets
+        self.__cargas = cargas if cargas is not None else {}
+
+
+    def get_temp(self, g_num: int) -> int:
+        """Devuelve la temperatura leída de la GPU indicada."""
+        return self.__temps[g_num]
+
+
+    def get_muestras(self, f_num: int) -> list[int]:
+        """
+        Devuelve las muestras de velocidad leídas del ventilador indicado.
+        """
+        return self.__muestras.get(f_num, [])
+
+
+    def get_target(self, f_num: int) -> Optional[int]:
+        """
+        Devuelve la velocidad objetivo leída del ventilador indicado, o None
+        si no se ha consultado.
+        """
+        return self.__targets.get(f_num)
+
+
+    def get_carga(self, g_num: int) -> Optional[int]:
+        """
+        Devuelve la carga leída de la GPU indicada (ver Backend.get_carga), o
+        None si no se ha consultado.
+        """
+        return self.__cargas.get(g_num)
+
+
+class LoteEscrituras:
+    """
+    Escrituras pendientes de velocidades de ventiladores y estados de
+    control de GPUs, que se envían juntas al backend con enviar (con
+    nvidia-settings, en un único proceso). Si se escribe varias veces el
+    mismo ventilador o GPU, sólo se envía el último valor.
+    Cada escritura lleva una función a la que se llama con el mensaje de
+    error si falla, para que quien la pidió deje de darla por hecha.
+    Es seguro usarlo desde varios hilos a la vez.
+    """
+
+    def __init__(self) -> None:
+        self.__cerrojo = threading.Lock()
+        self.__pendientes: dict[tuple[str, int], tuple[int, Callable[[str], None]]] = {}
+        self.__errores: dict[tuple[str, int], str] = {}
+
+
+    def añadir(self, tipo: str, num: int, valor: int, al_fallar: Callable[[str], None]) -> None:
+        """
+        Añade una escritura: la velocidad del ventilador num (tipo 'fan') o
+        el estado de control de la GPU num (tipo 'gpu').
+        """
+        with self.__cerrojo:
+            self.__pendientes[(tipo, num)] = (valor, al_fallar)
+
+
+    def get_errores(self) -> dict[tuple[str, int], str]:
+        """
+        Devuelve los errores de las escrituras que han fallado en los envíos
+        hechos hasta ahora, como {(tipo, num): mensaje}.
+        """
+        return self.__errores
+
+
+    def enviar(self) -> dict[tuple[str, int], str]:
+        """
+        Envía las escrituras pendientes al backend y devuelve los errores de
+        las que hayan fallado (ver get_errores).
+        """
+        with self.__cerrojo:
+            pendientes, self.__pendientes = self.__pendientes, {}
+        if not pendientes:
+            return {}
+        controles = {num: valor for (tipo, num), (valor, _) in pendientes.items() if tipo == 'gpu'}
+        veloces = {num: valor for (tipo, num), (valor, _) in pendientes.items() if tipo == 'fan'}
+        get_metricas().contar('write_batches_total')
+        with get_metricas().medir('write_seconds'):
+            try:
+                mensaje, errores = get_backend().escribir_lote(controles, veloces)
+            except (OSError, ValueError) as e:
+                # Por ejemplo, si nvidia-settings no responde: no se sabe
+                # cuáles se han hecho, así que se dan todas por fallidas.
+                mensaje, errores = '', dict.fromkeys(pendientes, str(e))
+        if mensaje:
+            log(mensaje)
+        for (tipo, num), error_escritura in errores.items():
+            get_metricas().contar('write_errors_total', **{tipo: num})
+            pendientes[(tipo, num)][1](error_escritura)
+        self.__errores.update(errores)
+        return errores
+
+
+class Backend:
+    """
+    Interfaz común de acceso al hardware. GPU, Fan y Manager sólo leen
+    temperaturas y velocidades, y escriben velocidades y estados de control,
+    a través de una instancia de esta clase (ver get_backend).
+    Los métodos de escritura devuelven un mensaje para el registro.
+    """
+
+    def get_num_gpus(self) -> int:
+        """Devuelve el número de GPUs instaladas."""
+        raise NotImplementedError
+
+
+    def get_num_fans(self) -> int:
+        """Devuelve el número de ventiladores instalados."""
+        raise NotImplementedError
+
+
+    def descubrir(self) -> dict[int, list[int]]:
+        """
+        Devuelve los ventiladores de cada GPU instalada, como {g_num:
+        [f_num, ...]}. Lanza ValueError si no se puede averiguar.
+        """
+        raise NotImplementedError
+
+
+    def get_identidad(self) -> Optional[dict]:
+        """
+        Devuelve lo que identifica al hardware para guardar en caché lo que
+        devuelve descubrir (ver obtener_topologia), o None si no merece la
+        pena guardarlo. Por omisión, None.
+        """
+        return None
+
+
+    def set_topologia(self, topologia: dict[int, list[int]]) -> None:
+        """
+        Da a conocer al backend la topología leída de la caché, para que no
+        tenga que consultar el número de GPUs y ventiladores.
+        """
+
+
+    def get_temp(self, g_num: int) -> int:
+        """Devuelve la temperatura actual (en ºC) de la GPU indicada."""
+        raise NotImplementedError
+
+
+    def get_carga(self, g_num: int) -> int:
+        """
+        Devuelve la carga actual (en %) de la GPU indicada: la mayor de su
+        utilización y de su consumo respecto a su límite de potencia, si el
+        backend lo puede leer.
+        """
+        raise NotImplementedError
+
+
+    def get_speed(self, f_num: int) -> int:
+        """Devuelve una lectura de la velocidad actual del ventilador."""
+        raise NotImplementedError
+
+
+    def get_target(self, f_num: int) -> int:
+        """Devuelve la velocidad objetivo actual del ventilador."""
+        raise NotImplementedError
+
+
+    def set_speed(self, f_num: int, veloc: int) -> str:
+        """Establece la velocidad objetivo del ventilador."""
+        raise NotImplementedError
+
+
+    def set_fan_control(self, g_num: int, estado: int) -> str:
+        """
+        Pone el control de los ventiladores de la GPU en modo manual
+        (estado == 1) o automático (estado == 0).
+        """
+        raise NotImplementedError
+
+
+    def escribir_lote(self, controles: dict[int, int],
+                      veloces: dict[int, int]) -> tuple[str, dict[tuple[str, int], str]]:
+        """
+        Establece a la vez los estados de control de las GPUs ({g_num:
+        estado}) y las velocidades de los ventiladores ({f_num: veloc}):
+        primero los que pasan a modo manual, luego las velocidades y por
+        último los que vuelven a modo automático.
+        Devuelve un mensaje para el registro y los errores de las escrituras
+        que hayan fallado, como {('gpu', g_num) o ('fan', f_num): mensaje}.
+        Por omisión hace cada escritura por separado.
+        """
+        mensajes = []
+        errores = {}
+        for (tipo, num), valor in orden_escrituras(controles, veloces):
+            try:
+                if tipo == 'gpu':
+                    mensajes.append(self.set_fan_control(num, valor))
+                else:
+                    mensajes.append(self.set_speed(num, valor))
+            except (OSError, ValueError) as e:
+                errores[(tipo, num)] = str(e)
+        return '\n'.join(m for m in mensajes if m), errores
+
+
+    def leer_instantanea(self, g_nums: list[int], muestras: dict[int, int],
+                         targets: bool, cargas: Optional[list[int]] = None) -> Instantanea:
+        """
+        Lee las temperaturas de las GPUs, las muestras de velocidad (tantas
+        como indique muestras para cada ventilador) y, si se pide, las
+        velocidades objetivo de los ventiladores, y las cargas de las GPUs
+        indicadas en cargas.
+        Por omisión hace una lectura independiente para cada valor.
+        """
+        temps = {g: self.get_temp(g) for g in g_nums}
+        veloces = {f: [self.get_speed(f) for _ in range(n)] for f, n in muestras.items()}
+        objetivos = {f: self.get_target(f) for f in muestras} if targets else {}
+        return Instantanea(temps, veloces, objetivos, {g: self.get_carga(g) for g in cargas or []})
+
+
+class NvidiaSettingsBackend(Backend):
+    """
+    Acceso al hardware mediante el comando nvidia-settings. Cada operación
+    supone lanzar un proceso y necesita una pantalla X.
+    """
+
+    def __init__(self) -> None:
+        self.__num_gpus: Optional[int] = None
+        self.__num_fans: Optional[int] = None
+
+
+    def get_num_gpus(self) -> int:
+        if self.__num_gpus is None:
+            self.__num_gpus = get_query_num('-q=gpus')
+        return self.__num_gpus
+
+
+    def get_num_fans(self) -> int:
+        if self.__num_fans is None:
+            self.__num_fans = get_query_num('-q=fans')
+        return self.__num_fans
+
+
+    def descubrir(self) -> dict[int, list[int]]:
+        """
+        Lista las GPUs y los ventiladores en una sola invocación de
+        nvidia-settings, cuya salida detallada indica los ventiladores
+        conectados a cada GPU (ver leer_topologia).
+        """
+        topologia = leer_topologia(run_command('-q=gpus', '-q=fans', '--verbose=all', terse=False).stdout)
+        self.set_topologia(topologia)
+        return topologia
+
+
+    def get_identidad(self) -> Optional[dict]:
+        return identidad_controlador()
+
+
+    def set_topologia(self, topologia: dict[int, list[int]]) -> None:
+        self.__num_gpus = len(topologia)
+        self.__num_fans = sum(len(fans) for fans in topologia.values())
+
+
+    def get_temp(self, g_num: int) -> int:
+        return get_query_str(f'-q=[gpu:{g_num}]/GPUCoreTemp')
+
+
+    def get_carga(self, g_num: int) -> int:
+        """
+        nvidia-settings no da el consumo de la GPU, así que la carga es su
+        utilización.
+        """
+        return leer_utilizacion(run_command(f'-q=[gpu:{g_num}]/GPUUtilization').stdout)
+
+
+    def get_speed(self, f_num: int) -> int:
+        return get_query_str(f'-q=[fan:{f_num}]/GPUCurrentFanSpeed')
+
+
+    def get_target(self, f_num: int) -> int:
+        return get_query_str(f'-q=[fan:{f_num}]/GPUTargetFanSpeed')
+
+
+    def set_speed(self, f_num: int, veloc: int) -> str:
+        return run_command(f'-a=[fan:{f_num}]/GPUTargetFanSpeed={veloc}').stdout.strip()
+
+
+    def set_fan_control(self, g_num: int, estado: int) -> str:
+        return run_command(f'-a=[gpu:{g_num}]/GPUFanControlState={estado}').stdout.strip()
+
+
+    def escribir_lote(self, controles: dict[int, int],
+                      veloces: dict[int, int]) -> tuple[str, dict[tuple[str, int], str]]:
+        """
+        Hace todas las escrituras en una sola invocación de nvidia-settings.
+        """
+        atributos = {'gpu': 'GPUFanControlState', 'fan': 'GPUTargetFanSpeed'}
+        destinos = {f'[{tipo}:{num}]/{atributos[tipo]}={valor}': (tipo, num)
+                    for (tipo, num), valor in orden_escrituras(controles, veloces)}
+        salida, errores = asignar_lote(list(destinos))
+        return salida, {destinos[asignacion]: e for asignacion, e in errores.items()}
+
+
+    def leer_instantanea(self, g_nums: list[int], muestras: dict[int, int],
+                         targets: bool, cargas: Optional[list[int]] = None) -> Instantanea:
+        """
+        Hace todas las consultas en una sola invocación de nvidia-settings.
+        """
+        cargas = cargas or []
+        consultas = [f'-q=[gpu:{g}]/GPUCoreTemp' for g in g_nums]
+        consultas += [f'-q=[gpu:{g}]/GPUUtilization' for g in cargas]
+        for f, n in muestras.items():
+            consultas += [f'-q=[fan:{f}]/GPUCurrentFanSpeed'] * n
+            if targets:
+                consultas.append(f'-q=[fan:{f}]/GPUTargetFanSpeed')
+        respuestas = iter(consultar_lote(consultas))
+        temps = {g: int(next(respuestas)) for g in g_nums}
+        utilizaciones = {g: leer_utilizacion(next(respuestas)) for g in cargas}
+        respuestas = iter(int(r) for r in respuestas)
+        veloces = {}
+        objetivos = {}
+        for f, n in muestras.items():
+            veloces[f] = [next(respuestas) for _ in range(n)]
+            if targets:
+                objetivos[f] = next(respuestas)
+        return Instantanea(temps, veloces, objetivos, utilizaciones)
+
+
+class NvmlBackend(Backend):
+    """
+    Acceso al hardware dentro del propio proceso mediante la biblioteca NVML
+    (libnvidia-ml), cargada con ctypes. Mantiene abierta la sesión de NVML
+    y los manejadores de los dispositivos durante toda la ejecución, y no
+    necesita pantalla X.
+    Los ventiladores se numeran globalmente en el orden de las GPUs, igual
+    que hace nvidia-settings.
+    """
+
+    NVML_TEMPERATURE_GPU = 0
+    NVML_FAN_POLICY_TEMPERATURE_CONTINOUS_SW = 0
+    NVML_FAN_POLICY_MANUAL = 1
+
+
+    class Utilizacion(ctypes.Structure):
+        """Estructura nvmlUtilization_t."""
+        _fields_ = [('gpu', ctypes.c_uint), ('memory', ctypes.c_uint)]
+
+
+    def __init__(self, biblioteca: str = 'libnvidia-ml.so.1') -> None:
+        try:
+            self.__nvml = ctypes.CDLL(biblioteca)
+        except OSError as e:
+            raise ValueError(f'No se pudo cargar {biblioteca}: {e}') from e
+        self.__nvml.nvmlErrorString.restype = ctypes.c_char_p
+        self.__llamar('nvmlInit_v2')
+        atexit.register(self.cerrar)
+        cuenta = ctypes.c_uint()
+        self.__llamar('nvmlDeviceGetCount_v2', ctypes.byref(cuenta))
+        self.__handles: list[ctypes.c_void_p] = []
+        self.__fans: list[tuple[int, int]] = []
+        self.__limites: dict[int, Optional[int]] = {}
+        for g_num in range(cuenta.value):
+            handle = ctypes.c_void_p()
+            self.__llamar('nvmlDeviceGetHandleByIndex_v2', g_num, ctypes.byref(handle))
+            self.__handles.append(handle)
+            num = ctypes.c_uint()
+            self.__llamar('nvmlDeviceGetNumFans', handle, ctypes.byref(num))
+            self.__fans += [(g_num, local) for local in range(num.value)]
+
+
+    def __llamar(self, funcion: str, *args) -> None:
+        """
+        Llama a la función indicada de NVML y lanza ValueError si no tiene
+        éxito.
+        Las llamadas a NVML se hacen dentro del propio proceso y no se pueden
+        interrumpir, así que no tienen plazo (ver TIMEOUT_COMANDO), aunque
+        su duración y sus fallos se cuentan igual en las métricas.
+        """
+        with get_metricas().medir('hardware_call_seconds', backend='nvml'):
+            ret = getattr(self.__nvml, funcion)(*args)
+        if ret != 0:
+            get_metricas().contar('hardware_failures_total', backend='nvml', motivo='error')
+            msg = self.__nvml.nvmlErrorString(ret).decode()
+            raise ValueError(f'{funcion} ha fallado: {msg}')
+
+
+    def __leer_fan(self, funcion: str, f_num: int) -> int:
+        """Lee un valor entero de NVML para el ventilador indicado."""
+        g_num, local = self.__fans[f_num]
+        valor = ctypes.c_uint()
+        self.__llamar(funcion, self.__handles[g_num], local, ctypes.byref(valor))
+        return valor.value
+
+
+    def cerrar(self) -> None:
+        """Cierra la sesión de NVML."""
+        self.__nvml.nvmlShutdown()
+
+
+    def get_num_gpus(self) -> int:
+        return len(self.__handles)
+
+
+    def get_num_fans(self) -> int:
+        return len(self.__fans)
+
+
+    def descubrir(self) -> dict[int, list[int]]:
+        topologia: dict[int, list[int]] = {g_num: [] for g_num in range(len(self.__handles))}
+        for f_num, (g_num, _) in enumerate(self.__fans):
+            topologia[g_num].append(f_num)
+        return topologia
+
+
+    def get_temp(self, g_num: int) -> int:
+        temp = ctypes.c_uint()
+        self.__llamar('nvmlDeviceGetTemperature', self.__handles[g_num],
+                      NvmlBackend.NVML_TEMPERATURE_GPU, ctypes.byref(temp))
+        return temp.value
+
+
+    def get_carga(self, g_num: int) -> int:
+        """
+        Si la GPU no permite leer su límite de potencia (lo que se comprueba
+        sólo la primera vez), la carga es sólo su utilización.
+        """
+        handle = self.__handles[g_num]
+        utilizacion = NvmlBackend.Utilizacion()
+        self.__llamar('nvmlDeviceGetUtilizationRates', handle, ctypes.byref(utilizacion))
+        if g_num not in self.__limites:
+            limite = ctypes.c_uint()
+            try:
+                self.__llamar('nvmlDeviceGetEnforcedPowerLimit', handle, ctypes.byref(limite))
+            except ValueError:
+                self.__limites[g_num] = None
+            else:
+                self.__limites[g_num] = limite.value or None
+        if self.__limites[g_num] is None:
+            return utilizacion.gpu
+        consumo = ctypes.c_uint()
+        self.__llamar('nvmlDeviceGetPowerUsage', handle, ctypes.byref(consumo))
+        return max(utilizacion.gpu, min(round(100 * consumo.value / self.__limites[g_num]), 100))
+
+
+    def get_speed(self, f_num: int) -> int:
+        return self.__leer_fan('nvmlDeviceGetFanSpeed_v2', f_num)
+
+
+    def get_target(self, f_num: int) -> int:
+        return self.__leer_fan('nvmlDeviceGetTargetFanSpeed', f_num)
+
+
+    def set_speed(self, f_num: int, veloc: int) -> str:
+        g_num, local = self.__fans[f_num]
+        self.__llamar('nvmlDeviceSetFanSpeed_v2', self.__handles[g_num], local, veloc)
+        return f'Ventilador n.º {f_num} puesto al {veloc} %.'
+
+
+    def set_fan_control(self, g_num: int, estado: int) -> str:
+        handle = self.__handles[g_num]
+        for g, local in self.__fans:
+            if g != g_num:
+                continue
+            if estado:
+                self.__llamar('nvmlDeviceSetFanControlPolicy', handle, local,
+                              NvmlBackend.NVML_FAN_POLICY_MANUAL)
+            else:
+                self.__llamar('nvmlDeviceSetDefaultFanSpeed_v2', handle, local)
+                self.__llamar('nvmlDeviceSetFanControlPolicy', handle, local,
+                              NvmlBackend.NVML_FAN_POLICY_TEMPERATURE_CONTINOUS_SW)
+        modo = 'manual' if estado else 'automático'
+        return f'Control de ventiladores de la GPU n.º {g_num} en modo {modo}.'
+
+
+class FakeBackend(Backend):
+    """
+    Backend en memoria para pruebas en máquinas sin GPU (ver tests/). Las
+    temperaturas se fijan con set_temp, los ventiladores alcanzan al
+    instante la velocidad que se les pide, todas las escrituras quedan
+    anotadas en get_escrituras y con set_averiada se puede hacer que falle
+    el acceso a una GPU.
+    """
+
+    def __init__(self, fans_gpus: dict[int, int], temp: int = 40) -> None:
+        """fans_gpus asocia cada número de ventilador con su GPU."""
+        self.__fans_gpus = fans_gpus
+        num_gpus = max(fans_gpus.values(), default=-1) + 1
+        self.__temps = {g: temp for g in range(num_gpus)}
+        self.__veloces = {f: 0 for f in fans_gpus}
+        self.__control = {g: 0 for g in range(num_gpus)}
+        self.__cargas = {g: 0 for g in range(num_gpus)}
+        self.__escrituras: list[tuple[str, int, int]] = []
+        self.__averiadas: set[int] = set()
+
+
+    def set_averiada(self, g_num: int, averiada: bool = True) -> None:
+        """
+        Hace que fallen (o dejen de fallar) todas las lecturas y escrituras
+        de la GPU indicada y de sus ventiladores, como si su hardware no
+        respondiera.
+        """
+        if averiada:
+            self.__averiadas.add(g_num)
+        else:
+            self.__averiadas.discard(g_num)
+
+
+    def __comprobar(self, g_num: int) -> None:
+        """Lanza ValueError si la GPU indicada está averiada."""
+        if g_num in self.__averiadas:
+            raise ValueError(f'la GPU n.º {g_num} no responde')
+
+
+    def set_temp(self, g_num: int, temp: int) -> None:
+        """Fija la temperatura de la GPU indicada."""
+        self.__temps[g_num] = temp
+
+
+    def set_carga(self, g_num: int, carga: int) -> None:
+        """Fija la carga (en %) de la GPU indicada."""
+        self.__cargas[g_num] = carga
+
+
+    def get_control(self, g_num: int) -> int:
+        """Devuelve el estado de control actual de la GPU indicada."""
+        return self.__control[g_num]
+
+
+    def get_escrituras(self) -> list[tuple[str, int, int]]:
+        """
+        Devuelve las escrituras realizadas, como tuplas (atributo, número,
+        valor).
+        """
+        return self.__escrituras
+
+
+    def get_num_gpus(self) -> int:
+        return len(self.__temps)
+
+
+    def get_num_fans(self) -> int:
+        return len(self.__fans_gpus)
+
+
+    def descubrir(self) -> dict[int, list[int]]:
+        return topologia_de(self.__fans_gpus, len(self.__temps))
+
+
+    def get_temp(self, g_num: int) -> int:
+        self.__comprobar(g_num)
+        return self.__temps[g_num]
+
+
+    def get_carga(self, g_num: int) -> int:
+        self.__comprobar(g_num)
+        return self.__cargas[g_num]
+
+
+    def get_speed(self, f_num: int) -> int:
+        self.__comprobar(self.__fans_gpus[f_num])
+        return self.__veloces[f_num]
+
+
+    def get_target(self, f_num: int) -> int:
+        self.__comprobar(self.__fans_gpus[f_num])
+        return self.__veloces[f_num]
+
+
+    def set_speed(self, f_num: int, veloc: int) -> str:
+        self.__comprobar(self.__fans_gpus[f_num])
+        self.__veloces[f_num] = veloc
+        self.__escrituras.append(('GPUTargetFanSpeed', f_num, veloc))
+        return f'Ventilador n.º {f_num} puesto al {veloc} %.'
+
+
+    def set_fan_control(self, g_num: int, estado: int) -> str:
+        self.__comprobar(g_num)
+        self.__control[g_num] = estado
+        self.__escrituras.append(('GPUFanControlState', g_num, estado))
+        return f'GPUFanControlState de la GPU n.º {g_num} puesto a {estado}.'
+
+
+class SimBackend(Backend):
+    """
+    Simulador térmico de las GPUs para ajustar la curva y los parámetros sin
+    hardware. Debe usarse junto con un RelojVirtual, ya que el modelo avanza
+    según el tiempo que marca el reloj.
+
+    Cada GPU se modela como un único cuerpo térmico que recibe una potencia
+    (la de reposo más la de la carga actual) y se enfría hacia la temperatura
+    ambiente tanto más rápido cuanto más rápido giran sus ventiladores. La
+    carga alterna entre fases de reposo y de trabajo de duración aleatoria.
+    Los ventiladores tardan en alcanzar la velocidad pedida, y sus lecturas
+    tienen ruido, que por debajo de V_CEB se vuelve errático (incluso fuera
+    del rango 0-100) como ocurre con el hardware real.
+    """
+
+    T_AMB = 30.0          # Temperatura ambiente (ºC)
+    P_REPOSO = 20.0       # Potencia disipada en reposo (W)
+    P_CARGA = 250.0       # Potencia adicional disipada a plena carga (W)
+    CAPACIDAD = 400.0     # Capacidad térmica de la GPU (J/ºC)
+    G_PASIVA = 1.5        # Conductancia térmica con el ventilador parado (W/ºC)
+    G_VENTILADOR = 6.0    # Conductancia adicional con el ventilador al 100 % (W/ºC)
+    TAU_VENTILADOR = 2.0  # Constante de tiempo del ventilador (s)
+    FASE_MEDIA = 1800.0   # Duración media de cada fase de carga o reposo (s)
+    PASO = 1.0            # Paso máximo de integración del modelo (s)
+
+
+    def __init__(self, fans_gpus: dict[int, int], semilla: int = 0) -> None:
+        """fans_gpus asocia cada número de ventilador con su GPU."""
+        self.__fans_gpus = fans_gpus
+        num_gpus = max(fans_gpus.values(), default=-1) + 1
+        self.__rnd = random.Random(semilla)
+        self.__t = get_reloj().ahora()
+        self.__temps = [SimBackend.T_AMB + 10.0] * num_gpus
+        self.__cargas = [0.0] * num_gpus
+        self.__fin_fase = [self.__nueva_fase() for _ in range(num_gpus)]
+        self.__t_max = [0.0] * num_gpus
+        self.__temp_max = list(self.__temps)
+        self.__targets = {f: 0 for f in fans_gpus}
+        self.__reales = {f: 0.0 for f in fans_gpus}
+        self.__cambios = {f: 0 for f in fans_gpus}
+        self.__control = [0] * num_gpus
+        self.__cerrojo = threading.Lock()
+
+
+    def __nueva_fase(self) -> float:
+        """Devuelve el instante en que acabará una fase que empieza ahora."""
+        return self.__t + self.__rnd.expovariate(1 / SimBackend.FASE_MEDIA)
+
+
+    def __avanzar(self) -> None:
+        """Hace avanzar el modelo hasta el instante actual del reloj."""
+        ahora = get_reloj().ahora()
+        while self.__t < ahora:
+            dt = min(SimBackend.PASO, ahora - self.__t)
+            self.__t += dt
+            for f, g in self.__fans_gpus.items():
+                real = self.__reales[f]
+                real += (self.__targets[f] - real) * min(1.0, dt / SimBackend.TAU_VENTILADOR)
+                self.__reales[f] = real
+            for g, temp in enumerate(self.__temps):
+                if self.__t >= self.__fin_fase[g]:
+                    self.__cargas[g] = 0.0 if self.__cargas[g] else self.__rnd.uniform(0.5, 1.0)
+                    self.__fin_fase[g] = self.__nueva_fase()
+                fans = [self.__reales[f] for f, fg in self.__fans_gpus.items() if fg == g]
+                veloc = sum(fans) / len(fans) if fans else 0.0
+                potencia = SimBackend.P_REPOSO + SimBackend.P_CARGA * self.__cargas[g]
+                g_total = SimBackend.G_PASIVA + SimBackend.G_VENTILADOR * veloc / 100
+                temp += (potencia - g_total * (temp - SimBackend.T_AMB)) * dt / SimBackend.CAPACIDAD
+                self.__temps[g] = temp
+                self.__temp_max[g] = max(self.__temp_max[g], temp)
+                if temp > T_MAX:
+                    self.__t_max[g] += dt
+
+
+    def get_t_sobre_max(self, g_num: int) -> float:
+        """Devuelve los segundos que la GPU ha pasado por encima de T_MAX."""
+        return self.__t_max[g_num]
+
+
+    def get_temp_max(self, g_num: int) -> float:
+        """Devuelve la temperatura máxima alcanzada por la GPU."""
+        return self.__temp_max[g_num]
+
+
+    def get_cambios(self, f_num: int) -> int:
+        """
+        Devuelve el número de veces que se ha cambiado la velocidad del
+        ventilador.
+        """
+        return self.__cambios[f_num]
+
+
+    def get_num_gpus(self) -> int:
+        return len(self.__temps)
+
+
+    def get_num_fans(self) -> int:
+        return len(self.__fans_gpus)
+
+
+    def descubrir(self) -> dict[int, list[int]]:
+        return topologia_de(self.__fans_gpus, len(self.__temps))
+
+
+    def get_temp(self, g_num: int) -> int:
+        with self.__cerrojo:
+            self.__avanzar()
+            return round(self.__temps[g_num])
+
+
+    def get_carga(self, g_num: int) -> int:
+        with self.__cerrojo:
+            self.__avanzar()
+            return round(100 * self.__cargas[g_num])
+
+
+    def get_speed(self, f_num: int) -> int:
+        with self.__cerrojo:
+            self.__avanzar()
+            real = self.__reales[f_num]
+            if real < V_CEB and self.__rnd.random() < 0.3:
+                return self.__rnd.choice([0, round(real * 2), 100, 255])
+            return max(0, round(real + self.__rnd.gauss(0, 1.0)))
+
+
+    def get_target(self, f_num: int) -> int:
+        return self.__targets[f_num]
+
+
+    def set_speed(self, f_num: int, veloc: int) -> str:
+        with self.__cerrojo:
+            self.__avanzar()
+            if veloc != self.__targets[f_num]:
+                self.__cambios[f_num] += 1
+            self.__targets[f_num] = veloc
+        return f'Ventilador n.º {f_num} puesto al {veloc} %.'
+
+
+    def set_fan_control(self, g_num: int, estado: int) -> str:
+        self.__control[g_num] = estado
+        return f'GPUFanControlState de la GPU n.º {g_num} puesto a {estado}.'
+
+
+class Reloj:
+    """
+    Reloj usado por el script para medir el tiempo y esperar. Esta clase
+    usa el tiempo real.
+    """
+
+    def ahora(self) -> float:
+        """Devuelve el instante actual, en segundos."""
+        return time.monotonic()
+
+
+    def fecha(self) -> datetime.datetime:
+        """Devuelve la fecha y hora actuales."""
+        return datetime.datetime.now()
+
+
+    def dormir(self, tiempo: float) -> None:
+        """Detiene el proceso durante los segundos indicados."""
+        time.sleep(tiempo)
+
+
+    def esperar_tareas(self, tareas: list[concurrent.futures.Future], tiempo: float) -> None:
+        """
+        Espera a que termine alguna de las tareas indicadas, como mucho
+        durante los segundos indicados.
+        """
+        concurrent.futures.wait(tareas, timeout=tiempo,
+                                return_when=concurrent.futures.FIRST_COMPLETED)
+
+
+    def esperar_evento(self, evento: threading.Event, tiempo: float) -> None:
+        """
+        Espera a que se active el evento indicado, como mucho durante los
+        segundos indicados.
+        """
+        evento.wait(tiempo)
+
+
+class RelojVirtual(Reloj):
+    """
+    Reloj virtual en el que esperar no detiene el proceso, sino que hace
+    avanzar el tiempo al instante. Permite simular horas de funcionamiento
+    en unos segundos.
+    """
+
+    def __init__(self) -> None:
+        self.__t = 0.0
+        self.__inicio = datetime.datetime.now()
+
+
+    def ahora(self) -> float:
+        return self.__t
+
+
+    def fecha(self) -> datetime.datetime:
+        return self.__inicio + datetime.timedelta(seconds=self.__t)
+
+
+    def dormir(self, tiempo: float) -> None:
+        self.__t += tiempo
+
+
+    def esperar_tareas(self, tareas: list[concurrent.futures.Future], tiempo: float) -> None:
+        """
+        Espera a que terminen todas las tareas sin hacer avanzar el tiempo,
+        de forma que la simulación no dependa de lo que tarden en ejecutarse.
+        """
+        concurrent.futures.wait(tareas)
+
+
+    def esperar_evento(self, evento: threading.Event, tiempo: float) -> None:
+        self.__t += tiempo
+
+
+class Metricas:
+    """
+    Registro de las métricas del bucle de control (contadores, histogramas
+    de duraciones, resúmenes con percentiles y valores actuales), que se
+    pueden exportar en el formato de texto de Prometheus.
+    Es seguro usarlo desde varios hilos a la vez, pero no desde un manejador
+    de señales: si la señal llega mientras el hilo principal tiene cogido el
+    cerrojo, el proceso se bloquea (ver finalizar).
+    """
+
+    PREFIJO = 'nvidia_fan_curve_'
+    CUBETAS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    CUANTILES = (0.5, 0.9, 0.99)
+    VENTANA_CUANTILES = 1000
+
+    # Nombre: (tipo, descripción)
+    DESCRIPCIONES = {
+        'spawns_total': ('counter', 'Procesos nvidia-settings lanzados.'),
+        'command_seconds': ('histogram', 'Duración de cada invocación de nvidia-settings.'),
+        'bucle_seconds': ('histogram', 'Duración de Manager.bucle para cada ventilador.'),
+        'speed_reads_total': ('counter', 'Mediciones de velocidad de cada ventilador.'),
+        'speed_read_seconds': ('histogram', 'Duración de Fan.get_speed.'),
+        'speed_writes_total': ('counter', 'Cambios de velocidad de cada ventilador.'),
+        'write_batches_total': ('counter', 'Lotes de escrituras de velocidades y estados de control enviados.'),
+        'write_seconds': ('histogram', 'Duración del envío de cada lote de escrituras.'),
+        'write_errors_total': ('counter', 'Escrituras fallidas en cada ventilador o GPU.'),
+        'hardware_call_seconds': ('histogram', 'Duración de cada acceso al hardware de cada backend, con sus reintentos.'),
+        'hardware_failures_total': ('counter', 'Accesos al hardware fallidos o sin respuesta de cada backend.'),
+        'hardware_retries_total': ('counter', 'Accesos al hardware repetidos tras un fallo.'),
+        'circuit_open': ('gauge', 'Si el cortacircuitos de cada GPU está abierto (1) o cerrado (0).'),
+        'circuit_trips_total': ('counter', 'Veces que se ha aplicado ACCION_FALLO a cada GPU.'),
+        'primings_total': ('counter', 'Cebados iniciados en cada ventilador.'),
+        'priming_timeouts_total': ('counter', 'Cebados abandonados por superar T_CEB_MAX.'),
+        'tick_seconds': ('summary', 'Duración de cada iteración del bucle de cada GPU.'),
+        'tick_overruns_total': ('counter', 'Iteraciones que han terminado después de su plazo.'),
+        'gpu_temperature_celsius': ('gauge', 'Temperatura actual de cada GPU.'),
+        'gpu_load_percent': ('gauge', 'Carga actual de cada GPU (utilización o consumo, la mayor).'),
+        'gpu_anticipated_celsius': ('gauge', 'Temperatura anticipada por la carga de cada GPU (0 si no se anticipa).'),
+        'anticipations_total': ('counter', 'Saltos de carga de cada GPU ante los que se ha anticipado la subida de temperatura.'),
+        'fan_commanded_percent': ('gauge', 'Última velocidad establecida en cada ventilador.'),
+        'fan_measured_percent': ('gauge', 'Última velocidad medida de cada ventilador.'),
+        'fan_target_percent': ('gauge', 'Velocidad objetivo de la curva para cada ventilador.'),
+        'actuations_avoided_total': ('counter', 'Bajadas de velocidad retenidas por la histéresis o la permanencia mínima.'),
+        'log_dropped_total': ('counter', 'Mensajes del registro descartados por estar la cola llena.'),
+        'metrics_write_errors_total': ('counter', 'Escrituras fallidas del fichero de métricas.'),
+    }
+
+
+    def __init__(self) -> None:
+        self.__cerrojo = threading.Lock()
+        self.__valores: dict[str, dict[tuple, float]] = collections.defaultdict(dict)
+        self.__cubetas: dict[str, dict[tuple, list[int]]] = collections.defaultdict(dict)
+        self.__sumas: dict[str, dict[tuple, float]] = collections.defaultdict(dict)
+        self.__recientes: dict[str, dict[tuple, collections.deque]] = collections.defaultdict(dict)
+
+
+    def contar(self, nombre: str, valor: float = 1, **etiquetas) -> None:
+        """Incrementa un contador."""
+        clave = tuple(sorted(etiquetas.items()))
+        with self.__cerrojo:
+            valores = self.__valores[nombre]
+            valores[clave] = valores.get(clave, 0) + valor
+
+
+    def fijar(self, nombre: str, valor: float, **etiquetas) -> None:
+        """Establece el valor actual de una métrica."""
+        clave = tuple(sorted(etiquetas.items()))
+        with self.__cerrojo:
+            self.__valores[nombre][clave] = valor
+
+
+    def observar(self, nombre: str, valor: float, **etiquetas) -> None:
+        """Añade una observación a un histograma o a un resumen."""
+        clave = tuple(sorted(etiquetas.items()))
+        with self.__cerrojo:
+            self.__valores[nombre][clave] = self.__valores[nombre].get(clave, 0) + 1
+            self.__sumas[nombre][clave] = self.__sumas[nombre].get(clave, 0.0) + valor
+            if Metricas.DESCRIPCIONES[nombre][0] == 'summary':
+                recientes = self.__recientes[nombre].setdefault(
+                    clave, collections.deque(maxlen=Metricas.VENTANA_CUANTILES))
+                recientes.append(valor)
+            else:
+                cubetas = self.__cubetas[nombre].setdefault(clave, [0] * len(Metricas.CUBETAS))
+                for i, limite in enumerate(Metricas.CUBETAS):
+                    if valor <= limite:
+                        cubetas[i] += 1
+
+
+    @contextlib.contextmanager
+    def medir(self, nombre: str, **etiquetas):
+        """Observa en el histograma indicado la duración del bloque with."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nombre, time.perf_counter() - inicio, **etiquetas)
+
+
+    @staticmethod
+    def __etiquetas(clave: tuple, *extra: tuple[str, str]) -> str:
+        """Da formato a las etiquetas de una muestra."""
+        pares = [f'{k}="{v}"' for k, v in (*clave, *extra)]
+        return '{' + ','.join(pares) + '}' if pares else ''
+
+
+    def texto(self) -> str:
+        """Devuelve todas las métricas en el formato de texto de Prometheus."""
+        lineas = []
+        with self.__cerrojo:
+            for nombre, (tipo, ayuda) in Metricas.DESCRIPCIONES.items():
+                if nombre not in self.__valores:
+                    continue
+                completo = Metricas.PREFIJO + nombre
+                lineas.append(f'# HELP {completo} {ayuda}')
+                lineas.append(f'# TYPE {completo} {tipo}')
+                for clave, valor in sorted(self.__valores[nombre].items()):
+                    if tipo == 'histogram':
+                        for limite, n in zip(Metricas.CUBETAS, self.__cubetas[nombre][clave]):
+                            lineas.append(f'{completo}_bucket{self.__etiquetas(clave, ("le", str(limite)))} {n}')
+                        lineas.append(f'{completo}_bucket{self.__etiquetas(clave, ("le", "+Inf"))} {valor:g}')
+                    if tipo == 'summary':
+                        recientes = sorted(self.__recientes[nombre][clave])
+                        for q in Metricas.CUANTILES:
+                            v = recientes[min(len(recientes) - 1, int(q * len(recientes)))]
+                            lineas.append(f'{completo}{self.__etiquetas(clave, ("quantile", str(q)))} {v:g}')
+                    if tipo in ('histogram', 'summary'):
+                        lineas.append(f'{completo}_sum{self.__etiquetas(clave)} {self.__sumas[nombre][clave]:g}')
+                        lineas.append(f'{completo}_count{self.__etiquetas(clave)} {valor:g}')
+                    else:
+                        lineas.append(f'{completo}{self.__etiquetas(clave)} {valor:g}')
+        return '\n'.join(lineas) + '\n'
+
+
+    def escribir(self, ruta: str) -> None:
+        """
+        Escribe las métricas en el fichero indicado de forma atómica, para
+        que el textfile collector de node-exporter nunca lea un fichero a
+        medio escribir. Lanza OSError si no se puede escribir, sin dejar
+        atrás el fichero temporal.
+        """
+        temporal = f'{ruta}.{os.getpid()}.tmp'
+        try:
+            with open(temporal, 'w', encoding='utf-8') as fichero:
+                fichero.write(self.texto())
+            os.replace(temporal, ruta)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(temporal)
+            raise
+
+
+    def servir(self, puerto: int) -> None:
+        """
+        Sirve las métricas por HTTP en 127.0.0.1 y el puerto indicado, desde
+        un hilo aparte.
+        """
+        metricas = self
+
+        class Manejador(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                cuerpo = metricas.texto().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        servidor = http.server.ThreadingHTTPServer(('127.0.0.1', puerto), Manejador)
+        threading.Thread(target=servidor.serve_forever, name='metricas', daemon=True).start()
+
+
+class Registro:
+    """
+    Registro de mensajes del script. Los mensajes se dejan en una cola de
+    tamaño limitado (COLA_LOG) que vacía un hilo aparte, de forma que
+    escribir en la salida (que puede ser una tubería lenta, como la de
+    journald) nunca detiene el bucle de control. Si la cola se llena, los
+    mensajes nuevos se descartan y se cuentan.
+    No se debe registrar desde un manejador de señales: contar un mensaje
+    descartado y escribir en modo síncrono necesitan cerrojos que el hilo
+    principal puede tener cogidos al llegar la señal (ver finalizar).
+    """
+
+    NOMBRES = {DEBUG: 'debug', INFO: 'info', WARNING: 'warning', ERROR: 'error'}
+
+
+    def __init__(self) -> None:
+        self.__cola: collections.deque = collections.deque()
+        self.__cerrojo = threading.Lock()
+        self.__descartados = 0
+        self.__sincrono = False
+        self.__hilo: Optional[threading.Thread] = None
+
+
+    def set_sincrono(self, sincrono: bool) -> None:
+        """
+        Hace que los mensajes se escriban directamente, sin pasar por la
+        cola, como conviene en la simulación, donde no hay prisa pero no se
+        debe perder ningún mensaje.
+        """
+        self.vaciar()
+        self.__sincrono = sincrono
+
+
+    def get_descartados(self) -> int:
+        """Devuelve el número de mensajes descartados."""
+        return self.__descartados
+
+
+    @staticmethod
+    def formatear(fecha: datetime.datetime, nivel: int, mensaje: str, campos: dict) -> str:
+        """Da formato a un mensaje según FORMATO_LOG."""
+        ts = fecha.replace(microsecond=0)
+        nombre = Registro.NOMBRES.get(nivel, str(nivel))
+        if FORMATO_LOG == 'json':
+            return json.dumps({'ts': ts.isoformat(), 'nivel': nombre, 'msg': mensaje, **campos},
+                              ensure_ascii=False, default=str)
+        if FORMATO_LOG == 'kv':
+            pares = [f'ts={ts.isoformat()}', f'nivel={nombre}', f'msg={json.dumps(mensaje, ensure_ascii=False)}']
+            pares += [f'{k}={v}' for k, v in campos.items()]
+            return ' '.join(pares)
+        if nivel >= WARNING:
+            mensaje = f'[{nombre.upper()}] {mensaje}'
+        return f'{ts} - {mensaje}'
+
+
+    def escribir(self, nivel: int, mensaje: str, campos: dict) -> None:
+        """Encola un mensaje para escribirlo."""
+        registro = (get_reloj().fecha(), nivel, mensaje, campos)
+        if self.__sincrono:
+            with self.__cerrojo:
+                self.__volcar([registro])
+            return
+        if len(self.__cola) >= COLA_LOG:
+            self.__descartados += 1
+            get_metricas().contar('log_dropped_total')
+            return
+        self.__cola.append(registro)
+        if self.__hilo is None:
+            self.__hilo = threading.Thread(target=self.__escritor, name='registro', daemon=True)
+            self.__hilo.start()
+
+
+    def __volcar(self, registros: list) -> None:
+        """Escribe los mensajes indicados en la salida."""
+        for registro in registros:
+            print(self.formatear(*registro))
+        sys.stdout.flush()
+
+
+    def __sacar(self) -> list:
+        """Saca de la cola todos los mensajes pendientes."""
+        registros = []
+        while True:
+            try:
+                registros.append(self.__cola.popleft())
+            except IndexError:
+                return registros
+
+
+    def __escritor(self) -> None:
+        """Vacía la cola periódicamente. Se ejecuta en su propio hilo."""
+        while True:
+            self.vaciar()
+            time.sleep(0.1)
+
+
+    def vaciar(self) -> None:
+        """Escribe todos los mensajes pendientes."""
+        with self.__cerrojo:
+            registros = self.__sacar()
+            if registros:
+                self.__volcar(registros)
+
+
+class Telemetria:
+    """
+    Histórico de temperaturas y velocidades guardado en un fichero de tamaño
+    fijo usado como búfer circular. El fichero se proyecta en memoria
+    (mmap) y cada muestra ocupa un registro de 16 bytes, por lo que añadir
+    una no reserva memoria ni hace ninguna llamada al sistema.
+    La cabecera guarda el número total de registros escritos, que se
+    actualiza después de escribir cada registro. Así, otros procesos pueden
+    leer el fichero a la vez sin cerrojos (ver telemetria.py): basta con
+    leer el contador antes y después de copiar los registros y descartar
+    los que se hayan podido sobrescribir entretanto.
+    """
+
+    MAGIA = b'NVFT'
+    VERSION = 1
+    # Magia, versión, tamaño del registro, registros escritos y capacidad:
+    CABECERA = struct.Struct('<4sHHQI12x')
+    # Instante (s desde la época), GPU, ventilador, temperatura (ºC),
+    # velocidad medida y establecida (%, -1 si no se conoce) e indicadores:
+    REGISTRO = struct.Struct('<dBBhbbBx')
+    OFFSET_ESCRITOS = 8
+    CEBANDO = 0x01     # Indicador: el ventilador se estaba cebando
+
+
+    def __init__(self, ruta: str, capacidad: int = TELEMETRIA_REGISTROS) -> None:
+        """
+        Abre el histórico del fichero indicado, o lo crea si no existe o su
+        formato o capacidad no coinciden, y continúa a partir del último
+        registro escrito.
+        Como el script se suele ejecutar como root, para no sobrescribir
+        otro fichero no se siguen enlaces simbólicos, y se lanza ValueError
+        si el fichero no es un fichero normal de este usuario o si ya tiene
+        datos que no son de un histórico.
+        """
+        self.__capacidad = capacidad
+        self.__cerrojo = threading.Lock()
+        tamaño = Telemetria.CABECERA.size + capacidad * Telemetria.REGISTRO.size
+        fd = os.open(ruta, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW | os.O_NONBLOCK | os.O_CLOEXEC, 0o644)
+        try:
+            st = os.fstat(fd)
+            if not stat.S_ISREG(st.st_mode) or st.st_uid != os.geteuid():
+                raise ValueError(f'{ruta} no es un fichero normal de este usuario')
+            if st.st_size and os.pread(fd, len(Telemetria.MAGIA), 0) != Telemetria.MAGIA:
+                raise ValueError(f'{ruta} ya existe y no es un fichero de telemetría')
+            if st.st_size != tamaño:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, tamaño)
+            self.__mapa = mmap.mmap(fd, tamaño)
+        finally:
+            os.close(fd)
+        magia, version, tam_registro, escritos, cap = Telemetria.CABECERA.unpack_from(self.__mapa)
+        if (magia, version, tam_registro, cap) != (Telemetria.MAGIA, Telemetria.VERSION,
+                                                   Telemetria.REGISTRO.size, capacidad):
+            escritos = 0
+            Telemetria.CABECERA.pack_into(self.__mapa, 0, Telemetria.MAGIA, Telemetria.VERSION,
+                                          Telemetria.REGISTRO.size, escritos, capacidad)
+        self.__escritos = escritos
+
+
+    def get_capacidad(self) -> int:
+        """Devuelve el número máximo de registros que guarda el histórico."""
+        return self.__capacidad
+
+
+    def get_escritos(self) -> int:
+        """Devuelve el número total de registros escritos en el histórico."""
+        return self.__escritos
+
+
+    def añadir(self, instante: float, g_num: int, f_num: int, temp: int,
+               medida: Optional[int], comandada: Optional[int], cebando: bool) -> None:
+        """Añade una muestra al histórico, sobrescribiendo la más antigua."""
+        with self.__cerrojo:
+            posicion = (Telemetria.CABECERA.size
+                        + (self.__escritos % self.__capacidad) * Telemetria.REGISTRO.size)
+            Telemetria.REGISTRO.pack_into(
+                self.__mapa, posicion, instante, g_num, f_num, temp,
+                -1 if medida is None else medida, -1 if comandada is None else comandada,
+                Telemetria.CEBANDO if cebando else 0)
+            self.__escritos += 1
+            struct.pack_into('<Q', self.__mapa, Telemetria.OFFSET_ESCRITOS, self.__escritos)
+
+
+    def cerrar(self) -> None:
+        """Vuelca el histórico al disco y lo cierra."""
+        with self.__cerrojo:
+            self.__mapa.flush()
+            self.__mapa.close()
+
+
+class Configuracion:
+    """
+    Fichero de configuración (JSON o, si termina en .toml, TOML) con las
+    GPUs, sus ventiladores, sus curvas y sus parámetros. Para detectar los
+    cambios basta con un stat por iteración, que compara la fecha de
+    modificación, el tamaño y el inodo (que cambia cuando el fichero se
+    sustituye con un rename, como hacen muchos editores).
+    """
+
+    def __init__(self, ruta: str) -> None:
+        self.__ruta = ruta
+        self.__firma: Optional[tuple[int, int, int]] = None
+
+
+    def get_ruta(self) -> str:
+        """Devuelve la ruta del fichero de configuración."""
+        return self.__ruta
+
+
+    def __firmar(self) -> Optional[tuple[int, int, int]]:
+        """
+        Devuelve la fecha de modificación, el tamaño y el inodo del fichero,
+        o None si no se puede consultar.
+        """
+        try:
+            st = os.stat(self.__ruta)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+    def cambiada(self) -> bool:
+        """
+        Indica si el fichero ha cambiado desde la última vez que se leyó.
+        Si ha desaparecido, se sigue con la configuración actual.
+        """
+        firma = self.__firmar()
+        return firma is not None and firma != self.__firma
+
+
+    def olvidar(self) -> None:
+        """Hace que el fichero se vuelva a leer aunque no haya cambiado."""
+        self.__firma = None
+
+
+    def leer(self, topologia: Optional[dict[int, list[int]]] = None) -> dict:
+        """
+        Lee el fichero y devuelve la configuración normalizada (ver
+        normalizar_configuracion, a la que se pasa la topología indicada).
+        Lanza ValueError si no se puede leer o no es válida.
+        """
+        self.__firma = self.__firmar()
+        try:
+            if self.__ruta.endswith('.toml'):
+                import tomllib
+                with open(self.__ruta, 'rb') as fichero:
+                    datos = tomllib.load(fichero)
+            else:
+                with open(self.__ruta, encoding='utf-8') as fichero:
+                    datos = json.load(fichero)
+        except ImportError:
+            raise ValueError('leer ficheros TOML necesita Python 3.11 o posterior')
+        except OSError as e:
+            raise ValueError(f'no se pudo leer: {e.strerror}')
+        except ValueError as e:
+            # json.JSONDecodeError y tomllib.TOMLDecodeError son ValueError:
+            raise ValueError(f'error de sintaxis: {e}')
+        return normalizar_configuracion(datos, topologia)
+
+
+class Manager:
+    """
+    Representa el gestor que lleva a cabo el bucle de procesamiento principal
+    de supervisión y control de las temperaturas y los ventiladores de las GPUs
+    del sistema."""
+
+    __singleton: Optional[Manager] = None
+
+
+    @classmethod
+    def get_singleton(cls) -> Manager:
+        """
+        Devuelve la única instancia de la clase Manager que debería haber.
+        """
+        if cls.__singleton is None:
+            cls.__singleton = Manager()
+        return cls.__singleton
+
+
+    def __init__(self):
+        self.__gpus = []
+        self.__muestreos: dict[int, MuestreoAdaptativo] = {}
+        self.__circuitos: dict[int, Circuito] = {}
+        self.__anticipaciones: dict[int, Anticipacion] = {}
+        self.__planificador: Optional[Planificador] = None
+        self.__configuracion: Optional[Configuracion] = None
+        self.__estados: dict[int, dict] = {}
+        self.__objetivos: dict[int, int] = {}
+        self.__forzadas: dict[int, tuple[int, float]] = {}
+        self.__pausa: Optional[float] = None
+
+
+    def get_gpus(self) -> list[GPU]:
+        """
+        Devuelve la lista con las GPUs registradas en el manager.
+        """
+        return self.__gpus
+
+
+    def set_gpus(self, gpus: list[GPU]) -> None:
+        """
+        Establece la lista con las GPUs registradas en el manager.
+        """
+        self.__gpus = gpus
+        self.__muestreos = {gpu.g_num(): MuestreoAdaptativo(gpu.get_sleep()) for gpu in gpus}
+        self.__circuitos = {gpu.g_num(): Circuito(gpu) for gpu in gpus}
+        self.__anticipaciones = {gpu.g_num(): Anticipacion() for gpu in gpus}
+
+
+    def set_configuracion(self, configuracion: Optional[Configuracion]) -> None:
+        """
+        Establece el fichero de configuración cuyos cambios se aplican
+        durante la ejecución (ver comprobar_configuracion).
+        """
+        self.__configuracion = configuracion
+
+
+    def comprobar_configuracion(self) -> None:
+        """
+        Si el fichero de configuración ha cambiado, lo vuelve a leer y aplica
+        los nuevos parámetros y curvas de las GPUs y los ventiladores. Si la
+        configuración nueva no es válida, se registra el error y se sigue
+        con la anterior.
+        El planificador sólo lo llama cuando no hay ninguna iteración en
+        curso, de forma que ninguna ve una configuración a medias.
+        """
+        configuracion = self.__configuracion
+        if configuracion is None or not configuracion.cambiada():
+            return
+        try:
+            self.aplicar_configuracion(configuracion.leer(self.get_topologia()))
+        except Exception as e:
+            # Un fichero mal formado nunca debe detener el control, falle
+            # como falle su lectura o su comprobación:
+            log(f'La configuración de {configuracion.get_ruta()} no es válida y se '
+                f'mantiene la anterior: {e}.', ERROR)
+            return
+        log(f'Configuración de {configuracion.get_ruta()} aplicada.')
+
+
+    def aplicar_configuracion(self, configuracion: dict) -> None:
+        """
+        Aplica a las GPUs y ventiladores del manager la configuración
+        indicada (ver normalizar_configuracion). El muestreo adaptativo de
+        cada GPU vuelve a empezar desde su nuevo sleep. Lanza ValueError sin
+        cambiar nada si la configuración tiene otras GPUs o ventiladores, ya
+        que eso exige reiniciar el proceso.
+        """
+        nueva = {g_num: sorted(datos['fans']) for g_num, datos in configuracion.items()}
+        if self.get_topologia() != nueva:
+            raise ValueError('cambiar las GPUs o los ventiladores exige reiniciar el proceso')
+        for gpu in self.get_gpus():
+            datos = configuracion[gpu.g_num()]
+            gpu.configurar(datos['params'])
+            for fan in gpu.get_fans():
+                fan.configurar(datos['fans'][fan.get_f_num()]['params'],
+                               datos['fans'][fan.get_f_num()]['curva'])
+            self.__muestreos[gpu.g_num()] = MuestreoAdaptativo(gpu.get_sleep())
+
+
+    def get_topologia(self) -> dict[int, list[int]]:
+        """Devuelve los ventiladores de cada GPU, como {g_num: [f_num, ...]}."""
+        return {gpu.g_num(): sorted(fan.get_f_num() for fan in gpu.get_fans())
+                for gpu in self.get_gpus()}
+
+
+    def get_planificador(self) -> Optional[Planificador]:
+        """
+        Devuelve el planificador que ejecuta el bucle de control, o None si
+        todavía no se ha creado.
+        """
+        return self.__planificador
+
+
+    def set_planificador(self, planificador: Planificador) -> None:
+        """Establece el planificador que ejecuta el bucle de control."""
+        self.__planificador = planificador
+
+
+    def get_periodo(self, gpu: GPU) -> float:
+        """
+        Devuelve el periodo de revisión de la GPU, que es su sleep (SLEEP por
+        omisión) salvo en el modo adaptativo, y como mucho su sleep_ceb
+        (SLEEP_CEB) mientras se esté cebando alguno de sus ventiladores o
+        anticipando una subida de temperatura, para que los ventiladores
+        suban antes.
+        Mientras su cortacircuitos está abierto, es REPOSO_CIRCUITO.
+        """
+        if self.__circuitos[gpu.g_num()].abierto():
+            return REPOSO_CIRCUITO
+        periodo = self.__muestreos[gpu.g_num()].get_periodo() if ADAPTATIVO else gpu.get_sleep()
+        if any(fan.cebando() for fan in gpu.get_fans()) or \
+                self.__anticipaciones[gpu.g_num()].get_temp_anticipada() is not None:
+            periodo = min(periodo, gpu.get_sleep_ceb())
+        return periodo
+
+
+    def get_muestreo(self, gpu: GPU) -> MuestreoAdaptativo:
+        """Devuelve el estado del muestreo adaptativo de la GPU."""
+        return self.__muestreos[gpu.g_num()]
+
+
+    def get_circuito(self, gpu: GPU) -> Circuito:
+        """Devuelve el cortacircuitos del acceso al hardware de la GPU."""
+        return self.__circuitos[gpu.g_num()]
+
+
+    def get_anticipacion(self, gpu: GPU) -> Anticipacion:
+        """Devuelve el estado de la anticipación de la carga de la GPU."""
+        return self.__anticipaciones[gpu.g_num()]
+
+
+    def get_temps(self) -> list[int]:
+        """
+        Devuelve una lista con las temperaturas actuales de todas las GPUs
+        instaladas en el sistema y registradas en el manager.
+        """
+        return [gpu.get_temp() for gpu in self.get_gpus()]
+
+
+    def leer_instantanea(self, gpus: Optional[list[GPU]] = None) -> Instantanea:
+        """
+        Consulta de una sola vez todas las lecturas necesarias en cada
+        iteración del bucle (temperaturas de las GPUs, cargas de las que
+        anticipan su subida de temperatura, muestras de velocidad de los
+        ventiladores y, en modo depuración, sus velocidades objetivo) y las
+        devuelve en forma de instantánea.
+        Por omisión consulta todas las GPUs registradas en el manager.
+        Sólo se lee la velocidad de los ventiladores que lo necesitan, con
+        las muestras que necesita cada uno (ver Fan.muestras_necesarias).
+        """
+        if gpus is None:
+            gpus = self.get_gpus()
+        ahora = get_reloj().ahora()
+        g_nums = [gpu.g_num() for gpu in gpus]
+        muestras = {fan.get_f_num(): fan.muestras_necesarias(ahora)
+                    for gpu in gpus for fan in gpu.get_fans()}
+        muestras = {f: n for f, n in muestras.items() if n}
+        cargas = [gpu.g_num() for gpu in gpus if gpu.get_anticipacion()]
+        return get_backend().leer_instantanea(g_nums, muestras, log_activo(DEBUG), cargas)
+
+
+    def iteracion(self, gpu: GPU, inst: Instantanea) -> None:
+        """
+        Lleva a cabo una iteración del bucle de control sobre la GPU
+        indicada y sus ventiladores.
+        """
+        temp_actual = gpu.get_temp(inst)
+        anticipacion = self.__anticipaciones[gpu.g_num()]
+        if gpu.get_anticipacion():
+            anticipacion.actualizar(gpu, temp_actual, gpu.get_carga(inst),
+                                    self.__muestreos[gpu.g_num()].get_pendiente(), get_reloj().ahora())
+        else:
+            anticipacion.reiniciar()
+        if self.pausado() and temp_actual >= gpu.get_t_max():
+            log(f'GPU n.º {gpu.g_num()} a {temp_actual} ºC: se reanuda el control.', WARNING)
+            self.reanudar()
+        t_comandadas = [fan.get_t_comandada() for fan in gpu.get_fans()]
+        for fan in gpu.get_fans():
+            # En pausa, los cebados en curso terminan pero no se inicia nada:
+            if not self.pausado() or fan.cebando():
+                self.bucle(temp_actual, gpu, fan, inst)
+        gpu.mantener_control(any(fan.get_t_comandada() != t
+                                 for fan, t in zip(gpu.get_fans(), t_comandadas)))
+        self.__actualizar_estado(gpu, temp_actual)
+        telemetria = get_telemetria()
+        if telemetria is not None:
+            instante = get_reloj().fecha().timestamp()
+            for fan in gpu.get_fans():
+                telemetria.añadir(instante, gpu.g_num(), fan.get_f_num(), temp_actual,
+                                  fan.get_medida(), fan.get_comandada(), fan.cebando())
+        muestreo = self.__muestreos[gpu.g_num()]
+        anterior = muestreo.get_periodo()
+        muestreo.actualizar(temp_actual, get_reloj().ahora(), gpu.get_umbrales())
+        if ADAPTATIVO and muestreo.get_periodo() != anterior:
+            log(f'Periodo de la GPU n.º {gpu.g_num()}: {muestreo.get_periodo():.1f} s '
+                f'(pendiente {muestreo.get_pendiente():+.2f} ºC/s).', DEBUG)
+
+
+    def __actualizar_estado(self, gpu: GPU, temp: int) -> None:
+        """
+        Guarda el estado de la GPU y sus ventiladores al final de una
+        iteración, para poder consultarlo (ver get_estado) sin acceder al
+        hardware.
+        """
+        ahora = get_reloj().ahora()
+        fans = []
+        for fan in gpu.get_fans():
+            forzada = self.__forzadas.get(fan.get_f_num())
+            fans.append({
+                'fan': fan.get_f_num(),
+                'modo': fan.get_modo(),
+                'comandada': fan.get_comandada(),
+                'medida': fan.get_medida(),
+                'objetivo': self.__objetivos.get(fan.get_f_num()),
+                'cebado': fan.get_estado_cebado(),
+                'retenidas': fan.get_retenidas(),
+                'forzada': forzada[0] if forzada is not None else None,
+                'forzada_restante': round(forzada[1] - ahora, 1) if forzada is not None else None,
+            })
+        self.__estados[gpu.g_num()] = {
+            'gpu': gpu.g_num(),
+            'fecha': get_reloj().fecha().replace(microsecond=0).isoformat(),
+            'temp': temp,
+            'control': gpu.get_control(),
+            'carga': self.__anticipaciones[gpu.g_num()].get_carga(),
+            'temp_anticipada': self.__anticipaciones[gpu.g_num()].get_temp_anticipada(),
+            'fans': fans,
+        }
+
+
+    def get_estado(self) -> dict:
+        """
+        Devuelve el último estado conocido de todas las GPUs y ventiladores,
+        junto con el periodo, la duración de la última iteración, el número
+        de retrasos y el estado del cortacircuitos de cada GPU. No accede al
+        hardware.
+        """
+        planificador = self.get_planificador()
+        gpus = []
+        for gpu in self.get_gpus():
+            estado = dict(self.__estados.get(gpu.g_num(), {'gpu': gpu.g_num()}))
+            estado['periodo'] = self.get_periodo(gpu)
+            circuito = self.__circuitos[gpu.g_num()]
+            estado['circuito'] = 'abierto' if circuito.abierto() else 'cerrado'
+            estado['fallos'] = circuito.get_fallos()
+            if planificador is not None:
+                estado['latencia'] = planificador.get_latencia(gpu)
+                estado['retrasos'] = planificador.get_retrasos(gpu)
+            gpus.append(estado)
+        pausa = self.__pausa
+        return {
+            'pausado': self.pausado(),
+            'pausa_restante': round(pausa - get_reloj().ahora(), 1)
+                              if pausa is not None and pausa != float('inf') else None,
+            'gpus': gpus,
+        }
+
+
+    def __buscar_fan(self, f_num: int) -> Fan:
+        """Devuelve el ventilador indicado o lanza ValueError si no existe."""
+        for gpu in self.get_gpus():
+            for fan in gpu.get_fans():
+                if fan.get_f_num() == f_num:
+                    return fan
+        raise ValueError(f'no existe el ventilador n.º {f_num}')
+
+
+    def forzar(self, f_num: int, veloc: int, segundos: float) -> None:
+        """
+        Fuerza la velocidad del ventilador indicado durante los segundos
+        indicados (como mucho FORZADO_MAX), en lugar de la de su curva. La
+        velocidad forzada no se aplica mientras la GPU esté a t_max o más.
+        Lanza ValueError si el ventilador no existe o los valores no son
+        válidos.
+        """
+        fan = self.__buscar_fan(f_num)
+        if veloc not in range(fan.get_v_min(), fan.get_v_max() + 1):
+            raise ValueError(f'la velocidad debe estar entre {fan.get_v_min()} y {fan.get_v_max()}')
+        if not 0 < segundos <= FORZADO_MAX:
+            raise ValueError(f'la duración debe estar entre 0 y {FORZADO_MAX} s')
+        self.__forzadas[f_num] = (veloc, get_reloj().ahora() + segundos)
+        log(f'Ventilador n.º {f_num} forzado al {veloc} % durante {segundos:.0f} s.')
+
+
+    def liberar(self, f_num: int) -> None:
+        """
+        Devuelve el ventilador indicado a su curva. Lanza ValueError si el
+        ventilador no existe.
+        """
+        self.__buscar_fan(f_num)
+        if self.__forzadas.pop(f_num, None) is not None:
+            log(f'Ventilador n.º {f_num} devuelto a su curva.')
+
+
+    def get_forzada(self, fan: Fan) -> Optional[int]:
+        """
+        Devuelve la velocidad forzada del ventilador, o None si no tiene o
+        ya ha vencido.
+        """
+        forzada = self.__forzadas.get(fan.get_f_num())
+        if forzada is None:
+            return None
+        if get_reloj().ahora() >= forzada[1]:
+            self.__forzadas.pop(fan.get_f_num(), None)
+            log(f'Ha vencido la velocidad forzada del ventilador n.º {fan.get_f_num()}.')
+            return None
+        return forzada[0]
+
+
+    def pausar(self, segundos: Optional[float] = None) -> None:
+        """
+        Pausa el control: los ventiladores se quedan a la velocidad que
+        tengan, indefinidamente o durante los segundos indicados. La pausa
+        se levanta sola si alguna GPU alcanza t_max.
+        """
+        if segundos is not None and segundos <= 0:
+            raise ValueError('la duración de la pausa debe ser positiva')
+        self.__pausa = get_reloj().ahora() + segundos if segundos is not None else float('inf')
+        log('Control pausado' + (f' durante {segundos:.0f} s.' if segundos is not None else '.'))
+
+
+    def reanudar(self) -> None:
+        """Reanuda el control si estaba pausado."""
+        if self.__pausa is not None:
+            self.__pausa = None
+            log('Control reanudado.')
+
+
+    def pausado(self) -> bool:
+        """Indica si el control está pausado."""
+        pausa = self.__pausa
+        if pausa is not None and get_reloj().ahora() >= pausa:
+            self.reanudar()
+        return self.__pausa is not None
+
+
+    def releer(self) -> None:
         """
-        Establece la misma velocidad a todos los ventiladores de todas las GPUs
-        instaladas en el sistema y registradas en el manager.
+        Hace que en la siguiente iteración, que se adelanta a ahora mismo, se
+        vuelvan a leer las velocidades reales de todos los ventiladores y el
+        fichero de configuración.
         """
         for gpu in self.get_gpus():
             for fan in gpu.get_fans():
-                fan.set_speed(veloc)
+                fan.invalidar()
+        if self.__configuracion is not None:
+            self.__configuracion.olvidar()
+        if self.__planificador is not None:
+            self.__planificador.adelantar()
+
+
+    def set_speeds(self, veloc: int) -> None:
+        """
+        Establece la misma velocidad a todos los ventiladores de todas las GPUs
+        instaladas en el sistema y registradas en el manager, con una sola
+        escritura (ver agrupar_escrituras).
+        """
+        with agrupar_escrituras():
+            for gpu in self.get_gpus():
+                for fan in gpu.get_fans():
+                    fan.set_speed(veloc)
 
 
     def set_fans_control(self, estado: int) -> None:
         """
         Activa o desactiva el GPUFanStateControl a todas las GPUs instaladas
-        en el sistema y registradas en el manager.
+        en el sistema y registradas en el manager, con una sola escritura (ver
+        agrupar_escrituras).
         """
-        for gpu in self.get_gpus():
-            gpu.set_fan_control(estado)
+        with agrupar_escrituras():
+            for gpu in self.get_gpus():
+                gpu.set_fan_control(estado)
 
 
-    def bucle(self, temp_actual: int, gpu: GPU, fan: Fan) -> None:
+    def bucle(self, temp_actual: int, gpu: GPU, fan: Fan,
+              inst: Optional[Instantanea] = None) -> None:
         """
         El bucle principal del manager. A partir de la temperatura y velocidad
         actuales, calcula la velocidad objetivo y la siguiente velocidad a
         establecer en camino hacia esa velocidad objetivo.
         El ventilador no se apaga si estamos a una temperatura superior a t_fin.
         """
-        veloc_actual = fan.get_speed()
-        _, objetivo = fan.buscar_objetivo(temp_actual, gpu)
-        sgte_veloc = fan.siguiente_velocidad(veloc_actual, objetivo)
+        with get_metricas().medir('bucle_seconds', fan=fan.get_f_num()):
+            self.__bucle(temp_actual, gpu, fan, inst)
+
+
+    def __bucle(self, temp_actual: int, gpu: GPU, fan: Fan,
+                inst: Optional[Instantanea]) -> None:
+        """Lleva a cabo el bucle principal para un ventilador."""
+        if fan.cebando():
+            fan.avanzar_cebado(inst)
+            return
+        comandada = fan.get_comandada()
+        veloc_actual = fan.get_veloc_actual(inst)
+        if comandada is not None and fan.get_comandada() is None:
+            gpu.invalidar_control()
+        forzada = self.get_forzada(fan)
+        if forzada is not None and temp_actual < gpu.get_t_max():
+            self.__objetivos[fan.get_f_num()] = forzada
+            if veloc_actual != forzada and not fan.cebador(forzada, veloc_actual):
+                fan.set_speed(forzada)
+            return
+        control = fan.get_control()
+        # Ante un salto de carga, la velocidad es la de la temperatura
+        # anticipada (ver Anticipacion):
+        temp_control = self.__anticipaciones[gpu.g_num()].temperatura(temp_actual)
+        objetivo = control.objetivo(fan, gpu, temp_control, veloc_actual)
+        self.__objetivos[fan.get_f_num()] = objetivo
+        get_metricas().fijar('fan_target_percent', objetivo, fan=fan.get_f_num())
+        objetivo = fan.retener_bajada(temp_control, gpu, veloc_actual, objetivo)
+        sgte_veloc = control.siguiente(fan, gpu, temp_control, veloc_actual, objetivo)
         stat = f'[Actual: ({temp_actual} ºC, {veloc_actual} %)]'
         if veloc_actual != fan.get_v_min() and sgte_veloc == fan.get_v_min() and temp_actual > gpu.get_t_fin():
             log(f'{stat} No se apaga el ventilador por encima de {gpu.get_t_fin()} ºC.')
             return
         if veloc_actual != sgte_veloc:
-            log(f'{stat} Cambiando a velocidad {sgte_veloc} % con objetivo {objetivo} %.')
-            if not fan.cebador(sgte_veloc):
+            log(f'{stat} Cambiando a velocidad {sgte_veloc} % con objetivo {objetivo} %.',
+                fan=fan.get_f_num(), temp=temp_actual, actual=veloc_actual,
+                siguiente=sgte_veloc, objetivo=objetivo)
+            if not fan.cebador(sgte_veloc, veloc_actual):
                 fan.set_speed(sgte_veloc)
 
 
+_backend: Optional[Backend] = None
+
+
+def get_backend() -> Backend:
+    """
+    Devuelve el backend de acceso al hardware, creándolo la primera vez
+    según el valor de BACKEND.
+    """
+    global _backend
+    if _backend is None:
+        if BACKEND == 'nvml':
+            _backend = NvmlBackend()
+        elif BACKEND == 'nvidia-settings':
+            _backend = NvidiaSettingsBackend()
+        else:
+            error(f'Backend desconocido: {BACKEND}.')
+    return _backend
+
+
+def set_backend(backend: Backend) -> None:
+    """Establece el backend de acceso al hardware que se va a usar."""
+    global _backend
+    _backend = backend
+
+
+_escrituras = threading.local()
+
+
+@contextlib.contextmanager
+def agrupar_escrituras(lote: Optional[LoteEscrituras] = None):
+    """
+    Hace que las escrituras que se hagan en el hilo actual (ver escribir)
+    se acumulen en un lote que se envía de una vez al terminar, y devuelve
+    ese lote.
+    Si ya se están agrupando las escrituras del hilo, se usa el mismo lote.
+    Si se indica un lote, las escrituras se acumulan en él pero no se envían,
+    lo que permite que varios hilos compartan un lote que envía quien lo creó.
+    """
+    anterior = getattr(_escrituras, 'lote', None)
+    propio = lote is None and anterior is None
+    if lote is None:
+        lote = anterior if anterior is not None else LoteEscrituras()
+    _escrituras.lote = lote
+    try:
+        yield lote
+    finally:
+        _escrituras.lote = anterior
+        if propio:
+            lote.enviar()
+
+
+def escribir(tipo: str, num: int, valor: int, al_fallar: Callable[[str], None]) -> None:
+    """
+    Escribe la velocidad de un ventilador (tipo 'fan') o el estado de control
+    de una GPU (tipo 'gpu'). Si se están agrupando las escrituras del hilo
+    (ver agrupar_escrituras), sólo se añade al lote; si no, se hace ya.
+    """
+    lote = getattr(_escrituras, 'lote', None)
+    if lote is not None:
+        lote.añadir(tipo, num, valor, al_fallar)
+    else:
+        lote = LoteEscrituras()
+        lote.añadir(tipo, num, valor, al_fallar)
+        lote.enviar()
+
+
+_reloj: Reloj = Reloj()
+_metricas = Metricas()
+_registro = Registro()
+atexit.register(_registro.vaciar)
+
+
+_telemetria: Optional[Telemetria] = None
+
+
+def get_telemetria() -> Optional[Telemetria]:
+    """
+    Devuelve el histórico de telemetría, abriéndolo la primera vez, o None
+    si no se ha indicado TELEMETRIA_FICHERO.
+    """
+    global _telemetria
+    if _telemetria is None and TELEMETRIA_FICHERO is not None:
+        _telemetria = Telemetria(TELEMETRIA_FICHERO)
+        atexit.register(_telemetria.cerrar)
+    return _telemetria
+
+
+def get_registro() -> Registro:
+    """Devuelve el registro de mensajes del script."""
+    return _registro
+
+
+def get_metricas() -> Metricas:
+    """Devuelve el registro de métricas del script."""
+    return _metricas
+
+
+def get_reloj() -> Reloj:
+    """Devuelve el reloj que usa el script."""
+    return _reloj
+
+
+def set_reloj(reloj: Reloj) -> None:
+    """Establece el reloj que va a usar el script."""
+    global _reloj
+    _reloj = reloj
+
+
+class Planificador:
+    """
+    Planifica la ejecución del bucle de control de cada GPU con su propio
+    periodo (SLEEP o, en el modo adaptativo, el que calcule el manager para
+    cada GPU), sin importar cuántas GPUs haya.
+    En cada despertar, las lecturas de todas las GPUs a las que les toca se
+    hacen en una sola consulta y después el bucle de cada GPU se ejecuta en
+    su propio hilo, así que una GPU que tarda (por ejemplo, porque hay que
+    volver a leer la velocidad de un ventilador) no retrasa la lectura ni el
+    cálculo de las demás. Las escrituras de todas ellas se envían juntas
+    cuando terminan todas. Cada iteración tiene como plazo el comienzo de la
+    siguiente; si termina después, se registra el retraso y se saltan los
+    periodos perdidos.
+    Las iteraciones que fallan se cuentan en el cortacircuitos de cada GPU
+    (ver Circuito).
+    """
+
+    def __init__(self, manager: Manager) -> None:
+        self.__manager = manager
+        ahora = get_reloj().ahora()
+        self.__proximos = {gpu.g_num(): ahora for gpu in manager.get_gpus()}
+        self.__comienzos = {gpu.g_num(): ahora for gpu in manager.get_gpus()}
+        self.__retrasos = {gpu.g_num(): 0 for gpu in manager.get_gpus()}
+        self.__latencias: dict[int, Optional[float]] = {gpu.g_num(): None for gpu in manager.get_gpus()}
+        self.__en_curso: dict[int, concurrent.futures.Future] = {}
+        self.__detenido = False
+        self.__adelantar = False
+        self.__despertador = threading.Event()
+        self.__pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, len(manager.get_gpus())),
+            thread_name_prefix='gpu')
+        manager.set_planificador(self)
+
+
+    def parar(self) -> None:
+        """
+        Pide que el planificador se detenga: ejecutar no inicia ninguna
+        iteración más y vuelve en cuanto terminan las que están en curso.
+        Se puede llamar desde cualquier hilo.
+        """
+        self.__detenido = True
+        self.__despertador.set()
+
+
+    def detener(self) -> None:
+        """
+        Detiene el planificador: no se inicia ninguna iteración más y se
+        espera a que terminen las que estén en curso. Sólo se puede llamar
+        desde el hilo que ejecuta el planificador (desde otros, ver parar).
+        """
+        self.parar()
+        concurrent.futures.wait(list(self.__en_curso.values()))
+
+
+    def adelantar(self) -> None:
+        """
+        Hace que la siguiente iteración de cada GPU empiece ya, sin esperar
+        a su plazo.
+        """
+        self.__adelantar = True
+        self.__despertador.set()
+
+
+    def get_periodo(self, gpu: GPU) -> float:
+        """Devuelve el periodo de revisión de la GPU, en segundos."""
+        return self.__manager.get_periodo(gpu)
+
+
+    def get_retrasos(self, gpu: GPU) -> int:
+        """
+        Devuelve el número de iteraciones de la GPU que han terminado después
+        de su plazo.
+        """
+        return self.__retrasos[gpu.g_num()]
+
+
+    def get_latencia(self, gpu: GPU) -> Optional[float]:
+        """
+        Devuelve los segundos que tardó la última iteración de la GPU, o None
+        si todavía no ha terminado ninguna.
+        """
+        return self.__latencias[gpu.g_num()]
+
+
+    def __iteracion(self, gpu: GPU, inst: Optional[Instantanea], fallo: Optional[str] = None,
+                    compartido: Optional[tuple[LoteEscrituras, threading.Barrier]] = None) -> float:
+        """
+        Ejecuta una iteración del bucle de la GPU y devuelve el instante en
+        el que termina. Si no se ha podido leer o escribir algún valor, se
+        registra, se anota en el cortacircuitos de la GPU y se vuelve a
+        intentar en la siguiente iteración. Las escrituras de la iteración
+        se envían juntas al final (ver agrupar_escrituras).
+        Si inst es None, la GPU se lee por separado: así se hace con las
+        GPUs que vienen de fallar o cuando falla la lectura conjunta de
+        varias, para que una GPU averiada no haga fallar a las demás. Si
+        falla la lectura de esta GPU sola, fallo indica el error y la
+        iteración falla sin repetirla.
+        Si se indica compartido, las escrituras se acumulan en ese lote, que
+        comparten las GPUs leídas juntas, y se esperan en la barrera a las
+        demás iteraciones, la última de las cuales envía el lote.
+        """
+        inicio = time.perf_counter()
+        circuito = self.__manager.get_circuito(gpu)
+        lote, barrera = compartido if compartido is not None else (LoteEscrituras(), None)
+        try:
+            try:
+                if fallo is not None:
+                    raise ValueError(fallo)
+                if inst is None:
+                    inst = self.__manager.leer_instantanea([gpu])
+                with agrupar_escrituras(lote):
+                    circuito.recuperar()
+                    self.__manager.iteracion(gpu, inst)
+            finally:
+                # Aunque la iteración falle, las demás esperan a esta:
+                if barrera is None:
+                    lote.enviar()
+                else:
+                    barrera.wait()
+        except ValueError as e:
+            log(f'Error en la iteración de la GPU n.º {gpu.g_num()}: {e}', ERROR)
+            circuito.fallo(str(e))
+        else:
+            propias = {('gpu', gpu.g_num())} | {('fan', fan.get_f_num()) for fan in gpu.get_fans()}
+            errores = [e for destino, e in lote.get_errores().items() if destino in propias]
+            if errores:
+                circuito.fallo(errores[0])
+            else:
+                circuito.exito()
+        duracion = time.perf_counter() - inicio
+        self.__latencias[gpu.g_num()] = duracion
+        get_metricas().observar('tick_seconds', duracion, gpu=gpu.g_num())
+        return get_reloj().ahora()
+
+
+    def __recoger(self) -> None:
+        """
+        Recoge las iteraciones que han terminado y comprueba si se han
+        pasado de su plazo.
+        """
+        for gpu in self.__manager.get_gpus():
+            g_num = gpu.g_num()
+            tarea = self.__en_curso.get(g_num)
+            if tarea is None or not tarea.done():
+                continue
+            del self.__en_curso[g_num]
+            fin = tarea.result()
+            plazo = self.__proximos[g_num]
+            # El periodo puede haber cambiado durante la iteración:
+            self.__proximos[g_num] = self.__comienzos[g_num] + self.get_periodo(gpu)
+            if fin > plazo:
+                self.__retrasos[g_num] += 1
+                get_metricas().contar('tick_overruns_total', gpu=g_num)
+                log(f'La iteración de la GPU n.º {g_num} ha terminado '
+                    f'{fin - plazo:.1f} s después de su plazo.', WARNING,
+                    gpu=g_num, retraso=round(fin - plazo, 3))
+            while self.__proximos[g_num] <= fin:
+                self.__proximos[g_num] += self.get_periodo(gpu)
+
+
+    def ejecutar(self, hasta: Optional[float] = None) -> None:
+        """
+        Ejecuta el bucle de control de todas las GPUs indefinidamente o, si
+        se indica, hasta el instante indicado del reloj. Si se detiene (ver
+        parar), espera antes a que terminen las iteraciones en curso.
+        """
+        reloj = get_reloj()
+        while not self.__detenido and (hasta is None or reloj.ahora() < hasta):
+            recogidas = len(self.__en_curso)
+            self.__recoger()
+            if not self.__en_curso:
+                self.__manager.comprobar_configuracion()
+            if METRICAS_FICHERO is not None and len(self.__en_curso) < recogidas:
+                try:
+                    get_metricas().escribir(METRICAS_FICHERO)
+                except OSError as e:
+                    # Las métricas no pueden detener el control:
+                    get_metricas().contar('metrics_write_errors_total')
+                    log(f'No se pudo escribir el fichero de métricas {METRICAS_FICHERO}: {e}', ERROR)
+            ahora = reloj.ahora()
+            if self.__adelantar:
+                self.__adelantar = False
+                for g_num in self.__proximos:
+                    self.__proximos[g_num] = min(self.__proximos[g_num], ahora)
+            pendientes = [gpu for gpu in self.__manager.get_gpus()
+                          if self.__proximos[gpu.g_num()] <= ahora
+                          and gpu.g_num() not in self.__en_curso]
+            if pendientes:
+                # Las GPUs que vienen de fallar se leen por separado:
+                sanas = [gpu for gpu in pendientes if not self.__manager.get_circuito(gpu).get_fallos()]
+                inst, fallo = None, None
+                if sanas:
+                    try:
+                        inst = self.__manager.leer_instantanea(sanas)
+                    except ValueError as e:
+                        if len(sanas) == 1:
+                            fallo = str(e)
+                        else:
+                            log(f'Error al leer las GPUs; se leerán por separado: {e}', ERROR)
+                # Las GPUs leídas juntas envían también juntas sus escrituras:
+                compartido = None
+                if inst is not None and len(sanas) > 1:
+                    lote = LoteEscrituras()
+                    compartido = (lote, threading.Barrier(len(sanas), action=lote.enviar))
+                for gpu in pendientes:
+                    self.__comienzos[gpu.g_num()] = self.__proximos[gpu.g_num()]
+                    self.__proximos[gpu.g_num()] += self.get_periodo(gpu)
+                    self.__en_curso[gpu.g_num()] = self.__pool.submit(
+                        self.__iteracion, gpu,
+                        *((inst, fallo, compartido) if gpu in sanas else (None, None, None)))
+            libres = [p for g, p in self.__proximos.items() if g not in self.__en_curso]
+            espera = min(libres, default=ahora + SLEEP_MAX) - reloj.ahora()
+            if hasta is not None:
+                espera = min(espera, hasta - reloj.ahora())
+            if self.__en_curso:
+                reloj.esperar_tareas(list(self.__en_curso.values()), max(espera, 0.0))
+            elif espera > 0:
+                # Se despierta antes si se adelanta la iteración o se detiene:
+                reloj.esperar_evento(self.__despertador, espera)
+                self.__despertador.clear()
+        if self.__detenido:
+            concurrent.futures.wait(list(self.__en_curso.values()))
+
+
+class Apagado:
+    """
+    Controlador del enfriamiento que se hace antes de salir del script. Cada
+    GPU se enfría de forma independiente de las demás:
+    - Sus ventiladores se ponen a la velocidad del tramo de la curva en el
+      que está la temperatura de la GPU, o se quedan a la que tengan si es
+      mayor, pasando antes por el cebado si están parados.
+    - Cada ESCALADO_APAGADO segundos que pasen sin alcanzar t_fin, los
+      ventiladores suben al siguiente tramo de la curva, hasta v_max.
+    - En cuanto la GPU llega a t_fin, se pone en modo automático.
+    Si pasan plazo segundos y aún quedan GPUs calientes, se les aplica
+    ACCION_PLAZO: se dejan en modo manual a v_max ('v_max') o se ponen en
+    modo automático ('auto').
+    """
+
+    def __init__(self, manager: Manager, plazo: float = PLAZO_APAGADO) -> None:
+        self.__manager = manager
+        self.__plazo = plazo
+        self.__veloces: dict[int, int] = {}
+        self.__t_escalados: dict[int, float] = {}
+
+
+    def __paso(self, gpu: GPU, inst: Instantanea, lote: LoteEscrituras) -> bool:
+        """
+        Hace avanzar un paso el enfriamiento de la GPU, acumulando sus
+        escrituras en el lote indicado. Devuelve True si la GPU ya ha
+        alcanzado t_fin y se pone en modo automático.
+        """
+        with agrupar_escrituras(lote):
+            g_num = gpu.g_num()
+            temp = gpu.get_temp(inst)
+            if temp <= gpu.get_t_fin():
+                gpu.set_fan_control(0)
+                log(f'GPU n.º {g_num} a {temp} ºC: puesta en modo automático.')
+                return True
+            ahora = get_reloj().ahora()
+            if g_num not in self.__t_escalados:
+                self.__t_escalados[g_num] = ahora
+                for fan in gpu.get_fans():
+                    # Nunca se empieza por debajo de la velocidad que ya tiene:
+                    tramo = fan.get_curva().tramo(temp)
+                    veloc = max(tramo[1] if tramo is not None else fan.get_v_max(), fan.get_comandada() or 0)
+                    self.__veloces[fan.get_f_num()] = min(veloc, fan.get_v_max())
+            elif ahora - self.__t_escalados[g_num] >= ESCALADO_APAGADO:
+                self.__t_escalados[g_num] = ahora
+                log(f'GPU n.º {g_num} todavía a {temp} ºC: subiendo la velocidad.')
+                for fan in gpu.get_fans():
+                    veloc = fan.get_curva().veloc_superior(self.__veloces[fan.get_f_num()])
+                    self.__veloces[fan.get_f_num()] = min(veloc or fan.get_v_max(), fan.get_v_max())
+            for fan in gpu.get_fans():
+                if fan.cebando():
+                    fan.avanzar_cebado(inst)
+                    continue
+                veloc = self.__veloces[fan.get_f_num()]
+                if not fan.cebador(veloc, fan.get_veloc_actual(inst)):
+                    fan.set_speed(veloc)
+            return False
+
+
+    def ejecutar(self) -> bool:
+        """
+        Enfría todas las GPUs. Devuelve True si todas han alcanzado t_fin
+        antes de que venza el plazo.
+        """
+        reloj = get_reloj()
+        fin = reloj.ahora() + self.__plazo
+        pendientes = list(self.__manager.get_gpus())
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(pendientes))) as pool:
+            while pendientes and reloj.ahora() < fin:
+                try:
+                    inst = self.__manager.leer_instantanea(pendientes)
+                    # Las escrituras de todas las GPUs se envían juntas:
+                    with agrupar_escrituras() as lote:
+                        hechas = list(pool.map(lambda gpu: self.__paso(gpu, inst, lote), pendientes))
+                except ValueError as e:
+                    log(f'Error durante el enfriamiento: {e}', ERROR)
+                    break
+                pendientes = [gpu for gpu, hecha in zip(pendientes, hechas) if not hecha]
+                if pendientes:
+                    log('Esperando a que baje la temperatura...')
+                    periodos = [self.__manager.get_periodo(gpu) for gpu in pendientes]
+                    esperar(min(min(periodos), max(fin - reloj.ahora(), 0.0)))
+        if not pendientes:
+            return True
+        with agrupar_escrituras():
+            for gpu in pendientes:
+                if ACCION_PLAZO == 'v_max':
+                    log(f'GPU n.º {gpu.g_num()} sin enfriar a tiempo: se deja en modo '
+                        f'manual con los ventiladores al máximo.', WARNING)
+                    for fan in gpu.get_fans():
+                        fan.set_speed(fan.get_v_max())
+                else:
+                    log(f'GPU n.º {gpu.g_num()} sin enfriar a tiempo: puesta en modo automático.',
+                        WARNING)
+                    gpu.set_fan_control(0)
+        return False
+
+
+class ServidorControl:
+    """
+    Servidor del socket Unix de control. Cada petición es una línea con un
+    objeto JSON con la orden y sus argumentos, y cada respuesta otra línea
+    con un objeto JSON con "ok" y, si ha fallado, "error". En una misma
+    conexión se pueden hacer tantas peticiones como se quiera; si una
+    supera PETICION_MAX bytes, se rechaza y se cierra la conexión.
+    Las órdenes son:
+    - estado: devuelve el último estado de las GPUs y ventiladores, sin
+      acceder al hardware (ver Manager.get_estado).
+    - forzar (fan, veloc, segundos): fuerza la velocidad de un ventilador
+      durante un tiempo (ver Manager.forzar).
+    - liberar (fan): devuelve el ventilador a su curva.
+    - pausar (segundos, opcional) y reanudar: pausa y reanuda el control.
+    - releer: adelanta la siguiente iteración y vuelve a leer las
+      velocidades reales y la configuración (ver Manager.releer).
+    - auto: termina el script como al recibir SIGTERM, enfriando las GPUs
+      antes de ponerlas en modo automático (ver apagar).
+    """
+
+    def __init__(self, manager: Manager) -> None:
+        self.__manager = manager
+
+
+    @staticmethod
+    def __numero(peticion: dict, campo: str, defecto: Optional[float] = None) -> float:
+        """Devuelve el campo numérico indicado de la petición."""
+        valor = peticion.get(campo, defecto)
+        if valor is None:
+            raise ValueError(f'falta el campo {campo!r}')
+        if isinstance(valor, bool) or not isinstance(valor, (int, float)) or not math.isfinite(valor):
+            raise ValueError(f'el campo {campo!r} debe ser un número')
+        return valor
+
+
+    def atender(self, peticion: dict) -> dict:
+        """Ejecuta la orden de una petición y devuelve la respuesta."""
+        manager = self.__manager
+        orden = peticion.get('orden')
+        try:
+            if orden == 'estado':
+                return {'ok': True, **manager.get_estado()}
+            if orden == 'forzar':
+                manager.forzar(int(self.__numero(peticion, 'fan')),
+                               int(self.__numero(peticion, 'veloc')),
+                               float(self.__numero(peticion, 'segundos', 300.0)))
+            elif orden == 'liberar':
+                manager.liberar(int(self.__numero(peticion, 'fan')))
+            elif orden == 'pausar':
+                segundos = peticion.get('segundos')
+                manager.pausar(float(self.__numero(peticion, 'segundos')) if segundos is not None else None)
+            elif orden == 'reanudar':
+                manager.reanudar()
+            elif orden == 'releer':
+                manager.releer()
+            elif orden == 'auto':
+                planificador = manager.get_planificador()
+                if planificador is None:
+                    raise ValueError('el bucle de control no se está ejecutando')
+                log('Devolviendo el control al modo automático por orden del socket de control.')
+                # Las iteraciones en curso las espera el propio planificador
+                # (ver apagar), que es el único que toca sus tareas:
+                planificador.parar()
+            else:
+                raise ValueError(f'orden desconocida: {orden!r}')
+        except (ValueError, TypeError, OverflowError) as e:
+            return {'ok': False, 'error': str(e)}
+        return {'ok': True}
+
+
+    def servir(self, ruta: str) -> None:
+        """
+        Sirve las peticiones en el socket Unix de la ruta indicada, desde un
+        hilo aparte. Como sólo puede haber un proceso en ejecución (ver
+        adquirir_cerrojo), un socket anterior en esa ruta es de un proceso
+        que ya ha terminado y se puede borrar.
+        """
+        servidor = self
+
+        class Manejador(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                while linea := self.rfile.readline(PETICION_MAX + 1):
+                    if len(linea) > PETICION_MAX:
+                        # No se sabe dónde empieza la siguiente petición:
+                        respuesta = {'ok': False, 'error': f'la petición supera los {PETICION_MAX} bytes'}
+                        self.wfile.write((json.dumps(respuesta, ensure_ascii=False) + '\n').encode())
+                        return
+                    try:
+                        peticion = json.loads(linea)
+                        if not isinstance(peticion, dict):
+                            raise ValueError
+                    except (ValueError, RecursionError):
+                        respuesta = {'ok': False, 'error': 'la petición debe ser un objeto JSON'}
+                    else:
+                        respuesta = servidor.atender(peticion)
+                    self.wfile.write((json.dumps(respuesta, ensure_ascii=False) + '\n').encode())
+
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(ruta)
+        # El socket se crea ya con permisos 0600, sin que haya ningún
+        # momento en que otros usuarios puedan conectarse a él:
+        umask = os.umask(0o177)
+        try:
+            socket_servidor = socketserver.ThreadingUnixStreamServer(ruta, Manejador)
+        finally:
+            os.umask(umask)
+        socket_servidor.daemon_threads = True
+
+        def borrar() -> None:
+            with contextlib.suppress(OSError):
+                os.unlink(ruta)
+
+        atexit.register(borrar)
+        threading.Thread(target=socket_servidor.serve_forever, name='control', daemon=True).start()
+
+
 def get_query_num(query: str) -> int:
     """
     Función auxiliar usada por algunas funciones para ejecutar el comando
@@ -416,151 +3661,436 @@ def get_query_str(query: str) -> int:
     return int(run_command(query).stdout.strip())
 
 
-def run_command(command: str) -> subprocess.CompletedProcess[str]:
+def consultar_lote(consultas: list[str]) -> list[str]:
+    """
+    Ejecuta todas las consultas indicadas en una única invocación de
+    nvidia-settings y devuelve la respuesta de cada una de ellas, en el mismo
+    orden en que se han indicado. Con la opción -t, nvidia-settings escribe
+    la respuesta de cada consulta en una línea distinta.
+    """
+    if not consultas:
+        return []
+    lineas = run_command(*consultas).stdout.strip().split('\n')
+    if len(lineas) != len(consultas):
+        raise ValueError(f'Se esperaban {len(consultas)} respuestas de '
+                         f'nvidia-settings pero se han obtenido {len(lineas)}.')
+    return [linea.strip() for linea in lineas]
+
+
+def asignar_lote(asignaciones: list[str]) -> tuple[str, dict[str, str]]:
+    """
+    Hace todas las asignaciones indicadas (como '[fan:0]/GPUTargetFanSpeed=50')
+    en una única invocación de nvidia-settings, en el mismo orden. Devuelve la
+    salida del comando y los errores de las asignaciones que hayan fallado,
+    como {asignación: mensaje}.
+    nvidia-settings indica en cada mensaje de error la asignación a la que se
+    refiere. Como puede dejar de hacer las asignaciones que siguen a la que
+    falla, ésas también se dan por fallidas. Si el comando falla sin indicar
+    ninguna asignación, se dan por fallidas todas.
+    """
+    if not asignaciones:
+        return '', {}
+    resultado = run_command(*(f'-a={a}' for a in asignaciones), check=False)
+    lineas = [linea.strip() for linea in resultado.stderr.splitlines() if linea.strip()]
+    errores = {}
+    for asignacion in asignaciones:
+        error_asignacion = next((linea for linea in lineas if f"'{asignacion}'" in linea), None)
+        if error_asignacion is not None:
+            errores[asignacion] = error_asignacion
+        elif errores and resultado.returncode != 0:
+            errores[asignacion] = 'no se ha hecho por el error de una asignación anterior'
+    if resultado.returncode != 0 and not errores:
+        mensaje = ' '.join(lineas) or f'nvidia-settings ha terminado con el código {resultado.returncode}'
+        errores = dict.fromkeys(asignaciones, mensaje)
+    return resultado.stdout.strip(), errores
+
+
+def leer_utilizacion(respuesta: str) -> int:
+    """
+    Devuelve la utilización (en %) de la respuesta de nvidia-settings a la
+    consulta GPUUtilization, como 'graphics=45, memory=10, video=0, PCIe=0'.
+    Lanza ValueError si la respuesta no tiene ese formato.
+    """
+    encontrada = re.search(r'graphics=(\d+)', respuesta)
+    if encontrada is None:
+        raise ValueError(f'Respuesta inesperada de nvidia-settings a GPUUtilization: {respuesta.strip()!r}.')
+    return int(encontrada.group(1))
+
+
+def orden_escrituras(controles: dict[int, int],
+                     veloces: dict[int, int]) -> list[tuple[tuple[str, int], int]]:
+    """
+    Devuelve las escrituras de un lote como una lista de ((tipo, num),
+    valor) en el orden en que hay que hacerlas: primero los estados de
+    control que pasan a modo manual, para que se acepten las velocidades;
+    luego las velocidades, y por último los que vuelven a modo automático.
+    """
+    return ([(('gpu', g), e) for g, e in controles.items() if e]
+            + [(('fan', f), v) for f, v in veloces.items()]
+            + [(('gpu', g), e) for g, e in controles.items() if not e])
+
+
+def leer_topologia(salida: str) -> dict[int, list[int]]:
+    """
+    Extrae los ventiladores de cada GPU de la salida detallada de
+    'nvidia-settings -q=gpus -q=fans --verbose=all', que tiene una sección
+    por cada tipo ("2 GPUs on host:0", "3 Fans on host:0") con un bloque por
+    cada elemento ("[0] host:0[gpu:0] (...)"), y en el de cada GPU, los
+    ventiladores conectados a ella ("host:0[fan:0] (...)").
+    Si no se indica ningún ventilador conectado y sólo hay una GPU, todos
+    los ventiladores son suyos. Si hay varias, lanza ValueError.
+    """
+    gpus: dict[int, list[int]] = {}
+    num_fans = 0
+    secciones = re.split(r'^\s*(\d+) (GPUs?|Fans?) on .*$', salida, flags=re.MULTILINE)
+    for num, tipo, cuerpo in zip(secciones[1::3], secciones[2::3], secciones[3::3]):
+        if tipo.startswith('Fan'):
+            num_fans = int(num)
+            continue
+        bloques = re.split(r'^\s*\[\d+\]\s+\S*\[gpu:(\d+)\]', cuerpo, flags=re.MULTILINE)
+        for g_num, bloque in zip(bloques[1::2], bloques[2::2]):
+            gpus[int(g_num)] = sorted({int(f) for f in re.findall(r'\[fan:(\d+)\]', bloque)})
+    if not gpus:
+        raise ValueError('nvidia-settings no ha indicado ninguna GPU')
+    conectados = sum(len(fans) for fans in gpus.values())
+    if conectados == 0 and len(gpus) == 1:
+        gpus[next(iter(gpus))] = list(range(num_fans))
+    elif conectados != num_fans:
+        raise ValueError(f'nvidia-settings indica {num_fans} ventiladores pero sólo '
+                         f'{conectados} conectados a alguna GPU; indica GPUS_FANS')
+    return dict(sorted(gpus.items()))
+
+
+def topologia_de(fans_gpus: dict[int, int], num_gpus: int) -> dict[int, list[int]]:
+    """
+    Devuelve la topología {g_num: [f_num, ...]} que corresponde a la
+    asociación {f_num: g_num} de cada ventilador con su GPU.
+    """
+    topologia: dict[int, list[int]] = {g_num: [] for g_num in range(num_gpus)}
+    for f_num, g_num in sorted(fans_gpus.items()):
+        topologia[g_num].append(f_num)
+    return topologia
+
+
+def identidad_controlador() -> Optional[dict]:
+    """
+    Devuelve la versión del controlador de NVIDIA y los UUID de las GPUs
+    instaladas, leídos de /proc/driver/nvidia sin lanzar ningún proceso, o
+    None si no se pueden leer.
+    """
+    raiz = '/proc/driver/nvidia'
+    try:
+        with open(os.path.join(raiz, 'version'), encoding='utf-8') as fichero:
+            version = fichero.readline().strip()
+        uuids = []
+        for bus in sorted(os.listdir(os.path.join(raiz, 'gpus'))):
+            with open(os.path.join(raiz, 'gpus', bus, 'information'), encoding='utf-8') as fichero:
+                for linea in fichero:
+                    if linea.startswith('GPU UUID:'):
+                        uuids.append(linea.split(':', 1)[1].strip())
+    except OSError:
+        return None
+    return {'controlador': version, 'uuids': uuids}
+
+
+def obtener_topologia() -> dict[int, list[int]]:
+    """
+    Devuelve los ventiladores de cada GPU instalada ({g_num: [f_num, ...]}).
+    Si el backend lo permite (ver Backend.get_identidad), el resultado se
+    guarda en TOPOLOGIA_CACHE junto con la versión del controlador y los UUID
+    de las GPUs, y mientras éstos no cambien, los siguientes arranques lo
+    leen de ahí sin consultar nada más. Lanza ValueError si no se puede
+    averiguar.
+    """
+    backend = get_backend()
+    identidad = backend.get_identidad() if TOPOLOGIA_CACHE is not None else None
+    if identidad is not None:
+        try:
+            with open(TOPOLOGIA_CACHE, encoding='utf-8') as fichero:
+                cache = json.load(fichero)
+            if cache['identidad'] == identidad:
+                topologia = {int(g): [int(f) for f in fans] for g, fans in cache['gpus'].items()}
+                backend.set_topologia(topologia)
+                log(f'Topología leída de {TOPOLOGIA_CACHE}: {topologia}.', DEBUG)
+                return topologia
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+    topologia = backend.descubrir()
+    log(f'Topología descubierta: {topologia}.')
+    if identidad is not None:
+        try:
+            os.makedirs(os.path.dirname(TOPOLOGIA_CACHE), exist_ok=True)
+            temporal = f'{TOPOLOGIA_CACHE}.{os.getpid()}'
+            with open(temporal, 'w', encoding='utf-8') as fichero:
+                json.dump({'identidad': identidad, 'gpus': topologia}, fichero)
+            os.replace(temporal, TOPOLOGIA_CACHE)
+        except OSError as e:
+            log(f'No se pudo guardar la topología en {TOPOLOGIA_CACHE}: {e}.', WARNING)
+    return topologia
+
+
+def run_command(*commands: str, check: bool = True,
+                terse: bool = True) -> subprocess.CompletedProcess[str]:
     """
     Ejecuta el comando nvidia-settings con las opciones indicadas y devuelve
     el resultado que se podrá aprovechar luego para obtener la respuesta
-    necesaria.
+    necesaria. Si terse es True, se pide la salida abreviada (-t).
+    Cada invocación que no termina en TIMEOUT_COMANDO segundos se mata y se
+    repite hasta REINTENTOS veces, esperando ESPERA_REINTENTO segundos (el
+    doble en cada reintento); si check es True, también las que fallan, y
+    siempre las que no se pueden lanzar. Si no se consigue, lanza
+    ValueError. Así, lo más que puede tardar es
+    TIMEOUT_COMANDO * (REINTENTOS + 1) más las esperas.
+    """
+    comando = ['nvidia-settings', *commands] + (['-t'] if terse else [])
+    espera = ESPERA_REINTENTO
+    with get_metricas().medir('hardware_call_seconds', backend='nvidia-settings'):
+        for intento in range(REINTENTOS + 1):
+            if intento > 0:
+                log(f'Repitiendo nvidia-settings dentro de {espera:g} s: {fallo}.', WARNING)
+                get_metricas().contar('hardware_retries_total', backend='nvidia-settings')
+                get_reloj().dormir(espera)
+                espera *= 2
+            try:
+                resultado = lanzar(comando, TIMEOUT_COMANDO)
+            except subprocess.TimeoutExpired:
+                fallo, motivo = f'nvidia-settings no ha respondido en {TIMEOUT_COMANDO:g} s', 'timeout'
+            except OSError as e:
+                # No está en el PATH o no se ha podido crear el proceso (EAGAIN, ENOMEM...):
+                fallo, motivo = f'no se pudo lanzar nvidia-settings: {e.strerror or e}', 'lanzamiento'
+            else:
+                if not check or resultado.returncode == 0:
+                    return resultado
+                detalle = resultado.stderr.strip()
+                fallo = f'nvidia-settings ha terminado con el código {resultado.returncode}'
+                fallo, motivo = f'{fallo}: {detalle}' if detalle else fallo, 'error'
+            get_metricas().contar('hardware_failures_total', backend='nvidia-settings', motivo=motivo)
+    raise ValueError(fallo)
+
+
+def lanzar(comando: list[str], plazo: float) -> subprocess.CompletedProcess[str]:
+    """
+    Ejecuta el comando indicado en su propio grupo de procesos. Si no
+    termina en plazo segundos, mata el grupo entero (para no dejar colgado
+    ningún proceso hijo que retenga la salida) y lanza
+    subprocess.TimeoutExpired. También lo mata si la espera se interrumpe
+    (ver Interrupcion).
+    """
+    get_metricas().contar('spawns_total')
+    with get_metricas().medir('command_seconds'):
+        proceso = subprocess.Popen(comando, encoding='utf-8', stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, start_new_session=True)
+        try:
+            salida, errores = proceso.communicate(timeout=plazo)
+        except BaseException:
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(proceso.pid, signal.SIGKILL)
+            proceso.communicate()
+            raise
+    return subprocess.CompletedProcess(comando, proceso.returncode, salida, errores)
+
+
+_cerrojo = None
+
+
+def adquirir_cerrojo() -> bool:
+    """
+    Intenta bloquear FICHERO_PID y, si lo consigue, escribe en él el PID de
+    este proceso. El bloqueo se mantiene hasta que termina el proceso (el
+    sistema lo libera aunque el proceso muera de forma inesperada, así que
+    un fichero que haya quedado de una ejecución anterior no molesta).
+    Devuelve False si el fichero lo tiene bloqueado otro proceso.
+    Para que otro usuario no pueda hacer que se vacíe otro fichero ni
+    impedir que el script arranque, no se siguen enlaces simbólicos y se
+    sale del script si el fichero no es un fichero normal de este usuario.
+    """
+    global _cerrojo
+    if _cerrojo is not None:
+        return True
+    try:
+        fd = os.open(FICHERO_PID, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW | os.O_NONBLOCK | os.O_CLOEXEC,
+                     0o600)
+    except OSError as e:
+        error(f'No se pudo abrir el fichero {FICHERO_PID}: {e.strerror}.')
+    st = os.fstat(fd)
+    if not stat.S_ISREG(st.st_mode) or st.st_uid != os.geteuid():
+        os.close(fd)
+        error(f'El fichero {FICHERO_PID} no es un fichero normal de este usuario.')
+    fichero = os.fdopen(fd, 'r+', encoding='utf-8')
+    try:
+        fcntl.flock(fichero, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        fichero.close()
+        return False
+    fichero.truncate(0)
+    fichero.write(f'{os.getpid()}\n')
+    fichero.flush()
+    _cerrojo = fichero
+    return True
+
+
+def leer_pid() -> Optional[int]:
+    """
+    Devuelve el PID anotado en FICHERO_PID, o None si no hay ninguno.
     """
-    comando = ['nvidia-settings', command, '-t']
-    return subprocess.run(
-        comando,
-        encoding='utf-8',
-        check=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL
-    )
+    try:
+        fd = os.open(FICHERO_PID, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK)
+        with os.fdopen(fd, encoding='utf-8') as fichero:
+            return int(fichero.read().strip())
+    except (OSError, ValueError):
+        return None
 
 
 def kill_already_running() -> None:
     """
-    Si el script está ya ejecutándose, detiene todos los procesos menos éste.
+    Si el script está ya ejecutándose, detiene el proceso que lo está
+    ejecutando (enviándole SIGUSR1) y espera a poder bloquear FICHERO_PID.
     """
-    salir = False
-    while not salir:
-        salir = True
-        for p in psutil.process_iter():
-            if os.getpid() == p.pid:
-                continue
-            file = os.path.basename(__file__)
-            cmdline = ' '.join(p.cmdline())
-            if file in cmdline:
-                salir = False
-                os.kill(p.pid, signal.SIGUSR1)
-                log(f'Killed process {p.pid}')
-                esperar()
+    while not adquirir_cerrojo():
+        pid = leer_pid()
+        if pid is not None and pid != os.getpid():
+            try:
+                os.kill(pid, signal.SIGUSR1)
+                log(f'Killed process {pid}')
+            except ProcessLookupError:
+                pass
+        esperar(1.0)
 
 
 def hay_mas_procesos() -> bool:
     """
-    Devuelve True si hay ya un proceso ejecutándose para este script.
-    Se basa en el nombre del fichero, así que no es muy fiable.
-    TODO: Buscar otra forma de detectar mejor si el proceso es de este script.
+    Devuelve True si hay ya un proceso ejecutándose para este script, es
+    decir, si no se puede bloquear FICHERO_PID. Si se puede, queda
+    bloqueado por este proceso.
     """
-    for p in psutil.process_iter():
-        if os.getpid() == p.pid:
-            continue
-        file = os.path.basename(__file__)
-        cmdline = ' '.join(p.cmdline())
-        if file in cmdline:
-            return True
-    return False
+    return not adquirir_cerrojo()
+
+
+def log(s: str, nivel: int = INFO, **campos) -> None:
+    """
+    Genera un registro a la salida, si el nivel indicado está activo. Los
+    campos adicionales sólo aparecen en los formatos 'kv' y 'json'.
+    """
+    if nivel >= NIVEL_LOG:
+        get_registro().escribir(nivel, s, campos)
 
 
-def log(s: str) -> None:
-    """Genera un registro a la salida."""
-    ts = datetime.datetime.now().replace(microsecond=0)
-    print(f'{ts} - {s}')
-    sys.stdout.flush()
+def log_activo(nivel: int) -> bool:
+    """
+    Indica si se registran los mensajes del nivel indicado, para no hacer
+    trabajo (por ejemplo, consultas al hardware) sólo para un mensaje que
+    luego se va a descartar.
+    """
+    return nivel >= NIVEL_LOG
 
 
 def esperar(tiempo: float = SLEEP) -> None:
     """Detiene el proceso durante varios segundos (por omisión SLEEP = 7s)."""
-    time.sleep(tiempo)
+    get_reloj().dormir(tiempo)
 
 
-def finalizar(_signum, _frame) -> None:
+def apagar() -> None:
     """
-    Detiene correctamente la ejecución del script. Para ello:
-    - Se espera a que todas las GPUs estén por debajo de t_fin de temperatura.
-    - Pone los ventiladores a girar. Si gira a menos de la primera velocidad de
-      la curva, probamos primero con v_ceb. Si no, probamos a la primera
-      velocidad.
-    - Si después de 10 intentos, la temperatura aún no ha alcanzado el t_fin,
-      subimos la velocidad al siguiente tramo en la curva.
-    - Finalmente, pone el GPUFanControlState en modo automático.
+    Detiene el bucle de control y enfría las GPUs hasta t_fin antes de
+    ponerlas en modo automático, como mucho durante PLAZO_APAGADO segundos
+    (ver Apagado).
     """
     manager = Manager.get_singleton()
-    veloc = 0
-    i = 0
+    planificador = manager.get_planificador()
+    if planificador is not None:
+        planificador.detener()
+    inicio = get_reloj().ahora()
+    if Apagado(manager).ejecutar():
+        log('Fan control set back to auto mode.')
+    log(f'Apagado completado en {get_reloj().ahora() - inicio:.0f} s.')
 
-    while True:
-        # Si todas las GPUs están por debajo de t_fin, nos salimos:
-        try:
-            if all(gpu.get_temp() <= gpu.get_t_fin() for gpu in manager.get_gpus()):
-                break
-        except ValueError:
-            break
 
-        log('Esperando a que baje la temperatura...')
+# Señales que detienen el script enfriando antes las GPUs (ver finalizar):
+SENALES_FIN = (signal.SIGINT, signal.SIGHUP, signal.SIGQUIT,
+               signal.SIGABRT, signal.SIGALRM, signal.SIGTERM)
 
-        # Al principio:
-        if i == 0:
-            for gpu in manager.get_gpus():
-                for fan in gpu.get_fans():
-                    # Si gira a menos de la primera velocidad de la curva,
-                    # probamos primero con v_ceb. Si no, probamos a la
-                    # primera velocidad:
-                    it = iter(fan.get_curva())
-                    v_primera = next(it)
-                    if fan.get_speed() < v_primera:
-                        fan.arrancar()
-                        veloc = fan.get_v_ceb()
-                    else:
-                        veloc = v_primera
-                    fan.set_speed(veloc)
 
-        esperar()
+class Interrupcion(BaseException):
+    """
+    Excepción con la que el manejador de las señales (ver finalizar)
+    interrumpe el hilo principal. Hereda de BaseException, como
+    KeyboardInterrupt, para que no la capture ningún except Exception del
+    bucle de control.
+    """
 
-        # Si después de 10 intentos, la temperatura sigue alta:
-        if i == 10:
-            # Subimos la velocidad:
-            for gpu in manager.get_gpus():
-                for fan in gpu.get_fans():
-                    it = iter(fan.get_curva())
-                    v_primera = next(it)
-                    veloc = v_primera if fan.get_speed() < v_primera else next(it)
-                    fan.set_speed(veloc)
-            i += 1
-        elif i < 10:
-            i += 1
+    def __init__(self, senal: int) -> None:
+        super().__init__(senal)
+        self.__senal = senal
 
-    manager.set_fans_control(0)
-    log('Fan control set back to auto mode.')
-    sys.exit(0)
+
+    def get_senal(self) -> int:
+        """Devuelve la señal recibida."""
+        return self.__senal
+
+
+def ignorar_senales() -> None:
+    """
+    Ignora las señales de terminación y SIGUSR1, para que ninguna
+    interrumpa el apagado.
+    """
+    for sig in SENALES_FIN + (signal.SIGUSR1,):
+        signal.signal(sig, signal.SIG_IGN)
+
+
+def finalizar(signum, _frame) -> None:
+    """
+    Manejador de las señales de terminación (SENALES_FIN) y de SIGUSR1.
+    Sólo interrumpe el bucle de control lanzando Interrupcion: el apagado
+    (ver apagar y finalizar_usr) lo hace main() fuera del manejador, ya que
+    éste se ejecuta en el hilo principal en cualquier punto, quizá con un
+    cerrojo cogido (el de las métricas, por ejemplo), y volver a cogerlo
+    dentro del manejador bloquearía el proceso.
+    """
+    ignorar_senales()
+    raise Interrupcion(signum)
+
+
+def devolver_control() -> None:
+    """
+    Último recurso ante un error inesperado: detiene el planificador y pone
+    todas las GPUs en modo automático sin enfriarlas antes, para que el
+    controlador se haga cargo de los ventiladores en lugar de dejarlos en
+    modo manual a la última velocidad establecida.
+    """
+    manager = Manager.get_singleton()
+    planificador = manager.get_planificador()
+    if planificador is not None:
+        planificador.detener()
+    with agrupar_escrituras():
+        manager.set_fans_control(0)
 
 
-def finalizar_usr(_signum, _frame) -> None:
+def finalizar_usr() -> None:
     """
     Finaliza el proceso pero dejándolo en modo manual y sin hacer ninguna
-    comprobación sobre la temperatura de la GPU.
+    comprobación sobre la temperatura de la GPU. Es lo que se hace al
+    recibir SIGUSR1 (ver kill_already_running).
     ADVERTENCIA: Usar sólo si se sabe lo que se está haciendo.
     """
     msg = "Proceso temp.py detenido.\n\n¡CUIDADO! El control sigue en modo manual."
     comando = ['notify-send', '-u', 'critical', msg]
     subprocess.run(comando, encoding='utf-8', check=True, stdout=subprocess.PIPE)
-    log(msg)
+    log(msg, WARNING)
     sys.exit(0)
 
 
 def error(s: str) -> None:
     """Muestra un mensaje de error en el registro y se sale del script."""
-    log(f'Error: {s}')
+    log(f'Error: {s}', ERROR)
+    get_registro().vaciar()
     sys.exit(1)
 
 
-def comprobaciones() -> None:
-    """Lleva a cabo varias comprobaciones previas a empezar."""
+def comprobaciones(configuracion: dict) -> None:
+    """
+    Lleva a cabo varias comprobaciones previas a empezar, entre ellas que
+    las GPUs y ventiladores de la configuración coinciden con los instalados.
+    """
     # kill_already_running()
     if hay_mas_procesos():
         error('Hay otro proceso ejecutándose.')
@@ -570,52 +4100,272 @@ def comprobaciones() -> None:
     except ValueError:
         error('No se pudo obtener el número de GPUs y ventiladores.')
 
-    if GPU.get_num_gpus() != len(GPUS_FANS):
-        error('El número de GPUs instaladas no coincide con los que aparecen en GPUS_FANS.')
+    if GPU.get_num_gpus() != len(configuracion):
+        error('El número de GPUs instaladas no coincide con el de la configuración.')
 
-    if Fan.get_num_fans() != sum(len(f) for f in GPUS_FANS.values()):
-        error('El número de ventiladores instalados no coincide con los que aparecen en GPUS_FANS.')
+    if Fan.get_num_fans() != sum(len(g['fans']) for g in configuracion.values()):
+        error('El número de ventiladores instalados no coincide con el de la configuración.')
 
 
 def main() -> None:
     """Función principal."""
-    sigs = {
-        signal.SIGINT,
-        signal.SIGHUP,
-        signal.SIGQUIT,
-        signal.SIGABRT,
-        signal.SIGALRM,
-        signal.SIGTERM
-    }
-    for sig in sigs:
+    fichero = Configuracion(CONFIGURACION) if CONFIGURACION is not None else None
+    configuracion = cargar_configuracion(fichero)
+    comprobaciones(configuracion)
+
+    manager = Manager.get_singleton()
+    manager.set_configuracion(fichero)
+    manager.set_gpus(crear_gpus(configuracion))
+    # Hasta aquí no se ha tocado el hardware, así que las señales pueden
+    # terminar el proceso sin más:
+    for sig in SENALES_FIN + (signal.SIGUSR1,):
         signal.signal(sig, finalizar)
-    signal.signal(signal.SIGUSR1, finalizar_usr)
+    manual = False
+    try:
+        try:
+            with agrupar_escrituras() as lote:
+                manager.set_fans_control(1)
+                manager.set_speeds(V_MIN)
+            if any(tipo == 'gpu' for tipo, _ in lote.get_errores()):
+                error('No se pudo poner en modo manual el control de los ventiladores.')
+
+            try:
+                get_telemetria()
+            except (OSError, ValueError) as e:
+                error(f'No se pudo abrir el fichero de telemetría: {e}.')
+            if METRICAS_PUERTO is not None:
+                get_metricas().servir(METRICAS_PUERTO)
+            planificador = Planificador(manager)
+            if SOCKET_CONTROL is not None:
+                try:
+                    ServidorControl(manager).servir(SOCKET_CONTROL)
+                except OSError as e:
+                    error(f'No se pudo crear el socket de control {SOCKET_CONTROL}: {e}.')
+            # El bucle termina al recibir una señal o por orden del socket de control:
+            planificador.ejecutar()
+        except Interrupcion as e:
+            manual = e.get_senal() == signal.SIGUSR1
+        ignorar_senales()
+        if not manual:
+            apagar()
+    except BaseException:
+        # Ningún error, ni siquiera uno inesperado, puede dejar los
+        # ventiladores en modo manual sin nadie que los controle:
+        ignorar_senales()
+        log('Devolviendo todas las GPUs al modo automático por un error.', ERROR)
+        devolver_control()
+        raise
+    if manual:
+        finalizar_usr()
+
+
+def simular(horas: float, semilla: int = 0) -> None:
+    """
+    Ejecuta el bucle de control contra el simulador térmico (SimBackend)
+    con un reloj virtual durante las horas indicadas, y muestra al final un
+    informe con el tiempo pasado por encima de T_MAX, el número de cambios
+    de velocidad y el número de cebados de cada GPU y ventilador.
+    """
+    set_reloj(RelojVirtual())
+    get_registro().set_sincrono(True)
+    fichero = Configuracion(CONFIGURACION) if CONFIGURACION is not None else None
+    # Sin GPUS_FANS ni fichero, se simula una GPU con un ventilador:
+    configuracion = cargar_configuracion(fichero, {0: [0]})
+    fans_gpus = {f_num: g_num for g_num, g_datos in configuracion.items() for f_num in g_datos['fans']}
+    sim = SimBackend(fans_gpus, semilla)
+    set_backend(sim)
+
+    manager = Manager.get_singleton()
+    manager.set_configuracion(fichero)
+    manager.set_gpus(crear_gpus(configuracion))
+    with agrupar_escrituras():
+        manager.set_fans_control(1)
+        manager.set_speeds(V_MIN)
+    get_telemetria()
+
+    Planificador(manager).ejecutar(get_reloj().ahora() + horas * 3600)
+
+    log(f'Simulación de {horas} h finalizada.')
+    for gpu in manager.get_gpus():
+        g_num = gpu.g_num()
+        periodo = manager.get_muestreo(gpu).get_periodo_efectivo() or 0.0
+        log(f'GPU n.º {g_num}: {sim.get_t_sobre_max(g_num):.0f} s por encima de '
+            f'{gpu.get_t_max()} ºC - Temp. máxima: {sim.get_temp_max(g_num):.1f} ºC - '
+            f'Una lectura cada {periodo:.1f} s de media')
+        for fan in gpu.get_fans():
+            f_num = fan.get_f_num()
+            log(f'Ventilador n.º {f_num}: {sim.get_cambios(f_num)} cambios de '
+                f'velocidad - {fan.get_cebados()} cebados - '
+                f'{fan.get_retenidas()} bajadas retenidas')
+
+
+PARAMS_GPU = ('t_min', 't_max', 't_fin', 'sleep', 'sleep_ceb', 'anticipacion', 'salto_carga')
+PARAMS_FAN = ('v_min', 'v_max', 'v_ini', 'v_ceb', 't_ini', 'histeresis', 'permanencia',
+              'modo', 'pendiente', 'consigna', 'kp', 'ki', 'kd', 'curva')
+
+
+def normalizar_configuracion(datos: dict, topologia: Optional[dict[int, list[int]]] = None) -> dict:
+    """
+    Comprueba una configuración leída de un fichero y la devuelve en la
+    forma {g_num: {'params': {...}, 'fans': {f_num: {'params': {...},
+    'curva': {temp: veloc}}}}}. Lanza ValueError si no es válida.
+    Si no tiene la tabla "gpus", se usan las GPUs y ventiladores de la
+    topología indicada ({g_num: [f_num, ...]}), con los parámetros de la
+    raíz.
+    Los parámetros de las GPUs (PARAMS_GPU) y de los ventiladores
+    (PARAMS_FAN) se pueden indicar en la raíz, en cada GPU o en cada
+    ventilador, y los más concretos sustituyen a los más generales. Los que
+    no se indiquen en ningún sitio toman el valor de las constantes del
+    script (T_MIN, V_CEB, SLEEP, CURVA...).
+    """
+    def comprobar_claves(nivel: dict, permitidas: tuple, donde: str) -> None:
+        if not isinstance(nivel, dict):
+            raise ValueError(f'{donde} debe ser una tabla')
+        for clave in nivel:
+            if clave not in permitidas:
+                raise ValueError(f'parámetro desconocido {clave!r} en {donde}')
+
+    def numero(valor, donde: str, tipo: type = int):
+        # Infinity y NaN (que json acepta) no son números válidos:
+        if isinstance(valor, bool) or not isinstance(valor, (int, float)) \
+                or not math.isfinite(valor) or (tipo is int and valor != int(valor)):
+            raise ValueError(f'{donde} debe ser un número{" entero" if tipo is int else ""}')
+        return tipo(valor)
+
+    def clave(valor, donde: str) -> int:
+        # En JSON y TOML las claves son siempre cadenas:
+        return numero(int(valor) if isinstance(valor, str) and valor.isdigit() else valor, donde)
+
+    por_omision = {'t_min': T_MIN, 't_max': T_MAX, 't_fin': T_FIN, 'sleep': SLEEP,
+                   'sleep_ceb': SLEEP_CEB, 'anticipacion': ANTICIPACION, 'salto_carga': SALTO_CARGA,
+                   'v_min': V_MIN, 'v_max': V_MAX, 'v_ini': V_INI,
+                   'v_ceb': V_CEB, 't_ini': T_INI, 'histeresis': HISTERESIS,
+                   'permanencia': PERMANENCIA, 'modo': MODO, 'pendiente': PENDIENTE,
+                   'consigna': CONSIGNA, 'kp': KP, 'ki': KI, 'kd': KD, 'curva': CURVA}
+    comprobar_claves(datos, PARAMS_GPU + PARAMS_FAN + ('gpus',), 'la raíz')
+    gpus = datos.get('gpus')
+    if gpus is None and topologia is not None:
+        gpus = {g_num: {'fans': {f_num: {} for f_num in fans}} for g_num, fans in topologia.items()}
+    if not isinstance(gpus, dict) or not gpus:
+        raise ValueError('falta la tabla "gpus" con al menos una GPU')
+    configuracion = {}
+    for g_clave, g_datos in gpus.items():
+        g_donde = f'la GPU {g_clave}'
+        comprobar_claves(g_datos, PARAMS_GPU + PARAMS_FAN + ('fans',), g_donde)
+        fans = g_datos.get('fans')
+        if not isinstance(fans, dict) or not fans:
+            raise ValueError(f'falta la tabla "fans" con al menos un ventilador en {g_donde}')
+        params = {**por_omision,
+                  **{k: v for k, v in datos.items() if k != 'gpus'},
+                  **{k: v for k, v in g_datos.items() if k != 'fans'}}
+        g_params = {k: numero(params[k], f'{k} de {g_donde}')
+                    for k in ('t_min', 't_max', 't_fin', 'anticipacion', 'salto_carga')}
+        g_params.update({k: numero(params[k], f'{k} de {g_donde}', float)
+                         for k in ('sleep', 'sleep_ceb')})
+        if g_params['t_min'] >= g_params['t_max']:
+            raise ValueError(f't_min debe ser menor que t_max en {g_donde}')
+        if g_params['sleep'] <= 0 or g_params['sleep_ceb'] <= 0:
+            raise ValueError(f'sleep y sleep_ceb deben ser positivos en {g_donde}')
+        if g_params['anticipacion'] < 0:
+            raise ValueError(f'anticipacion no puede ser negativo en {g_donde}')
+        if not 0 < g_params['salto_carga'] <= 100:
+            raise ValueError(f'salto_carga debe estar en el rango (0, 100] en {g_donde}')
+        g_fans = {}
+        for f_clave, f_datos in fans.items():
+            f_donde = f'ventilador {f_clave}'
+            comprobar_claves(f_datos, PARAMS_FAN, f'el {f_donde}')
+            f_todos = {**params, **f_datos}
+            f_params = {k: numero(f_todos[k], f'{k} del {f_donde}') for k in ('v_min', 'v_max', 'v_ini', 'v_ceb')}
+            f_params['t_ini'] = numero(f_todos['t_ini'], f't_ini del {f_donde}', float)
+            f_params['histeresis'] = numero(f_todos['histeresis'], f'histeresis del {f_donde}')
+            f_params['permanencia'] = numero(f_todos['permanencia'], f'permanencia del {f_donde}', float)
+            f_params['consigna'] = numero(f_todos['consigna'], f'consigna del {f_donde}')
+            f_params.update({k: numero(f_todos[k], f'{k} del {f_donde}', float)
+                             for k in ('pendiente', 'kp', 'ki', 'kd')})
+            if not isinstance(f_todos['modo'], str) or f_todos['modo'] not in MODOS_CONTROL:
+                raise ValueError(f'el modo del {f_donde} debe ser uno de {", ".join(MODOS_CONTROL)}')
+            f_params['modo'] = f_todos['modo']
+            if not 0 <= f_params['v_min'] <= f_params['v_max'] <= 100:
+                raise ValueError(f'debe ser 0 <= v_min <= v_max <= 100 en el {f_donde}')
+            for k in ('v_ini', 'v_ceb'):
+                if f_params[k] not in range(f_params['v_min'], f_params['v_max'] + 1):
+                    raise ValueError(f'{k} debe estar entre v_min y v_max en el {f_donde}')
+            for k in ('t_ini', 'histeresis', 'permanencia', 'kp', 'ki', 'kd'):
+                if f_params[k] < 0:
+                    raise ValueError(f'{k} no puede ser negativo en el {f_donde}')
+            if f_params['pendiente'] <= 0:
+                raise ValueError(f'pendiente debe ser positivo en el {f_donde}')
+            if not g_params['t_min'] <= f_params['consigna'] < g_params['t_max']:
+                raise ValueError(f'la consigna del {f_donde} debe estar en el rango [t_min, t_max)')
+            if not isinstance(f_todos['curva'], dict):
+                raise ValueError(f'la curva del {f_donde} debe ser una tabla')
+            curva = {clave(t, f'la temperatura {t!r} de la curva del {f_donde}'):
+                     numero(v, f'la velocidad del tramo {t} de la curva del {f_donde}')
+                     for t, v in f_todos['curva'].items()}
+            try:
+                Curva(curva, f_params['v_min'], f_params['v_max']).validar_temps(
+                    g_params['t_min'], g_params['t_max'])
+            except ValueError as e:
+                raise ValueError(f'la curva del {f_donde} no es válida: {e}')
+            g_fans[clave(f_clave, f'el número del {f_donde}')] = {'params': f_params, 'curva': curva}
+        configuracion[clave(g_clave, f'el número de {g_donde}')] = {'params': g_params, 'fans': g_fans}
+    return configuracion
+
+
+def cargar_configuracion(configuracion: Optional[Configuracion],
+                         topologia: Optional[dict[int, list[int]]] = None) -> dict:
+    """
+    Devuelve la configuración inicial normalizada: la del fichero indicado
+    o, si no se indica, la que forman GPUS_FANS y las constantes del script.
+    Si el fichero no indica las GPUs, se usan las de GPUS_FANS o, si es
+    None, las de la topología indicada o, si no se indica, las que se
+    descubren (ver obtener_topologia).
+    Si el fichero no es válido o no se puede averiguar la topología, se sale
+    del script.
+    """
+    if configuracion is None and GPUS_FANS is not None:
+        return normalizar_configuracion(
+            {'gpus': {g_num: {'fans': {f_num: {'curva': curva} for f_num, curva in f_items.items()}}
+                      for g_num, f_items in GPUS_FANS.items()}})
+    if topologia is None and GPUS_FANS is not None:
+        topologia = {g_num: list(f_items) for g_num, f_items in GPUS_FANS.items()}
+    if topologia is None:
+        try:
+            topologia = obtener_topologia()
+        except (ValueError, OSError) as e:
+            error(f'No se pudieron descubrir las GPUs y los ventiladores: {e}.')
+    if configuracion is None:
+        return normalizar_configuracion({}, topologia)
+    try:
+        return configuracion.leer(topologia)
+    except ValueError as e:
+        error(f'La configuración de {configuracion.get_ruta()} no es válida: {e}.')
 
-    comprobaciones()
 
+def crear_gpus(configuracion: dict) -> list[GPU]:
+    """
+    Crea las GPUs y sus ventiladores a partir de la configuración indicada
+    (ver normalizar_configuracion).
+    """
     gpus = []
-    for g_num, f_items in GPUS_FANS.items():
+    for g_num, g_datos in configuracion.items():
         fans = []
-        for f_num, curva in f_items.items():
-            params = {'v_min': V_MIN, 'v_max': V_MAX, 'v_ini': V_INI,
-                      'v_ceb': V_CEB, 't_ini': T_INI}
-            fan = Fan(f_num, params, curva)
+        for f_num, f_datos in g_datos['fans'].items():
+            fan = Fan(f_num, f_datos['params'], f_datos['curva'])
             fans.append(fan)
-        gpu = GPU(g_num, {'t_min': T_MIN, 't_max': T_MAX, 't_fin': T_FIN}, fans)
+        gpu = GPU(g_num, g_datos['params'], fans)
         gpus.append(gpu)
-
-    manager = Manager.get_singleton()
-    manager.set_gpus(gpus)
-    manager.set_fans_control(1)
-    manager.set_speeds(V_MIN)
-
-    while True:
-        for gpu in manager.get_gpus():
-            temp_actual = gpu.get_temp()
-            for fan in gpu.get_fans():
-                manager.bucle(temp_actual, gpu, fan)
-            esperar()
+    return gpus
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Control de los ventiladores de las GPUs NVIDIA.')
+    parser.add_argument('--simular', metavar='HORAS', type=float,
+                        help='simula las horas indicadas con un modelo térmico y un reloj virtual')
+    parser.add_argument('--semilla', type=int, default=0,
+                        help='semilla aleatoria de la simulación')
+    args = parser.parse_args()
+    if args.simular is not None:
+        simular(args.simular, args.semilla)
+    else:
+        main()
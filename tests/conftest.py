@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import temp
+
+
+@pytest.fixture(autouse=True)
+def entorno(monkeypatch):
+    """
+    Cada prueba usa un reloj virtual, métricas nuevas, el registro síncrono
+    y ningún backend ni fichero del sistema.
+    """
+    monkeypatch.setattr(temp, 'NIVEL_LOG', temp.ERROR)
+    monkeypatch.setattr(temp, '_reloj', temp.RelojVirtual())
+    monkeypatch.setattr(temp, '_metricas', temp.Metricas())
+    monkeypatch.setattr(temp, '_backend', None)
+    monkeypatch.setattr(temp, 'METRICAS_FICHERO', None)
+    monkeypatch.setattr(temp, 'TELEMETRIA_FICHERO', None)
+    temp.get_registro().set_sincrono(True)
+
+
+@pytest.fixture
+def montar():
+    """
+    Devuelve una función que crea un FakeBackend con las GPUs y
+    ventiladores indicados ({g_num: [f_num, ...]}) a la temperatura
+    indicada, y un Manager con la configuración indicada (ver
+    normalizar_configuracion) y sus GPUs ya en modo manual. Devuelve el
+    backend y el manager.
+    """
+    def montar(topologia: dict, datos: dict = None, temperatura: int = 40):
+        fans_gpus = {f_num: g_num for g_num, fans in topologia.items() for f_num in fans}
+        backend = temp.FakeBackend(fans_gpus, temperatura)
+        temp.set_backend(backend)
+        manager = temp.Manager()
+        manager.set_gpus(temp.crear_gpus(temp.normalizar_configuracion(datos or {}, topologia)))
+        with temp.agrupar_escrituras():
+            manager.set_fans_control(1)
+            manager.set_speeds(temp.V_MIN)
+        return backend, manager
+    return montar
+
+
+def metrica(nombre: str, **etiquetas) -> float:
+    """Devuelve el valor actual de una métrica, o 0 si no tiene ninguno."""
+    pares = ','.join(f'{k}="{v}"' for k, v in sorted(etiquetas.items()))
+    muestra = temp.Metricas.PREFIJO + nombre + (f'{{{pares}}}' if pares else '') + ' '
+    for linea in temp.get_metricas().texto().splitlines():
+        if linea.startswith(muestra):
+            return float(linea.split()[-1])
+    return 0.0
@@ -0,0 +1,73 @@
+import temp
+
+from conftest import metrica
+
+
+def test_anticipa_un_salto_de_carga(montar):
+    _, manager = montar({0: [0]}, {'anticipacion': 20, 'salto_carga': 30})
+    gpu = manager.get_gpus()[0]
+    anticipacion = temp.Anticipacion()
+    anticipacion.actualizar(gpu, 52, 10, 0.0, 0.0)
+    assert anticipacion.get_temp_anticipada() is None
+    anticipacion.actualizar(gpu, 52, 30, 0.0, 7.0)
+    assert anticipacion.get_temp_anticipada() is None
+
+    # +70 puntos de carga: 20 ºC * 70 / 100 = 14 ºC más:
+    anticipacion.actualizar(gpu, 52, 100, 0.0, 14.0)
+    assert anticipacion.get_temp_anticipada() == 52 + 14
+    assert anticipacion.temperatura(55) == 66
+    assert anticipacion.temperatura(70) == 70
+    assert metrica('anticipations_total', gpu=0) == 1
+    assert metrica('gpu_anticipated_celsius', gpu=0) == 66
+
+
+def test_la_anticipacion_termina_al_confirmarse(montar):
+    _, manager = montar({0: [0]}, {'anticipacion': 20, 'salto_carga': 30})
+    gpu = manager.get_gpus()[0]
+
+    def anticipando() -> temp.Anticipacion:
+        anticipacion = temp.Anticipacion()
+        anticipacion.actualizar(gpu, 50, 0, 0.0, 0.0)
+        anticipacion.actualizar(gpu, 50, 100, 0.0, 7.0)
+        assert anticipacion.get_temp_anticipada() == 70
+        return anticipacion
+
+    # Al alcanzar la temperatura anticipada:
+    anticipacion = anticipando()
+    anticipacion.actualizar(gpu, 70, 100, 1.0, 14.0)
+    assert anticipacion.get_temp_anticipada() is None
+    # Al volver a bajar la carga:
+    anticipacion = anticipando()
+    anticipacion.actualizar(gpu, 55, 10, 1.0, 14.0)
+    assert anticipacion.get_temp_anticipada() is None
+    # Al dejar de subir la temperatura pasado ESTABILIZACION:
+    anticipacion = anticipando()
+    anticipacion.actualizar(gpu, 58, 100, 0.0, 7.0 + temp.ESTABILIZACION / 2)
+    assert anticipacion.get_temp_anticipada() == 70
+    anticipacion.actualizar(gpu, 58, 100, 0.0, 7.0 + temp.ESTABILIZACION)
+    assert anticipacion.get_temp_anticipada() is None
+
+
+def test_el_bucle_sube_los_ventiladores_antes_de_calentarse(montar):
+    backend, manager = montar({0: [0]}, {'anticipacion': 20, 'salto_carga': 30}, temperatura=52)
+    planificador = temp.Planificador(manager)
+    reloj = temp.get_reloj()
+    planificador.ejecutar(reloj.ahora() + 60)
+    assert backend.get_speed(0) == 45
+
+    backend.set_carga(0, 100)
+    planificador.ejecutar(reloj.ahora() + 30)
+    # Se controla como si estuviera a 52 + 20 = 72 ºC, aunque siga a 52 ºC:
+    assert backend.get_speed(0) == 75
+    assert backend.get_temp(0) == 52
+
+
+def test_sin_anticipacion_no_se_lee_la_carga(montar):
+    backend, manager = montar({0: [0]}, temperatura=52)
+    planificador = temp.Planificador(manager)
+    reloj = temp.get_reloj()
+    planificador.ejecutar(reloj.ahora() + 30)
+    backend.set_carga(0, 100)
+    planificador.ejecutar(reloj.ahora() + 30)
+    assert backend.get_speed(0) == 45
+    assert manager.get_anticipacion(manager.get_gpus()[0]).get_carga() is None
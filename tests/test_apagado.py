@@ -0,0 +1,117 @@
+import signal
+
+import pytest
+
+import temp
+
+
+def test_apagado_pone_en_automatico_las_gpus_frias(montar):
+    backend, manager = montar({0: [0], 1: [1]}, temperatura=temp.T_FIN)
+    assert temp.Apagado(manager, plazo=60).ejecutar()
+    assert backend.get_control(0) == backend.get_control(1) == 0
+    assert temp.get_reloj().ahora() == 0
+
+
+def test_apagado_sube_por_la_curva_y_aplica_la_accion_al_vencer_el_plazo(montar, monkeypatch):
+    monkeypatch.setattr(temp, 'ACCION_PLAZO', 'v_max')
+    backend, manager = montar({0: [0]}, temperatura=70)
+    assert not temp.Apagado(manager, plazo=300).ejecutar()
+    assert temp.get_reloj().ahora() == pytest.approx(300)
+    veloces = [valor for atributo, _, valor in backend.get_escrituras() if atributo == 'GPUTargetFanSpeed']
+    # Cebado, el tramo de 70 ºC, uno más cada ESCALADO_APAGADO segundos y V_MAX al final:
+    assert veloces == [temp.V_MIN, temp.V_CEB, 75, 80, 85, temp.V_MAX]
+    assert backend.get_control(0) == 1
+
+
+def test_apagado_no_baja_la_velocidad_de_los_ventiladores(montar, monkeypatch):
+    monkeypatch.setattr(temp, 'ACCION_PLAZO', 'v_max')
+    backend, manager = montar({0: [0]}, temperatura=82)
+    temp.Planificador(manager).ejecutar(temp.get_reloj().ahora() + 120)
+    assert backend.get_speed(0) == 85
+
+    backend.set_temp(0, 56)
+    escrituras = len(backend.get_escrituras())
+    assert not temp.Apagado(manager, plazo=2 * temp.ESCALADO_APAGADO).ejecutar()
+    veloces = [valor for atributo, _, valor in backend.get_escrituras()[escrituras:]
+               if atributo == 'GPUTargetFanSpeed']
+    assert veloces == [temp.V_MAX]
+
+
+def test_apagado_devuelve_al_modo_automatico_al_vencer_el_plazo(montar, monkeypatch):
+    monkeypatch.setattr(temp, 'ACCION_PLAZO', 'auto')
+    backend, manager = montar({0: [0]}, temperatura=70)
+    assert not temp.Apagado(manager, plazo=60).ejecutar()
+    assert backend.get_control(0) == 0
+
+
+def test_apagado_enfria_cada_gpu_por_separado(montar, monkeypatch):
+    monkeypatch.setattr(temp, 'ACCION_PLAZO', 'v_max')
+    backend, manager = montar({0: [0], 1: [1]}, temperatura=70)
+    esperar = temp.esperar
+
+    def enfriar(tiempo):
+        # La GPU 0 se enfría en cuanto se encienden sus ventiladores:
+        backend.set_temp(0, temp.T_FIN)
+        esperar(tiempo)
+
+    monkeypatch.setattr(temp, 'esperar', enfriar)
+    assert not temp.Apagado(manager, plazo=120).ejecutar()
+    assert backend.get_control(0) == 0
+    assert backend.get_control(1) == 1
+    assert backend.get_speed(1) == temp.V_MAX
+
+
+def test_apagado_termina_si_falla_el_hardware(montar):
+    backend, manager = montar({0: [0]}, temperatura=70)
+    backend.set_averiada(0)
+    assert not temp.Apagado(manager, plazo=300).ejecutar()
+    assert temp.get_reloj().ahora() == 0
+
+
+@pytest.fixture
+def senales():
+    """Restaura los manejadores de las señales, que finalizar cambia."""
+    manejadores = {sig: signal.getsignal(sig) for sig in temp.SENALES_FIN + (signal.SIGUSR1,)}
+    yield
+    for sig, manejador in manejadores.items():
+        signal.signal(sig, manejador)
+
+
+def test_finalizar_solo_interrumpe_el_hilo_principal(senales, monkeypatch):
+    def prohibido(*args, **kwargs):
+        raise AssertionError('el manejador de las señales no debe usar cerrojos')
+
+    # Las métricas y el registro usan cerrojos que el hilo principal puede
+    # tener cogidos al llegar la señal:
+    monkeypatch.setattr(temp, 'get_metricas', prohibido)
+    monkeypatch.setattr(temp, 'log', prohibido)
+    with pytest.raises(temp.Interrupcion) as excepcion:
+        temp.finalizar(signal.SIGTERM, None)
+    assert excepcion.value.get_senal() == signal.SIGTERM
+    # Ninguna otra señal puede interrumpir el apagado:
+    assert signal.getsignal(signal.SIGTERM) == signal.SIG_IGN
+    assert signal.getsignal(signal.SIGUSR1) == signal.SIG_IGN
+
+
+def test_finalizar_interrumpe_el_planificador(montar, senales):
+    _, manager = montar({0: [0]}, temperatura=60)
+    planificador = temp.Planificador(manager)
+    iteracion = manager.iteracion
+
+    def interrumpir(gpu, inst):
+        iteracion(gpu, inst)
+        signal.raise_signal(signal.SIGTERM)
+
+    manager.iteracion = interrumpir
+    # Las iteraciones se ejecutan en otro hilo, pero la señal la atiende el principal:
+    signal.signal(signal.SIGTERM, temp.finalizar)
+    with pytest.raises(temp.Interrupcion):
+        planificador.ejecutar(temp.get_reloj().ahora() + 600)
+
+
+def test_devolver_control_pone_todas_las_gpus_en_automatico(montar, monkeypatch):
+    backend, manager = montar({0: [0], 1: [1]}, temperatura=70)
+    monkeypatch.setattr(temp.Manager, '_Manager__singleton', manager)
+    temp.Planificador(manager).ejecutar(temp.get_reloj().ahora() + 30)
+    temp.devolver_control()
+    assert backend.get_control(0) == backend.get_control(1) == 0
@@ -0,0 +1,102 @@
+import temp
+
+from conftest import metrica
+
+
+def velocidades(backend, f_num: int) -> list[int]:
+    """Devuelve las velocidades escritas en el ventilador indicado, en orden."""
+    return [valor for atributo, num, valor in backend.get_escrituras()
+            if atributo == 'GPUTargetFanSpeed' and num == f_num]
+
+
+def test_bucle_ceba_y_sube_por_los_tramos(montar):
+    backend, manager = montar({0: [0]}, temperatura=72)
+    temp.Planificador(manager).ejecutar(temp.get_reloj().ahora() + 120)
+    assert velocidades(backend, 0) == [temp.V_MIN, temp.V_CEB, 45, 60, 64, 68, 75]
+    assert manager.get_gpus()[0].get_fans()[0].get_cebados() == 1
+
+
+def test_bucle_no_apaga_por_encima_de_t_fin(montar):
+    backend, manager = montar({0: [0]}, temperatura=52)
+    planificador = temp.Planificador(manager)
+    reloj = temp.get_reloj()
+    planificador.ejecutar(reloj.ahora() + 60)
+    assert backend.get_speed(0) == 45
+
+    backend.set_temp(0, temp.T_FIN + 3)
+    planificador.ejecutar(reloj.ahora() + 600)
+    assert backend.get_speed(0) == 45
+
+    backend.set_temp(0, temp.T_FIN - 5)
+    planificador.ejecutar(reloj.ahora() + 600)
+    assert backend.get_speed(0) == temp.V_MIN
+
+
+def test_bucle_sobre_una_instantanea_no_lee_el_hardware(montar):
+    backend, manager = montar({0: [0, 1]}, temperatura=40)
+    inst = manager.leer_instantanea()
+    backend.set_averiada(0)
+    gpu = manager.get_gpus()[0]
+    with temp.agrupar_escrituras():
+        for fan in gpu.get_fans():
+            manager.bucle(inst.get_temp(0), gpu, fan, inst)
+
+
+def test_control_se_restablece_si_otro_programa_lo_cambia(montar):
+    backend, manager = montar({0: [0]}, temperatura=60)
+    planificador = temp.Planificador(manager)
+    reloj = temp.get_reloj()
+    planificador.ejecutar(reloj.ahora() + 120)
+
+    # Otro programa pone la GPU en modo automático y el controlador mueve el ventilador:
+    backend.set_fan_control(0, 0)
+    backend.set_speed(0, 30)
+    planificador.ejecutar(reloj.ahora() + 2 * temp.VERIFICAR)
+    assert backend.get_control(0) == 1
+    assert backend.get_speed(0) == 64
+
+
+def test_bucle_retiene_las_bajadas_dentro_de_la_histeresis(montar):
+    backend, manager = montar({0: [0]}, {'histeresis': 2, 'permanencia': 30}, temperatura=60)
+    gpu = manager.get_gpus()[0]
+    fan = gpu.get_fans()[0]
+    planificador = temp.Planificador(manager)
+    reloj = temp.get_reloj()
+    planificador.ejecutar(reloj.ahora() + 120)
+    assert backend.get_speed(0) == 64
+
+    backend.set_temp(0, 59)
+    planificador.ejecutar(reloj.ahora() + 300)
+    assert backend.get_speed(0) == 64
+    assert fan.get_retenidas() > 0
+    assert metrica('actuations_avoided_total', fan=0, motivo='histeresis') > 0
+
+    backend.set_temp(0, 57)
+    planificador.ejecutar(reloj.ahora() + 300)
+    assert backend.get_speed(0) == 60
+
+
+def test_cebado_toma_sus_muestras_de_la_instantanea(montar, monkeypatch):
+    backend, manager = montar({0: [0, 1]}, temperatura=72)
+    fans = manager.get_gpus()[0].get_fans()
+    en_instantanea = []
+    sueltas = []
+    leer_instantanea, get_speed = backend.leer_instantanea, backend.get_speed
+
+    def instantanea(*args, **kwargs):
+        en_instantanea.append(True)
+        try:
+            return leer_instantanea(*args, **kwargs)
+        finally:
+            en_instantanea.pop()
+
+    def lectura(f_num):
+        if not en_instantanea and fans[f_num].get_estado_cebado() == temp.Fan.CEBANDO:
+            sueltas.append(f_num)
+        return get_speed(f_num)
+
+    monkeypatch.setattr(backend, 'leer_instantanea', instantanea)
+    monkeypatch.setattr(backend, 'get_speed', lectura)
+    temp.Planificador(manager).ejecutar(temp.get_reloj().ahora() + 120)
+    assert all(fan.get_cebados() == 1 for fan in fans)
+    assert sueltas == []
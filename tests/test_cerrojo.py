@@ -0,0 +1,39 @@
+import os
+import stat
+
+import pytest
+
+import temp
+
+
+@pytest.fixture
+def fichero_pid(tmp_path, monkeypatch):
+    """Usa un FICHERO_PID propio de la prueba, sin ningún cerrojo cogido."""
+    ruta = str(tmp_path / 'nvidia-fan-curve.pid')
+    monkeypatch.setattr(temp, 'FICHERO_PID', ruta)
+    monkeypatch.setattr(temp, '_cerrojo', None)
+    yield ruta
+    if temp._cerrojo is not None:
+        temp._cerrojo.close()
+
+
+def test_cerrojo_escribe_el_pid(fichero_pid):
+    assert temp.adquirir_cerrojo()
+    assert stat.S_IMODE(os.stat(fichero_pid).st_mode) == 0o600
+    assert temp.leer_pid() == os.getpid()
+
+
+def test_cerrojo_no_sigue_enlaces_simbolicos(fichero_pid, tmp_path):
+    victima = tmp_path / 'victima'
+    victima.write_text('no se debe tocar\n')
+    os.symlink(victima, fichero_pid)
+    with pytest.raises(SystemExit):
+        temp.adquirir_cerrojo()
+    assert victima.read_text() == 'no se debe tocar\n'
+    assert temp.leer_pid() is None
+
+
+def test_cerrojo_rechaza_lo_que_no_es_un_fichero(fichero_pid):
+    os.mkfifo(fichero_pid, 0o600)
+    with pytest.raises(SystemExit):
+        temp.adquirir_cerrojo()
@@ -0,0 +1,158 @@
+import time
+
+import pytest
+
+import temp
+
+from conftest import metrica
+
+
+def fallar(circuito, veces: int) -> None:
+    """Anota en el circuito las iteraciones fallidas indicadas."""
+    for _ in range(veces):
+        circuito.fallo('la GPU no responde')
+
+
+def test_circuito_pone_la_gpu_en_automatico_tras_fallos_max(montar):
+    backend, manager = montar({0: [0, 1]})
+    gpu = manager.get_gpus()[0]
+    circuito = manager.get_circuito(gpu)
+
+    fallar(circuito, temp.FALLOS_MAX - 1)
+    assert not circuito.abierto()
+    assert backend.get_control(0) == 1
+
+    fallar(circuito, 1)
+    assert circuito.abierto()
+    assert backend.get_control(0) == 0
+    assert gpu.get_control() == 0
+    assert all(fan.necesita_lectura(temp.get_reloj().ahora()) for fan in gpu.get_fans())
+    assert manager.get_periodo(gpu) == temp.REPOSO_CIRCUITO
+    assert metrica('circuit_trips_total', gpu=0) == 1
+
+
+def test_circuito_deja_los_ventiladores_a_v_max(montar, monkeypatch):
+    monkeypatch.setattr(temp, 'ACCION_FALLO', 'v_max')
+    backend, manager = montar({0: [0, 1]})
+    fallar(manager.get_circuito(manager.get_gpus()[0]), temp.FALLOS_MAX)
+    assert backend.get_control(0) == 1
+    assert backend.get_speed(0) == backend.get_speed(1) == temp.V_MAX
+
+
+def test_circuito_se_cierra_al_recuperar_la_gpu(montar):
+    backend, manager = montar({0: [0]})
+    gpu = manager.get_gpus()[0]
+    circuito = manager.get_circuito(gpu)
+    fallar(circuito, temp.FALLOS_MAX)
+
+    with temp.agrupar_escrituras():
+        circuito.recuperar()
+    circuito.exito()
+    assert not circuito.abierto()
+    assert circuito.get_fallos() == 0
+    assert backend.get_control(0) == 1
+    assert manager.get_periodo(gpu) == gpu.get_sleep()
+    assert metrica('circuit_open', gpu=0) == 0
+
+
+def test_circuito_solo_cuenta_fallos_seguidos(montar):
+    _, manager = montar({0: [0]})
+    circuito = manager.get_circuito(manager.get_gpus()[0])
+    fallar(circuito, temp.FALLOS_MAX - 1)
+    circuito.exito()
+    fallar(circuito, temp.FALLOS_MAX - 1)
+    assert not circuito.abierto()
+
+
+def test_circuito_reintenta_la_accion_si_no_se_pudo_escribir(montar):
+    backend, manager = montar({0: [0]})
+    circuito = manager.get_circuito(manager.get_gpus()[0])
+    backend.set_averiada(0)
+    fallar(circuito, temp.FALLOS_MAX)
+    assert backend.get_control(0) == 1
+
+    backend.set_averiada(0, False)
+    fallar(circuito, 1)
+    assert backend.get_control(0) == 0
+
+
+def test_planificador_aisla_una_gpu_averiada(montar, monkeypatch):
+    monkeypatch.setattr(temp, 'REPOSO_CIRCUITO', 30.0)
+    backend, manager = montar({0: [0], 1: [1]}, temperatura=60)
+    gpu_averiada = manager.get_gpus()[1]
+    planificador = temp.Planificador(manager)
+    reloj = temp.get_reloj()
+    planificador.ejecutar(reloj.ahora() + 30)
+
+    backend.set_averiada(1)
+    backend.set_temp(0, 72)
+    planificador.ejecutar(reloj.ahora() + 60)
+    assert manager.get_circuito(gpu_averiada).abierto()
+    assert manager.get_periodo(gpu_averiada) == 30.0
+    assert backend.get_speed(0) == 75
+    assert metrica('circuit_open', gpu=1) == 1
+
+    backend.set_averiada(1, False)
+    planificador.ejecutar(reloj.ahora() + 60)
+    assert not manager.get_circuito(gpu_averiada).abierto()
+    assert backend.get_control(1) == 1
+    assert metrica('circuit_trips_total', gpu=1) == 1
+
+
+@pytest.fixture
+def nvidia_settings(tmp_path, monkeypatch):
+    """
+    Devuelve una función que pone en el PATH un nvidia-settings falso con
+    el guion de shell indicado.
+    """
+    def crear(guion: str) -> None:
+        ruta = tmp_path / 'nvidia-settings'
+        ruta.write_text(f'#!/bin/sh\n{guion}\n')
+        ruta.chmod(0o755)
+
+    monkeypatch.setenv('PATH', str(tmp_path))
+    monkeypatch.setattr(temp, 'ESPERA_REINTENTO', 0.01)
+    return crear
+
+
+def test_run_command_sin_nvidia_settings_cuenta_como_fallo(nvidia_settings):
+    with pytest.raises(ValueError, match='no se pudo lanzar'):
+        temp.run_command('-q=gpus')
+    fallos = metrica('hardware_failures_total', backend='nvidia-settings', motivo='lanzamiento')
+    assert fallos == temp.REINTENTOS + 1
+    assert metrica('hardware_retries_total', backend='nvidia-settings') == temp.REINTENTOS
+
+
+def test_run_command_reintenta_los_fallos(nvidia_settings):
+    nvidia_settings('echo "sin pantalla" >&2; exit 1')
+    with pytest.raises(ValueError, match='sin pantalla'):
+        temp.run_command('-q=gpus')
+    assert metrica('hardware_failures_total', backend='nvidia-settings', motivo='error') \
+        == temp.REINTENTOS + 1
+
+
+def vivo(pid: int) -> bool:
+    """Indica si el proceso indicado existe y no es un zombi."""
+    for _ in range(50):
+        try:
+            with open(f'/proc/{pid}/stat') as fichero:
+                if fichero.read().rsplit(')', 1)[1].split()[0] == 'Z':
+                    return False
+        except FileNotFoundError:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_run_command_mata_los_procesos_colgados(nvidia_settings, tmp_path, monkeypatch):
+    monkeypatch.setattr(temp, 'TIMEOUT_COMANDO', 0.2)
+    monkeypatch.setattr(temp, 'REINTENTOS', 0)
+    pid = tmp_path / 'pid'
+    nvidia_settings(f'/bin/sleep 30 & echo $! > {pid}; wait')
+    inicio = time.monotonic()
+    with pytest.raises(ValueError, match='no ha respondido'):
+        temp.run_command('-q=gpus')
+    assert time.monotonic() - inicio < 5
+    # El hijo del proceso colgado también se ha matado (y quizá nadie lo ha
+    # recogido todavía):
+    assert not vivo(int(pid.read_text()))
@@ -0,0 +1,123 @@
+import json
+import math
+import os
+
+import pytest
+
+import temp
+
+
+def test_normalizar_aplica_los_parametros_mas_concretos():
+    configuracion = temp.normalizar_configuracion({
+        'sleep': 5,
+        'v_ceb': 40,
+        'gpus': {'0': {'t_fin': 50, 'fans': {'0': {'v_ceb': 30}, '1': {}}}},
+    })
+    gpu = configuracion[0]
+    assert gpu['params']['sleep'] == 5.0
+    assert gpu['params']['t_fin'] == 50
+    assert gpu['params']['t_min'] == temp.T_MIN
+    assert gpu['fans'][0]['params']['v_ceb'] == 30
+    assert gpu['fans'][1]['params']['v_ceb'] == 40
+    assert gpu['fans'][1]['curva'] == temp.CURVA
+
+
+def test_normalizar_usa_la_topologia_sin_tabla_gpus():
+    configuracion = temp.normalizar_configuracion({'t_fin': 40}, {0: [0, 1], 1: [2]})
+    assert {g: sorted(d['fans']) for g, d in configuracion.items()} == {0: [0, 1], 1: [2]}
+    assert configuracion[1]['params']['t_fin'] == 40
+
+
+@pytest.mark.parametrize('datos', [
+    {'modo': []},
+    {'modo': 'otro'},
+    {'sleep': math.inf},
+    {'sleep': math.nan},
+    {'sleep': 0},
+    {'t_max': math.inf},
+    {'t_fin': 45.5},
+    {'v_ceb': True},
+    {'v_min': 50, 'v_max': 40},
+    {'curva': {'60': math.inf}},
+    {'curva': {'55': 60, '60': 45}},
+    {'curva': []},
+    {'salto_carga': 0},
+    {'desconocido': 1},
+])
+def test_normalizar_rechaza_configuraciones_no_validas(datos):
+    with pytest.raises(ValueError):
+        temp.normalizar_configuracion(datos, {0: [0]})
+
+
+def escribir(ruta, datos) -> None:
+    """Sustituye el fichero, como hacen los editores, para que cambie su inodo."""
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as fichero:
+        fichero.write(datos if isinstance(datos, str) else json.dumps(datos))
+    os.replace(temporal, ruta)
+
+
+def test_recarga_aplica_la_configuracion_nueva(montar, tmp_path):
+    ruta = str(tmp_path / 'configuracion.json')
+    escribir(ruta, {'sleep': 7})
+    _, manager = montar({0: [0]}, {'sleep': 7})
+    configuracion = temp.Configuracion(ruta)
+    configuracion.leer(manager.get_topologia())
+    manager.set_configuracion(configuracion)
+    gpu = manager.get_gpus()[0]
+    manager.get_muestreo(gpu).actualizar(50, 0.0, [55])
+    manager.get_muestreo(gpu).actualizar(50, 7.0, [55])
+    assert manager.get_muestreo(gpu).get_periodo() == 14.0
+
+    escribir(ruta, {'sleep': 3, 'gpus': {'0': {'fans': {'0': {'v_ceb': 40}}}}})
+    manager.comprobar_configuracion()
+    assert gpu.get_sleep() == 3.0
+    assert gpu.get_fans()[0].get_v_ceb() == 40
+    # El muestreo adaptativo vuelve a empezar desde el nuevo sleep:
+    assert manager.get_muestreo(gpu).get_periodo() == 3.0
+    assert manager.get_muestreo(gpu).get_periodo_efectivo() is None
+
+
+@pytest.mark.parametrize('contenido', [
+    '{"modo": []}',
+    '{"sleep": Infinity}',
+    '{"t_max": 1e400}',
+    '{"curva": {"60": 1e400}}',
+    '{"sleep": ',
+    '[' * 100000 + ']' * 100000,
+    '{"gpus": {"0": {"fans": {"0": {}, "1": {}}}}}',
+])
+def test_recarga_no_valida_mantiene_la_anterior(montar, tmp_path, contenido):
+    ruta = str(tmp_path / 'configuracion.json')
+    escribir(ruta, {'sleep': 7})
+    _, manager = montar({0: [0]}, {'sleep': 7})
+    configuracion = temp.Configuracion(ruta)
+    configuracion.leer(manager.get_topologia())
+    manager.set_configuracion(configuracion)
+
+    escribir(ruta, contenido)
+    manager.comprobar_configuracion()
+    assert manager.get_gpus()[0].get_sleep() == 7.0
+    # No se vuelve a intentar hasta que el fichero cambie otra vez:
+    assert not configuracion.cambiada()
+
+
+def test_recarga_durante_el_bucle_no_lo_detiene(montar, tmp_path):
+    ruta = str(tmp_path / 'configuracion.json')
+    escribir(ruta, {'sleep': 7})
+    backend, manager = montar({0: [0]}, {'sleep': 7}, temperatura=60)
+    configuracion = temp.Configuracion(ruta)
+    configuracion.leer(manager.get_topologia())
+    manager.set_configuracion(configuracion)
+    planificador = temp.Planificador(manager)
+    reloj = temp.get_reloj()
+
+    planificador.ejecutar(reloj.ahora() + 30)
+    escribir(ruta, '{"sleep": Infinity, "modo": []}')
+    planificador.ejecutar(reloj.ahora() + 30)
+    escribir(ruta, {'sleep': 2})
+    backend.set_temp(0, 75)
+    planificador.ejecutar(reloj.ahora() + 60)
+    assert manager.get_gpus()[0].get_sleep() == 2.0
+    assert backend.get_control(0) == 1
+    assert backend.get_speed(0) == 80
@@ -0,0 +1,64 @@
+import pytest
+
+import temp
+
+
+def tramo_lineal(curva: dict[int, int], t: int):
+    """Busca el tramo recorriendo la curva, como se hacía antes de Curva."""
+    for temp_tramo, veloc in sorted(curva.items()):
+        if t < temp_tramo:
+            return (temp_tramo, veloc)
+    return None
+
+
+def test_tramo_coincide_con_la_busqueda_lineal():
+    curva = temp.Curva(temp.CURVA, temp.V_MIN, temp.V_MAX)
+    for t in range(0, 120):
+        assert curva.tramo(t) == tramo_lineal(temp.CURVA, t)
+
+
+def test_curva_ordena_los_tramos():
+    curva = temp.Curva({70: 68, 55: 45, 60: 60}, 0, 90)
+    assert curva.get_temps() == [55, 60, 70]
+    assert curva.get_veloces() == [45, 60, 68]
+    assert list(curva) == [55, 60, 70]
+    assert len(curva) == 3
+
+
+def test_veloces_superior_e_inferior():
+    curva = temp.Curva(temp.CURVA, temp.V_MIN, temp.V_MAX)
+    assert curva.veloc_superior(0) == 45
+    assert curva.veloc_superior(60) == 64
+    assert curva.veloc_superior(62) == 64
+    assert curva.veloc_superior(85) is None
+    assert curva.veloc_inferior(45) is None
+    assert curva.veloc_inferior(64) == 60
+    assert curva.veloc_inferior(90) == 85
+
+
+def test_interpolar_une_los_comienzos_de_los_tramos():
+    curva = temp.Curva({55: 40, 65: 60}, 0, 90)
+    assert curva.interpolar(50, 50, 90) == 40
+    assert curva.interpolar(55, 50, 90) == 60
+    assert curva.interpolar(60, 50, 90) == 75
+    assert curva.interpolar(65, 50, 90) == 90
+
+
+@pytest.mark.parametrize('curva, mensaje', [
+    ({}, 'ningún tramo'),
+    ({55: 95}, 'fuera del rango'),
+    ({55: -1}, 'fuera del rango'),
+    ({55: 60, 60: 45}, 'baja'),
+])
+def test_curva_rechaza_curvas_no_validas(curva, mensaje):
+    with pytest.raises(ValueError, match=mensaje):
+        temp.Curva(curva, 0, 90)
+
+
+def test_validar_temps_exige_el_rango_de_la_gpu():
+    curva = temp.Curva(temp.CURVA, temp.V_MIN, temp.V_MAX)
+    curva.validar_temps(temp.T_MIN, temp.T_MAX)
+    with pytest.raises(ValueError):
+        curva.validar_temps(55, temp.T_MAX)
+    with pytest.raises(ValueError):
+        curva.validar_temps(temp.T_MIN, 80)
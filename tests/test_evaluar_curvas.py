@@ -0,0 +1,115 @@
+import json
+import random
+
+import pytest
+
+import temp
+
+np = pytest.importorskip('numpy')
+evaluar_curvas = pytest.importorskip('evaluar_curvas')
+
+PERSONALIZADA = {
+    'gpus': {'0': {
+        't_min': 45, 't_max': 80, 't_fin': 40,
+        'fans': {'0': {'v_min': 10, 'v_max': 85, 'v_ini': 20, 'v_ceb': 30, 't_ini': 5,
+                       'histeresis': 3, 'permanencia': 20,
+                       'curva': {'50': 35, '58': 50, '66': 62, '74': 78}}},
+    }},
+}
+
+
+def traza(semilla: int = 0, lecturas: int = 3000) -> tuple:
+    """
+    Genera una traza de temperaturas que sube y baja entre 30 y 95 ºC, con
+    periodos irregulares, para que haya cambios de tramo, cebados y bajadas
+    retenidas.
+    """
+    rnd = random.Random(semilla)
+    instantes, temps = [], []
+    ahora, grados = 0.0, 40
+    for _ in range(lecturas):
+        ahora += rnd.choice([3.0, 5.0, 7.0, 7.0, 7.0, 11.0])
+        grados = min(max(grados + rnd.choice([-3, -1, -1, 0, 0, 0, 1, 1, 3]), 30), 95)
+        instantes.append(ahora)
+        temps.append(grados)
+    return np.array(instantes), np.array(temps)
+
+
+def reproducir(montar, datos: dict, instantes, temps) -> dict:
+    """
+    Reproduce la traza con el bucle de control de temp.py sobre un
+    FakeBackend y devuelve los cambios de velocidad, los cebados y las
+    bajadas retenidas del ventilador.
+    """
+    backend, manager = montar({0: [0]}, datos, temperatura=int(temps[0]))
+    gpu = manager.get_gpus()[0]
+    fan = gpu.get_fans()[0]
+    with temp.agrupar_escrituras():
+        fan.set_speed(fan.get_v_min())
+    escrituras = len(backend.get_escrituras())
+    reloj = temp.get_reloj()
+    for instante, grados in zip(instantes, temps):
+        reloj.dormir(instante - reloj.ahora())
+        backend.set_temp(0, int(grados))
+        with temp.agrupar_escrituras():
+            manager.iteracion(gpu, manager.leer_instantanea([gpu]))
+    veloces = [valor for atributo, _, valor in backend.get_escrituras()[escrituras:]
+               if atributo == 'GPUTargetFanSpeed']
+    return {'cambios': len(veloces), 'cebados': fan.get_cebados(), 'retenidas': fan.get_retenidas()}
+
+
+@pytest.mark.parametrize('datos', [{}, PERSONALIZADA])
+@pytest.mark.parametrize('semilla', [0, 1])
+def test_evaluar_coincide_con_el_bucle_de_control(montar, monkeypatch, tmp_path, datos, semilla):
+    ruta = tmp_path / 'configuracion.json'
+    ruta.write_text(json.dumps(datos))
+    monkeypatch.setattr(temp, 'CONFIGURACION', str(ruta))
+    instantes, temps = traza(semilla)
+
+    candidata = evaluar_curvas.Candidata('actual', evaluar_curvas.configuracion_base(0, 0))
+    resultados = evaluar_curvas.evaluar(instantes, temps, [candidata], 70)
+    esperados = reproducir(montar, datos, instantes, temps)
+
+    assert esperados['cebados'] > 1 and esperados['retenidas'] > 0
+    assert {clave: int(resultados[clave][0]) for clave in esperados} == esperados
+
+
+def test_candidatas_con_los_limites_de_la_configuracion(monkeypatch, tmp_path):
+    ruta = tmp_path / 'configuracion.json'
+    ruta.write_text(json.dumps(PERSONALIZADA))
+    monkeypatch.setattr(temp, 'CONFIGURACION', str(ruta))
+    base = evaluar_curvas.configuracion_base(0, 0)
+
+    actual = evaluar_curvas.Candidata('actual', base)
+    assert (actual.get_t_min(), actual.get_v_min(), actual.get_v_max()) == (45, 10, 85)
+    assert actual.get_t_fin() == 40 and actual.get_v_ceb() == 30
+
+    candidata = evaluar_curvas.Candidata('suave', base, curva={'60': 40, '70': 70}, t_fin=42)
+    assert dict(candidata.get_curva().items()) == {60: 40, 70: 70}
+    assert candidata.get_t_fin() == 42 and candidata.get_histeresis() == 3
+
+    # Las tres primeras serían válidas con las constantes, pero no con los
+    # límites de esta GPU y este ventilador:
+    for cambios in ({'curva': {'60': 40, '70': 90}},
+                    {'curva': {'60': 40, '85': 70}},
+                    {'v_ceb': 5},
+                    {'histeresis': -1},
+                    {'otro': 1}):
+        with pytest.raises(ValueError):
+            evaluar_curvas.Candidata('mala', base, **cambios)
+
+    assert all(c.get_v_max() == 85 for c in evaluar_curvas.generar_candidatas(20, 0, base))
+
+
+def test_leer_candidatas_descarta_las_no_validas(tmp_path, capsys):
+    base = evaluar_curvas.configuracion_base(0, 0)
+    ruta = tmp_path / 'candidatas.json'
+    ruta.write_text(json.dumps([
+        {'nombre': 'buena', 'curva': {'55': 40, '70': 70}, 'v_ceb': 40},
+        {'nombre': 'sin curva', 't_fin': 40},
+        {'nombre': 'cebado imposible', 'curva': {'55': 40}, 'v_ceb': 200},
+    ]))
+    candidatas = evaluar_curvas.leer_candidatas(str(ruta), base)
+    assert [c.get_nombre() for c in candidatas] == ['buena']
+    assert candidatas[0].get_v_ceb() == 40
+    assert 'sin curva' in capsys.readouterr().err
@@ -0,0 +1,87 @@
+import pytest
+
+import temp
+
+
+def filtro_con(*lecturas: int) -> temp.FiltroVelocidad:
+    """Devuelve un filtro con las lecturas indicadas."""
+    filtro = temp.FiltroVelocidad()
+    for veloc in lecturas:
+        filtro.añadir(veloc)
+    return filtro
+
+
+def test_estimacion_es_la_mediana_de_la_ventana():
+    assert temp.FiltroVelocidad().estimacion() is None
+    assert filtro_con(40, 42, 41).estimacion() == 41
+    filtro = filtro_con(*range(30, 50))
+    assert filtro.get_lecturas() == list(range(50 - temp.VENTANA, 50))
+
+
+def test_descarta_lecturas_fuera_de_rango():
+    filtro = filtro_con(40, 40)
+    assert not filtro.añadir(-1)
+    assert not filtro.añadir(101)
+    assert filtro.get_lecturas() == [40, 40]
+
+
+def test_descarta_una_lectura_atipica_aislada():
+    filtro = filtro_con(40, 41, 40, 40)
+    assert not filtro.añadir(90)
+    assert filtro.añadir(40)
+    assert filtro.estimacion() == 40
+    assert 90 not in filtro.get_lecturas()
+
+
+def test_dos_lecturas_atipicas_parecidas_sustituyen_la_ventana():
+    filtro = filtro_con(40, 41, 40, 40)
+    assert not filtro.añadir(70)
+    assert filtro.añadir(71)
+    assert filtro.get_lecturas() == [70, 71]
+    assert filtro.estimacion() == 70
+
+
+def test_dos_lecturas_atipicas_distintas_se_descartan():
+    filtro = filtro_con(40, 41, 40, 40)
+    assert not filtro.añadir(70)
+    assert not filtro.añadir(90)
+    assert filtro.estimacion() == 40
+
+
+def test_estable_compara_las_dos_ultimas_lecturas():
+    assert not filtro_con(40).estable()
+    assert filtro_con(30, 40, 42).estable()
+    assert not filtro_con(30, 40, 45).estable()
+    filtro = filtro_con(40, 40)
+    filtro.reiniciar()
+    assert filtro.get_lecturas() == []
+    assert not filtro.estable()
+
+
+def test_get_speed_solo_lee_mas_mientras_no_sea_estable(montar, monkeypatch):
+    backend, manager = montar({0: [0]})
+    fan = manager.get_gpus()[0].get_fans()[0]
+    lecturas = []
+    get_speed = backend.get_speed
+
+    def contar(f_num: int) -> int:
+        lecturas.append(f_num)
+        return get_speed(f_num)
+
+    monkeypatch.setattr(backend, 'get_speed', contar)
+    assert fan.get_speed(temp.Instantanea({0: 40}, {0: [0]}, {})) == 0
+    assert len(lecturas) == 1
+    # Con la ventana estable, basta la muestra de la instantánea, y una
+    # lectura atípica aislada no cambia la estimación:
+    assert fan.get_speed(temp.Instantanea({0: 40}, {0: [0]}, {})) == 0
+    assert fan.get_speed(temp.Instantanea({0: 40}, {0: [0]}, {})) == 0
+    assert fan.get_speed(temp.Instantanea({0: 40}, {0: [90]}, {})) == 0
+    assert len(lecturas) == 1
+
+
+def test_get_speed_sin_lecturas_validas_falla(montar, monkeypatch):
+    backend, manager = montar({0: [0]})
+    fan = manager.get_gpus()[0].get_fans()[0]
+    monkeypatch.setattr(backend, 'get_speed', lambda f_num: 255)
+    with pytest.raises(ValueError):
+        fan.get_speed()
@@ -0,0 +1,134 @@
+import subprocess
+
+import pytest
+
+import temp
+
+from conftest import metrica
+
+
+@pytest.fixture
+def nvidia_settings(monkeypatch):
+    """
+    Sustituye run_command por una función que devuelve el código y la
+    salida de error que se indiquen en el diccionario devuelto, donde
+    también se anotan los comandos recibidos.
+    """
+    respuesta = {'codigo': 0, 'stderr': '', 'comandos': []}
+
+    def run_command(*args, check=True, terse=True):
+        respuesta['comandos'].append(args)
+        return subprocess.CompletedProcess(['nvidia-settings', *args], respuesta['codigo'], '',
+                                           respuesta['stderr'])
+
+    monkeypatch.setattr(temp, 'run_command', run_command)
+    return respuesta
+
+
+def error_asignacion(asignacion: str) -> str:
+    """Devuelve el mensaje de error de nvidia-settings para una asignación."""
+    return (f"ERROR: Error assigning value to attribute (host:0) as specified in "
+            f"assignment '{asignacion}' (Unknown Error).")
+
+
+def test_asignar_lote_atribuye_cada_error_a_su_asignacion(nvidia_settings):
+    nvidia_settings.update(codigo=1, stderr=error_asignacion('[fan:1]/GPUTargetFanSpeed=60') + '\n')
+    asignaciones = ['[gpu:0]/GPUFanControlState=1', '[fan:0]/GPUTargetFanSpeed=60',
+                    '[fan:1]/GPUTargetFanSpeed=60', '[fan:2]/GPUTargetFanSpeed=60']
+    _, errores = temp.asignar_lote(asignaciones)
+    assert nvidia_settings['comandos'] == [tuple(f'-a={a}' for a in asignaciones)]
+    # Las que siguen a la que falla quizá no se han hecho:
+    assert list(errores) == asignaciones[2:]
+    assert 'Unknown Error' in errores['[fan:1]/GPUTargetFanSpeed=60']
+
+
+def test_asignar_lote_sin_asignacion_indicada_las_da_todas_por_fallidas(nvidia_settings):
+    nvidia_settings.update(codigo=1, stderr='ERROR: The control display is undefined.\n')
+    _, errores = temp.asignar_lote(['[fan:0]/GPUTargetFanSpeed=60', '[fan:1]/GPUTargetFanSpeed=60'])
+    assert errores == dict.fromkeys(['[fan:0]/GPUTargetFanSpeed=60', '[fan:1]/GPUTargetFanSpeed=60'],
+                                    'ERROR: The control display is undefined.')
+
+
+def test_el_lote_devuelve_los_errores_a_quien_hizo_cada_escritura(nvidia_settings, monkeypatch):
+    monkeypatch.setattr(temp, '_backend', temp.NvidiaSettingsBackend())
+    nvidia_settings.update(codigo=1, stderr=error_asignacion('[fan:1]/GPUTargetFanSpeed=70'))
+    fallidas = []
+    lote = temp.LoteEscrituras()
+    lote.añadir('fan', 0, 50, lambda e: fallidas.append(0))
+    lote.añadir('fan', 0, 60, lambda e: fallidas.append(0))
+    lote.añadir('fan', 1, 70, lambda e: fallidas.append(1))
+    lote.añadir('gpu', 0, 1, lambda e: fallidas.append('gpu'))
+    errores = lote.enviar()
+    # Un único proceso, con el control primero y sólo el último valor de cada ventilador:
+    assert nvidia_settings['comandos'] == [('-a=[gpu:0]/GPUFanControlState=1', '-a=[fan:0]/GPUTargetFanSpeed=60',
+                                '-a=[fan:1]/GPUTargetFanSpeed=70')]
+    assert list(errores) == [('fan', 1)]
+    assert fallidas == [1]
+    assert metrica('write_errors_total', fan=1) == 1
+    assert lote.enviar() == {}
+    assert len(nvidia_settings['comandos']) == 1
+
+
+def test_si_el_backend_falla_se_dan_todas_por_fallidas(montar, monkeypatch):
+    backend, _ = montar({0: [0, 1]})
+
+    def fallar(controles, veloces):
+        raise OSError('nvidia-settings no responde')
+
+    monkeypatch.setattr(backend, 'escribir_lote', fallar)
+    fallidas = []
+    lote = temp.LoteEscrituras()
+    lote.añadir('fan', 0, 50, fallidas.append)
+    lote.añadir('fan', 1, 50, fallidas.append)
+    assert set(lote.enviar()) == {('fan', 0), ('fan', 1)}
+    assert fallidas == ['nvidia-settings no responde'] * 2
+
+
+def test_agrupar_escrituras_envia_al_terminar_el_grupo_exterior(montar):
+    backend, manager = montar({0: [0, 1]})
+    fan0, fan1 = manager.get_gpus()[0].get_fans()
+    escritas = len(backend.get_escrituras())
+    with temp.agrupar_escrituras() as lote:
+        fan0.set_speed(50)
+        with temp.agrupar_escrituras() as interior:
+            assert interior is lote
+            fan1.set_speed(55)
+        assert len(backend.get_escrituras()) == escritas
+    assert backend.get_escrituras()[escritas:] == [('GPUTargetFanSpeed', 0, 50), ('GPUTargetFanSpeed', 1, 55)]
+
+    # Con un lote indicado, quien lo creó es quien lo envía:
+    compartido = temp.LoteEscrituras()
+    with temp.agrupar_escrituras(compartido):
+        fan0.set_speed(60)
+    assert backend.get_speed(0) == 50
+    compartido.enviar()
+    assert backend.get_speed(0) == 60
+
+
+def test_las_gpus_revisadas_a_la_vez_escriben_en_un_solo_lote(montar):
+    backend, manager = montar({g: [g] for g in range(4)}, temperatura=72)
+    lotes = metrica('write_batches_total')
+    planificador = temp.Planificador(manager)
+    planificador.ejecutar(temp.get_reloj().ahora() + 1)
+    # El cebado de los cuatro ventiladores, en una sola escritura:
+    assert metrica('write_batches_total') == lotes + 1
+    assert [backend.get_speed(f) for f in range(4)] == [temp.V_CEB] * 4
+
+
+def test_un_error_de_escritura_solo_cuenta_para_su_gpu(montar, monkeypatch):
+    backend, manager = montar({0: [0], 1: [1]}, temperatura=72)
+    set_speed = backend.set_speed
+
+    def fallar_fan_1(f_num: int, veloc: int) -> str:
+        if f_num == 1:
+            raise ValueError('el ventilador n.º 1 no responde')
+        return set_speed(f_num, veloc)
+
+    monkeypatch.setattr(backend, 'set_speed', fallar_fan_1)
+    planificador = temp.Planificador(manager)
+    planificador.ejecutar(temp.get_reloj().ahora() + 1)
+    gpu0, gpu1 = manager.get_gpus()
+    assert manager.get_circuito(gpu0).get_fallos() == 0
+    assert manager.get_circuito(gpu1).get_fallos() == 1
+    assert backend.get_speed(0) == temp.V_CEB
+    assert gpu1.get_fans()[0].get_comandada() is None
@@ -0,0 +1,100 @@
+import pytest
+
+import temp
+
+
+def velocidades(backend, f_num: int) -> list[int]:
+    """Devuelve las velocidades escritas en el ventilador indicado, en orden."""
+    return [valor for atributo, num, valor in backend.get_escrituras()
+            if atributo == 'GPUTargetFanSpeed' and num == f_num]
+
+
+def test_interpolado_sigue_la_curva_entre_tramos(montar):
+    _, manager = montar({0: [0]}, {'modo': 'interpolado'})
+    gpu = manager.get_gpus()[0]
+    fan = gpu.get_fans()[0]
+    control = fan.get_control()
+    assert isinstance(control, temp.ControlInterpolado)
+    assert control.objetivo(fan, gpu, temp.T_MIN - 1, 0) == temp.V_MIN
+    assert control.objetivo(fan, gpu, 60, 0) == 64
+    assert control.objetivo(fan, gpu, 62, 0) == 66
+    assert control.objetivo(fan, gpu, temp.T_MAX, 0) == temp.V_MAX
+
+
+def test_interpolado_limita_la_pendiente_tras_mucho_tiempo_sin_cambios(montar):
+    backend, manager = montar({0: [0]}, {'modo': 'interpolado', 'pendiente': 2}, temperatura=60)
+    planificador = temp.Planificador(manager)
+    reloj = temp.get_reloj()
+    planificador.ejecutar(reloj.ahora() + 120)
+    assert backend.get_speed(0) == 64
+    planificador.ejecutar(reloj.ahora() + 600)
+    escritas = len(velocidades(backend, 0))
+
+    # Un pico por debajo de t_max tras diez minutos sin cambios:
+    backend.set_temp(0, 88)
+    planificador.ejecutar(reloj.ahora() + 120)
+    subida = [64] + velocidades(backend, 0)[escritas:]
+    assert subida[-1] == temp.V_MAX
+    assert all(0 < b - a <= 2 * temp.SLEEP for a, b in zip(subida, subida[1:]))
+
+
+def test_interpolado_va_directo_a_v_max_en_t_max(montar):
+    backend, manager = montar({0: [0]}, {'modo': 'interpolado'}, temperatura=60)
+    planificador = temp.Planificador(manager)
+    reloj = temp.get_reloj()
+    planificador.ejecutar(reloj.ahora() + 120)
+    backend.set_temp(0, temp.T_MAX)
+    planificador.ejecutar(reloj.ahora() + temp.SLEEP)
+    assert backend.get_speed(0) == temp.V_MAX
+
+
+@pytest.mark.parametrize('modo', ['interpolado', 'pid'])
+def test_los_modos_ceban_y_respetan_t_fin(montar, modo):
+    backend, manager = montar({0: [0]}, {'modo': modo}, temperatura=70)
+    planificador = temp.Planificador(manager)
+    reloj = temp.get_reloj()
+    planificador.ejecutar(reloj.ahora() + 120)
+    assert velocidades(backend, 0)[:2] == [temp.V_MIN, temp.V_CEB]
+    assert backend.get_speed(0) > temp.V_CEB
+
+    backend.set_temp(0, temp.T_FIN + 1)
+    planificador.ejecutar(reloj.ahora() + 600)
+    assert backend.get_speed(0) > temp.V_MIN
+    backend.set_temp(0, temp.T_FIN - 5)
+    planificador.ejecutar(reloj.ahora() + 600)
+    assert backend.get_speed(0) == temp.V_MIN
+
+
+def test_pid_arranca_sin_saltos_y_no_acumula_saturado(montar):
+    _, manager = montar({0: [0]}, {'modo': 'pid', 'consigna': 65, 'histeresis': 1,
+                                   'kp': 4, 'ki': 0.1, 'kd': 0})
+    gpu = manager.get_gpus()[0]
+    fan = gpu.get_fans()[0]
+    control = fan.get_control()
+    reloj = temp.get_reloj()
+    # Dentro de la banda muerta, la salida es la velocidad actual:
+    assert control.objetivo(fan, gpu, 66, 60) == 60
+    reloj.dormir(7)
+    assert control.objetivo(fan, gpu, 66, 60) == 60
+
+    # Muy por encima de la consigna se satura a v_max sin acumular más:
+    for _ in range(100):
+        reloj.dormir(7)
+        assert control.objetivo(fan, gpu, 85, 60) == temp.V_MAX
+    integral = control.get_integral()
+    reloj.dormir(7)
+    control.objetivo(fan, gpu, 85, temp.V_MAX)
+    assert control.get_integral() == integral
+    # Así, al volver a la consigna la velocidad baja enseguida:
+    reloj.dormir(7)
+    assert control.objetivo(fan, gpu, 64, temp.V_MAX) < temp.V_MAX
+
+
+def test_pid_usa_el_primer_tramo_como_minimo_y_apaga_bajo_t_min(montar):
+    _, manager = montar({0: [0]}, {'modo': 'pid', 'consigna': 65})
+    gpu = manager.get_gpus()[0]
+    fan = gpu.get_fans()[0]
+    control = fan.get_control()
+    assert control.objetivo(fan, gpu, 52, 0) == temp.CURVA[min(temp.CURVA)]
+    assert control.objetivo(fan, gpu, temp.T_MIN - 1, 45) == temp.V_MIN
+    assert control.get_integral() is None
@@ -0,0 +1,17 @@
+import temp
+
+
+def test_planificador_da_a_cada_gpu_su_periodo(montar):
+    _, manager = montar({0: [0], 1: [1]}, {
+        'gpus': {'0': {'sleep': 2, 'fans': {'0': {}}}, '1': {'sleep': 5, 'fans': {'1': {}}}},
+    })
+    iteraciones = {0: 0, 1: 0}
+    iteracion = manager.iteracion
+
+    def contar(gpu, inst):
+        iteraciones[gpu.g_num()] += 1
+        iteracion(gpu, inst)
+
+    manager.iteracion = contar
+    temp.Planificador(manager).ejecutar(temp.get_reloj().ahora() + 60)
+    assert iteraciones == {0: 30, 1: 12}
@@ -0,0 +1,49 @@
+import json
+
+import temp
+
+from conftest import metrica
+
+
+def test_registro_descarta_y_cuenta_si_la_cola_se_llena(monkeypatch, capsys):
+    monkeypatch.setattr(temp, 'COLA_LOG', 3)
+    registro = temp.Registro()
+    # Mientras se tiene su cerrojo, el hilo escritor no puede vaciar la cola,
+    # como si la salida se hubiera atascado:
+    with registro._Registro__cerrojo:
+        for i in range(5):
+            registro.escribir(temp.INFO, f'mensaje {i}', {})
+        assert registro.get_descartados() == 2
+        assert metrica('log_dropped_total') == 2
+    registro.vaciar()
+    salida = capsys.readouterr().out
+    assert [linea.split(' - ', 1)[1] for linea in salida.splitlines()] == \
+        ['mensaje 0', 'mensaje 1', 'mensaje 2']
+
+
+def test_registro_sincrono_no_descarta(monkeypatch, capsys):
+    monkeypatch.setattr(temp, 'COLA_LOG', 1)
+    registro = temp.Registro()
+    registro.set_sincrono(True)
+    for i in range(3):
+        registro.escribir(temp.INFO, f'mensaje {i}', {})
+    assert registro.get_descartados() == 0
+    assert len(capsys.readouterr().out.splitlines()) == 3
+
+
+def test_log_filtra_por_nivel(monkeypatch, capsys):
+    monkeypatch.setattr(temp, 'NIVEL_LOG', temp.WARNING)
+    temp.log('no se ve', temp.INFO)
+    temp.log('sí se ve', temp.WARNING)
+    assert capsys.readouterr().out.splitlines()[-1].endswith('[WARNING] sí se ve')
+    assert not temp.log_activo(temp.INFO)
+
+
+def test_formatos_estructurados(monkeypatch):
+    fecha = temp.get_reloj().fecha()
+    monkeypatch.setattr(temp, 'FORMATO_LOG', 'json')
+    linea = json.loads(temp.Registro.formatear(fecha, temp.WARNING, 'hola "mundo"', {'fan': 1}))
+    assert (linea['nivel'], linea['msg'], linea['fan']) == ('warning', 'hola "mundo"', 1)
+    monkeypatch.setattr(temp, 'FORMATO_LOG', 'kv')
+    linea = temp.Registro.formatear(fecha, temp.INFO, 'hola', {'fan': 1})
+    assert linea.endswith('nivel=info msg="hola" fan=1')
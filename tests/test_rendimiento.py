@@ -0,0 +1,20 @@
+import json
+import math
+
+import pytest
+
+import medir_rendimiento
+
+
+@pytest.mark.parametrize('num_gpus', [1, 4, 16])
+def test_no_se_lanzan_mas_procesos_que_en_la_referencia(num_gpus):
+    # Sólo se comparan los procesos lanzados, que no dependen de la máquina;
+    # los tiempos y la memoria se comparan con ./medir_rendimiento.py.
+    with open(medir_rendimiento.REFERENCIA) as fichero:
+        referencia = json.load(fichero)
+    resultados = {str(num_gpus): medir_rendimiento.medir(num_gpus, 60, 10)}
+    assert medir_rendimiento.comparar(resultados, referencia, {
+        'segundos_por_iteracion': math.inf,
+        'spawns_por_iteracion': 0.0,
+        'memoria_kib': math.inf,
+    }) == []
@@ -0,0 +1,94 @@
+import json
+import math
+import os
+import socket
+import stat
+
+import pytest
+
+import temp
+
+
+@pytest.mark.parametrize('peticion', [
+    {'orden': 'forzar', 'fan': 0, 'veloc': math.inf},
+    {'orden': 'forzar', 'fan': 0, 'veloc': 60, 'segundos': math.nan},
+    {'orden': 'forzar', 'fan': 0, 'veloc': 1e400},
+    {'orden': 'forzar', 'fan': '0', 'veloc': 60},
+    {'orden': 'forzar', 'fan': 0, 'veloc': True},
+    {'orden': 'forzar', 'fan': 7, 'veloc': 60},
+    {'orden': 'pausar', 'segundos': [1]},
+    {'orden': 'liberar'},
+    {'orden': 'otra'},
+])
+def test_atender_rechaza_peticiones_no_validas(montar, peticion):
+    _, manager = montar({0: [0]})
+    respuesta = temp.ServidorControl(manager).atender(peticion)
+    assert respuesta['ok'] is False
+    assert respuesta['error']
+
+
+def test_atender_fuerza_y_libera_un_ventilador(montar):
+    backend, manager = montar({0: [0]}, temperatura=40)
+    servidor = temp.ServidorControl(manager)
+    planificador = temp.Planificador(manager)
+    reloj = temp.get_reloj()
+
+    assert servidor.atender({'orden': 'forzar', 'fan': 0, 'veloc': 70, 'segundos': 60}) == {'ok': True}
+    planificador.ejecutar(reloj.ahora() + 30)
+    assert backend.get_speed(0) == 70
+
+    assert servidor.atender({'orden': 'liberar', 'fan': 0}) == {'ok': True}
+    planificador.ejecutar(reloj.ahora() + 30)
+    assert backend.get_speed(0) == temp.V_MIN
+
+
+def test_socket_de_control_solo_para_este_usuario(montar, tmp_path):
+    _, manager = montar({0: [0]})
+    ruta = str(tmp_path / 'control.sock')
+    temp.ServidorControl(manager).servir(ruta)
+    assert stat.S_IMODE(os.stat(ruta).st_mode) == 0o600
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as cliente:
+        cliente.settimeout(5)
+        cliente.connect(ruta)
+        fichero = cliente.makefile('rwb')
+        for linea in (b'{"orden": "forzar", "fan": 0, "veloc": Infinity}\n',
+                      b'[' * 30000 + b']' * 30000 + b'\n',
+                      b'{"orden": "estado"}\n'):
+            fichero.write(linea)
+            fichero.flush()
+            respuesta = json.loads(fichero.readline())
+        assert respuesta['ok'] is True
+
+
+def test_socket_de_control_rechaza_lineas_demasiado_largas(montar, tmp_path, monkeypatch):
+    monkeypatch.setattr(temp, 'PETICION_MAX', 1000)
+    _, manager = montar({0: [0]})
+    ruta = str(tmp_path / 'control.sock')
+    temp.ServidorControl(manager).servir(ruta)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as cliente:
+        cliente.settimeout(5)
+        cliente.connect(ruta)
+        fichero = cliente.makefile('rwb')
+        fichero.write(b'{"orden": "estado", "relleno": "' + b'x' * 5000 + b'"}\n')
+        fichero.flush()
+        respuesta = json.loads(fichero.readline())
+        assert respuesta['ok'] is False
+        assert '1000 bytes' in respuesta['error']
+        assert fichero.readline() == b''
+
+
+def test_auto_solo_pide_que_se_detenga_el_planificador(montar, monkeypatch):
+    backend, manager = montar({0: [0]}, temperatura=60)
+    planificador = temp.Planificador(manager)
+    reloj = temp.get_reloj()
+    planificador.ejecutar(reloj.ahora() + 60)
+    # Desde el hilo del socket no se esperan las tareas del planificador:
+    with monkeypatch.context() as m:
+        m.setattr(temp.concurrent.futures, 'wait', lambda *args: pytest.fail('espera en el socket'))
+        assert temp.ServidorControl(manager).atender({'orden': 'auto'}) == {'ok': True}
+
+    escrituras = len(backend.get_escrituras())
+    planificador.ejecutar(reloj.ahora() + 60)
+    assert len(backend.get_escrituras()) == escrituras
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+import temp
+from telemetria import LectorTelemetria
+
+
+def añadir(telemetria: temp.Telemetria, *temps: int) -> None:
+    """Añade una muestra por temperatura, con el instante igual a la temperatura."""
+    for t in temps:
+        telemetria.añadir(float(t), 0, 1, t, 40, None, t % 2 == 0)
+
+
+def test_el_historico_se_lee_mientras_se_escribe(tmp_path):
+    ruta = str(tmp_path / 'telemetria.bin')
+    telemetria = temp.Telemetria(ruta, capacidad=4)
+    lector = LectorTelemetria(ruta)
+    assert lector.get_capacidad() == 4
+    assert list(lector.registros()) == []
+    añadir(telemetria, 50, 51)
+    assert list(lector.registros()) == [(50.0, 0, 1, 50, 40, -1, temp.Telemetria.CEBANDO),
+                                        (51.0, 0, 1, 51, 40, -1, 0)]
+    telemetria.cerrar()
+
+
+def test_el_historico_es_circular(tmp_path):
+    ruta = str(tmp_path / 'telemetria.bin')
+    telemetria = temp.Telemetria(ruta, capacidad=4)
+    añadir(telemetria, *range(50, 60))
+    assert telemetria.get_escritos() == 10
+    # El hueco que se escribe a continuación no se da por bueno:
+    assert [r[3] for r in LectorTelemetria(ruta).registros()] == [57, 58, 59]
+    assert [r[3] for r in LectorTelemetria(ruta).registros(desde=58, hasta=59)] == [58]
+    telemetria.cerrar()
+
+
+def test_el_historico_continua_tras_reabrirlo(tmp_path):
+    ruta = str(tmp_path / 'telemetria.bin')
+    telemetria = temp.Telemetria(ruta, capacidad=4)
+    añadir(telemetria, 50, 51, 52)
+    telemetria.cerrar()
+    telemetria = temp.Telemetria(ruta, capacidad=4)
+    assert telemetria.get_escritos() == 3
+    añadir(telemetria, 53, 54)
+    assert [r[3] for r in LectorTelemetria(ruta).registros()] == [52, 53, 54]
+    telemetria.cerrar()
+
+    # Con otra capacidad se empieza de nuevo:
+    telemetria = temp.Telemetria(ruta, capacidad=8)
+    assert telemetria.get_escritos() == 0
+    assert os.path.getsize(ruta) == temp.Telemetria.CABECERA.size + 8 * temp.Telemetria.REGISTRO.size
+    telemetria.cerrar()
+
+
+def test_arrays_devuelve_un_array_estructurado(tmp_path):
+    pytest.importorskip('numpy')
+    ruta = str(tmp_path / 'telemetria.bin')
+    telemetria = temp.Telemetria(ruta, capacidad=4)
+    añadir(telemetria, *range(50, 56))
+    datos = LectorTelemetria(ruta).arrays(desde=54)
+    assert list(datos['temp']) == [54, 55]
+    assert list(datos['comandada']) == [-1, -1]
+    telemetria.cerrar()
+
+
+def test_no_sigue_enlaces_simbolicos(tmp_path):
+    victima = tmp_path / 'victima'
+    victima.write_text('no se debe tocar\n')
+    ruta = tmp_path / 'telemetria.bin'
+    os.symlink(victima, ruta)
+    with pytest.raises(OSError):
+        temp.Telemetria(str(ruta), capacidad=4)
+    assert victima.read_text() == 'no se debe tocar\n'
+
+
+def test_no_sobrescribe_otros_ficheros(tmp_path):
+    ruta = tmp_path / 'telemetria.bin'
+    ruta.write_text('no se debe tocar\n')
+    with pytest.raises(ValueError, match='no es un fichero de telemetría'):
+        temp.Telemetria(str(ruta), capacidad=4)
+    assert ruta.read_text() == 'no se debe tocar\n'
+
+
+def test_rechaza_lo_que_no_es_un_fichero(tmp_path):
+    ruta = str(tmp_path / 'telemetria.bin')
+    os.mkfifo(ruta, 0o600)
+    with pytest.raises(ValueError, match='fichero normal'):
+        temp.Telemetria(ruta, capacidad=4)
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason='sólo root puede crear ficheros de otro usuario')
+def test_rechaza_los_ficheros_de_otro_usuario(tmp_path):
+    ruta = tmp_path / 'telemetria.bin'
+    telemetria = temp.Telemetria(str(ruta), capacidad=4)
+    telemetria.cerrar()
+    os.chown(ruta, 12345, 12345)
+    with pytest.raises(ValueError, match='fichero normal'):
+        temp.Telemetria(str(ruta), capacidad=4)
+
+
+def test_el_bucle_guarda_la_telemetria(montar, tmp_path, monkeypatch):
+    ruta = str(tmp_path / 'telemetria.bin')
+    telemetria = temp.Telemetria(ruta, capacidad=16)
+    monkeypatch.setattr(temp, '_telemetria', telemetria)
+    backend, manager = montar({0: [0, 1]}, temperatura=60)
+    temp.Planificador(manager).ejecutar(temp.get_reloj().ahora() + 1)
+    registros = list(LectorTelemetria(ruta).registros())
+    assert [(r[1], r[2], r[3]) for r in registros] == [(0, 0, 60), (0, 1, 60)]
+    assert all(r[5] == temp.V_CEB and r[6] == temp.Telemetria.CEBANDO for r in registros)
+    telemetria.cerrar()
@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+import temp
+
+
+SALIDA = """
+2 GPUs on host:0
+
+    [0] host:0[gpu:0] (NVIDIA GeForce RTX 3090)
+
+      Has the following names:
+        GPU-0
+        GPU-3f2c1a57-0000-0000-0000-000000000000
+
+      Is connected to the following fans:
+        host:0[fan:0] (Fan 0)
+        host:0[fan:1] (Fan 1)
+
+    [1] host:0[gpu:1] (NVIDIA GeForce RTX 3060)
+
+      Has the following names:
+        GPU-1
+
+      Is connected to the following fans:
+        host:0[fan:2] (Fan 2)
+
+3 Fans on host:0
+
+    [0] host:0[fan:0] (Fan 0)
+      Is connected to the following GPU: host:0[gpu:0]
+
+    [1] host:0[fan:1] (Fan 1)
+      Is connected to the following GPU: host:0[gpu:0]
+
+    [2] host:0[fan:2] (Fan 2)
+      Is connected to the following GPU: host:0[gpu:1]
+"""
+
+
+def test_leer_topologia_asocia_cada_ventilador_con_su_gpu():
+    assert temp.leer_topologia(SALIDA) == {0: [0, 1], 1: [2]}
+
+
+def test_leer_topologia_con_una_gpu_le_da_todos_los_ventiladores():
+    salida = """
+1 GPU on host:0
+
+    [0] host:0[gpu:0] (NVIDIA GeForce GTX 1080)
+
+2 Fans on host:0
+
+    [0] host:0[fan:0] (Fan 0)
+    [1] host:0[fan:1] (Fan 1)
+"""
+    assert temp.leer_topologia(salida) == {0: [0, 1]}
+
+
+@pytest.mark.parametrize('salida', [
+    '',
+    SALIDA.replace('        host:0[fan:2] (Fan 2)\n', '', 1),
+])
+def test_leer_topologia_rechaza_salidas_incompletas(salida):
+    with pytest.raises(ValueError):
+        temp.leer_topologia(salida)
+
+
+class BackendIdentificado(temp.FakeBackend):
+    """FakeBackend con una identidad del controlador y que cuenta los descubrimientos."""
+
+    def __init__(self, fans_gpus: dict[int, int]) -> None:
+        super().__init__(fans_gpus)
+        self.identidad = {'controlador': '550.54.14', 'uuids': ['GPU-a', 'GPU-b']}
+        self.descubrimientos = 0
+
+    def get_identidad(self):
+        return self.identidad
+
+    def descubrir(self):
+        self.descubrimientos += 1
+        return super().descubrir()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """Usa una caché de la topología propia de la prueba, y devuelve su ruta."""
+    ruta = tmp_path / 'nvidia-fan-curve' / 'topologia.json'
+    monkeypatch.setattr(temp, 'TOPOLOGIA_CACHE', str(ruta))
+    return ruta
+
+
+def test_la_topologia_se_lee_de_la_cache(cache):
+    backend = BackendIdentificado({0: 0, 1: 0, 2: 1})
+    temp.set_backend(backend)
+    assert temp.obtener_topologia() == {0: [0, 1], 1: [2]}
+    assert backend.descubrimientos == 1
+    assert json.loads(cache.read_text())['identidad'] == backend.identidad
+
+    assert temp.obtener_topologia() == {0: [0, 1], 1: [2]}
+    assert backend.descubrimientos == 1
+
+
+def test_la_cache_se_invalida_si_cambia_el_controlador_o_las_gpus(cache):
+    backend = BackendIdentificado({0: 0, 1: 1})
+    temp.set_backend(backend)
+    temp.obtener_topologia()
+    backend.identidad = {**backend.identidad, 'controlador': '555.42.02'}
+    temp.obtener_topologia()
+    backend.identidad = {**backend.identidad, 'uuids': ['GPU-b', 'GPU-a']}
+    temp.obtener_topologia()
+    assert backend.descubrimientos == 3
+    temp.obtener_topologia()
+    assert backend.descubrimientos == 3
+
+
+@pytest.mark.parametrize('contenido', ['', '{"identidad": 1}', '[]', '{"identidad": null, "gpus": 3}'])
+def test_una_cache_no_valida_se_ignora(cache, contenido):
+    backend = BackendIdentificado({0: 0})
+    temp.set_backend(backend)
+    cache.parent.mkdir()
+    cache.write_text(contenido)
+    assert temp.obtener_topologia() == {0: [0]}
+    assert backend.descubrimientos == 1
+
+
+def test_sin_identidad_no_se_usa_la_cache(cache):
+    backend = BackendIdentificado({0: 0})
+    backend.identidad = None
+    temp.set_backend(backend)
+    temp.obtener_topologia()
+    temp.obtener_topologia()
+    assert backend.descubrimientos == 2
+    assert not cache.exists()